@@ -0,0 +1,212 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, sessionmaker
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import json
+import logging
+import os
+import platform
+import shutil
+import tempfile
+import time
+from ..core.config import settings
+from ..core.database import create_db_engine
+from ..core.instrumentation import RunProfiler
+from ..core.schema import ensure_schema
+from ..models.sp500 import Company, DailyPrice
+from ..models.predictions import MLPrediction
+from .synthetic import SyntheticUniverse, SyntheticFetcher
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['ingest', 'indicators', 'ml', 'backtest', 'portfolio']
+
+
+def _environment() -> dict:
+    import numpy, pandas, sklearn, sqlalchemy
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'numpy': numpy.__version__,
+        'pandas': pandas.__version__,
+        'sklearn': sklearn.__version__,
+        'sqlalchemy': sqlalchemy.__version__,
+    }
+
+
+class BenchmarkSuite:
+    """Benchmarks por stage sobre datos sintéticos en SQLite local (sin MySQL ni red)"""
+
+    def __init__(self, scales: Sequence[int] = (50, 500, 5000), days: int = 400,
+                 stages: Optional[Sequence[str]] = None, ml_limit: int = 20,
+                 seed: int = 42, workdir: Optional[str] = None, keep: bool = False):
+        unknown = set(stages or []) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Stages desconocidos: {sorted(unknown)}")
+        self.scales = list(scales)
+        self.days = days
+        self.stages = [s for s in STAGES if s in (stages or STAGES)]
+        self.ml_limit = ml_limit
+        self.seed = seed
+        self.workdir = workdir
+        self.keep = keep
+
+    # ---------- datos ----------
+
+    def _bulk_load(self, db: Session, universe: SyntheticUniverse):
+        """Carga directa (no cronometrada) cuando no se mide el ingest"""
+        companies = universe.companies()
+        db.execute(insert(Company), [{**row, 'exchange': 'SYN', 'is_active': True}
+                                     for row in companies.to_dict('records')])
+        ids = dict(db.query(Company.ticker, Company.id).all())
+        dates = [d.date() for d in universe.dates]
+        for j, ticker in enumerate(universe.tickers):
+            db.execute(insert(DailyPrice), [{
+                'company_id': ids[ticker], 'price_date': dates[i],
+                'open': float(universe.open[i, j]), 'high': float(universe.high[i, j]),
+                'low': float(universe.low[i, j]), 'close': float(universe.close[i, j]),
+                'volume': int(universe.volume[i, j]),
+            } for i in range(len(dates))])
+        db.commit()
+
+    def _seed_predictions(self, db: Session, universe: SyntheticUniverse):
+        """Predicciones sintéticas para TODO el universo (backtest/portfolio a escala)"""
+        ids = dict(db.query(Company.ticker, Company.id).all())
+        db.execute(insert(MLPrediction), universe.ml_predictions(ids))
+        db.commit()
+
+    # ---------- stages ----------
+
+    def _run_stage(self, name: str, db: Session, universe: SyntheticUniverse, root: str, scale: int):
+        if name == 'ingest':
+            from ..services.data_loader import SP500DataLoader
+            loader = SP500DataLoader(db)
+            loader.fetcher = SyntheticFetcher(universe)
+            loader.load_companies()
+            loader.load_historical_prices(days_back=self.days)
+        elif name == 'indicators':
+            from ..services.predictions import generate_trading_signals
+            generate_trading_signals(db)
+        elif name == 'ml':
+            from ..services.ml_predictor import MLPredictor
+            MLPredictor().train_all(db, limit=self.ml_limit)
+        elif name == 'backtest':
+            from ..services.backtester import Backtester
+            from ..services.backtest_store import BacktestStore
+            Backtester(store=BacktestStore(root)).backtest_top_stocks(db, limit=scale)
+        elif name == 'portfolio':
+            from ..services.portfolio_optimizer import PortfolioOptimizer
+            from ..services.risk_model import RiskModelStore
+            PortfolioOptimizer(risk_store=RiskModelStore(root)).optimize_portfolio(db)
+
+    def run_scale(self, scale: int, workdir: str) -> Dict[str, dict]:
+        logger.info(f"🧪 Escala {scale} tickers × {self.days} días")
+        universe = SyntheticUniverse(scale, self.days, seed=self.seed)
+        root = os.path.join(workdir, f"scale_{scale}")
+        os.makedirs(root, exist_ok=True)
+        engine = create_db_engine(f"sqlite:///{root}/bench.db")
+        ensure_schema(engine)
+        db = sessionmaker(bind=engine, autoflush=False)()
+        profiler = RunProfiler()
+        profiler.instrument_engine(engine)
+
+        results = {}
+        seeded = False
+        try:
+            if 'ingest' not in self.stages:
+                self._bulk_load(db, universe)
+            for name in self.stages:
+                if name != 'ingest' and not seeded:
+                    self._seed_predictions(db, universe)
+                    seeded = True
+                started, cpu0 = time.perf_counter(), time.process_time()
+                with profiler.stage(name):
+                    self._run_stage(name, db, universe, root, scale)
+                sql = profiler.report()['stages'][name]['sql']
+                results[name] = {
+                    'seconds': round(time.perf_counter() - started, 4),
+                    'cpu_s': round(time.process_time() - cpu0, 4),
+                    'queries': sql['count'],
+                    'sql_seconds': round(sql['seconds'], 4),
+                }
+                logger.info(f"   ⏱️ {name:<11} {results[name]['seconds']:8.2f}s | {sql['count']:>7} queries")
+        finally:
+            db.close()
+            engine.dispose()
+        return results
+
+    def run(self) -> dict:
+        workdir = self.workdir or tempfile.mkdtemp(prefix="sp500_bench_")
+        previous_artifacts = settings.ARTIFACTS_DIR
+        settings.ARTIFACTS_DIR = workdir
+        try:
+            results = {str(scale): self.run_scale(scale, workdir) for scale in self.scales}
+        finally:
+            settings.ARTIFACTS_DIR = previous_artifacts
+            if not self.keep and not self.workdir:
+                shutil.rmtree(workdir, ignore_errors=True)
+        return {
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'config': {'scales': self.scales, 'days': self.days, 'stages': self.stages,
+                       'ml_limit': self.ml_limit, 'seed': self.seed},
+            'environment': _environment(),
+            'results': results,
+        }
+
+
+def _benchmarks_dir() -> Path:
+    return Path(settings.REPORTS_DIR) / "benchmarks"
+
+
+def default_baseline() -> Path:
+    """Baseline por máquina (los tiempos no son comparables entre hosts): fuera del código"""
+    return _benchmarks_dir() / "baseline.json"
+
+
+def write_results(report: dict, out_dir: Optional[str] = None) -> Path:
+    out = Path(out_dir) if out_dir else _benchmarks_dir()
+    out.mkdir(parents=True, exist_ok=True)
+    payload = json.dumps(report, indent=2)
+    path = out / f"bench_{report['created_at'].replace(':', '').replace('-', '')}.json"
+    path.write_text(payload)
+    (out / "latest.json").write_text(payload)
+    logger.info(f"💾 Resultados: {path}")
+    return path
+
+
+def compare_to_baseline(report: dict, baseline_path: Optional[str] = None,
+                        tolerance: float = 0.25, min_seconds: float = 0.05) -> List[str]:
+    """Regresiones (tiempo > baseline × (1 + tolerance) y por encima del ruido) -> lista vacía si OK.
+    Sin baseline, o sin ningún (escala, stage) en común con él, no hay nada que garantizar:
+    FileNotFoundError / ValueError en vez de dar por bueno el resultado."""
+    path = Path(baseline_path) if baseline_path else default_baseline()
+    if not path.exists():
+        raise FileNotFoundError(f"Sin baseline en {path} (créalo con --update-baseline)")
+
+    baseline = json.loads(path.read_text())['results']
+    regressions, compared = [], 0
+    for scale, stages in report['results'].items():
+        for name, now in stages.items():
+            base = baseline.get(scale, {}).get(name)
+            if base is None:
+                logger.warning(f"⚠️ {scale}/{name}: sin referencia en el baseline")
+                continue
+            compared += 1
+            ratio = now['seconds'] / base['seconds'] if base['seconds'] > 0 else float('inf')
+            slower = now['seconds'] - base['seconds'] > min_seconds and ratio > 1 + tolerance
+            mark = "❌" if slower else "✅"
+            logger.info(f"{mark} {scale:>5} {name:<11} {base['seconds']:8.2f}s -> {now['seconds']:8.2f}s ({ratio:5.2f}x)")
+            if slower:
+                regressions.append(f"{scale}/{name}: {base['seconds']:.2f}s -> {now['seconds']:.2f}s ({ratio:.2f}x)")
+    if not compared:
+        raise ValueError(f"Ninguna escala/stage en común con el baseline {path}")
+    return regressions
+
+
+def update_baseline(report: dict, baseline_path: Optional[str] = None):
+    path = Path(baseline_path) if baseline_path else default_baseline()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(report, indent=2))
+    logger.info(f"📌 Baseline actualizado: {path}")
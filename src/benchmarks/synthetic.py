@@ -0,0 +1,111 @@
+import pandas as pd
+import numpy as np
+from datetime import date
+from typing import Dict, List, Optional
+import zlib
+
+SECTORS = ['Information Technology', 'Health Care', 'Financials', 'Consumer Discretionary',
+           'Communication Services', 'Industrials', 'Consumer Staples', 'Energy',
+           'Utilities', 'Real Estate', 'Materials']
+
+
+class SyntheticUniverse:
+    """N tickers × M días hábiles de OHLCV determinista (random walk geométrico, como _nasdaq_csv)"""
+
+    def __init__(self, n_tickers: int, n_days: int, end: Optional[date] = None, seed: int = 42):
+        self.tickers = [f"SYN{i:04d}" for i in range(n_tickers)]
+        self.column = {t: j for j, t in enumerate(self.tickers)}
+        self.dates = pd.bdate_range(end=pd.Timestamp(end or date.today()), periods=n_days)
+        self.seed = seed
+
+        rng = np.random.default_rng(seed)
+        base = rng.uniform(50, 300, n_tickers)
+        # Factor de mercado + idiosincrático para que las correlaciones no sean triviales
+        market = rng.normal(0.0003, 0.01, n_days)
+        returns = market[:, None] * rng.uniform(0.5, 1.5, n_tickers) + rng.normal(0, 0.015, (n_days, n_tickers))
+        self.close = base * np.exp(np.cumsum(returns, axis=0))
+        self.open = self.close * rng.uniform(0.98, 1.02, (n_days, n_tickers))
+        self.high = np.maximum(self.open, self.close) * rng.uniform(1.0, 1.02, (n_days, n_tickers))
+        self.low = np.minimum(self.open, self.close) * rng.uniform(0.98, 1.0, (n_days, n_tickers))
+        self.volume = rng.integers(1_000_000, 50_000_000, (n_days, n_tickers))
+
+    def companies(self) -> pd.DataFrame:
+        """Mismo formato que MultiSourceFetcher.get_sp500_list"""
+        return pd.DataFrame({
+            'ticker': self.tickers,
+            'name': [f"Synthetic {t}" for t in self.tickers],
+            'sector': [SECTORS[zlib.crc32(t.encode()) % len(SECTORS)] for t in self.tickers],
+            'industry': 'Synthetic',
+        })
+
+    def ohlcv(self, ticker: str, days_back: Optional[int] = None) -> pd.DataFrame:
+        """Mismo formato que las fuentes del fetcher (Open/High/Low/Close/Volume, índice fecha)"""
+        j = self.column[ticker]
+        rows = slice(-days_back, None) if days_back else slice(None)
+        return pd.DataFrame({
+            'Open': self.open[rows, j],
+            'High': self.high[rows, j],
+            'Low': self.low[rows, j],
+            'Close': self.close[rows, j],
+            'Volume': self.volume[rows, j],
+        }, index=self.dates[rows])
+
+    def intraday(self, ticker: str, interval_min: int = 5, days_back: int = 5) -> pd.DataFrame:
+        """Barras intradía (sesión 9:30-16:00 ET) que terminan en el close diario de cada día"""
+        j = self.column[ticker]
+        per_day = 390 // interval_min
+        rng = np.random.default_rng(self.seed + j)
+        frames = []
+        for i in range(max(len(self.dates) - days_back, 1), len(self.dates)):
+            steps = rng.normal(0, 0.001, per_day)
+            path = self.close[i - 1, j] * np.exp(np.cumsum(steps))
+            path *= np.linspace(1, self.close[i, j] / path[-1], per_day)
+            opens = np.concatenate([[self.close[i - 1, j]], path[:-1]])
+            index = pd.date_range(self.dates[i] + pd.Timedelta(hours=9, minutes=30), periods=per_day,
+                                  freq=f"{interval_min}min", tz="America/New_York")
+            frames.append(pd.DataFrame({
+                'Open': opens,
+                'High': np.maximum(opens, path) * (1 + rng.uniform(0, 0.0005, per_day)),
+                'Low': np.minimum(opens, path) * (1 - rng.uniform(0, 0.0005, per_day)),
+                'Close': path,
+                'Volume': rng.integers(1_000, 200_000, per_day),
+            }, index=index))
+        return pd.concat(frames) if frames else pd.DataFrame()
+
+    def ml_predictions(self, company_ids: Dict[str, int], days: int = 300) -> List[dict]:
+        """Predicciones ML sintéticas (oráculo ruidoso) para backtest/portfolio a escala"""
+        rng = np.random.default_rng(self.seed + 1)
+        n_days = min(days, len(self.dates) - 1)
+        rows = []
+        for j, ticker in enumerate(self.tickers):
+            t = np.arange(len(self.dates) - n_days - 1, len(self.dates) - 1)
+            nxt = self.close[t + 1, j]
+            pred = nxt * (1 + rng.normal(0, 0.01, n_days))
+            score = np.clip(0.5 + 5 * (pred / self.close[t, j] - 1) + rng.normal(0, 0.1, n_days), 0, 1)
+            for k, i in enumerate(t):
+                rows.append({
+                    'company_id': company_ids[ticker],
+                    'prediction_date': self.dates[i].date(),
+                    'pred_price_1d': float(pred[k]),
+                    'confidence_1d': 0.6,
+                    'ml_score': float(round(score[k], 3)),
+                })
+        return rows
+
+
+class SyntheticFetcher:
+    """Sustituto de MultiSourceFetcher sin red (para SP500DataLoader)"""
+
+    def __init__(self, universe: SyntheticUniverse):
+        self.universe = universe
+        self.source_success = {}
+
+    def get_sp500_list(self) -> pd.DataFrame:
+        return self.universe.companies()
+
+    def download_historical_data(self, tickers: List[str], days_back: int = 365) -> Dict[str, pd.DataFrame]:
+        return {t: self.universe.ohlcv(t, days_back) for t in tickers if t in self.universe.column}
+
+    def download_intraday(self, tickers: List[str], interval: str = '5m', days_back: int = 5) -> Dict[str, pd.DataFrame]:
+        minutes = int(interval.rstrip('m'))
+        return {t: self.universe.intraday(t, minutes, days_back) for t in tickers if t in self.universe.column}
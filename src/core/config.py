@@ -9,9 +9,23 @@ class Settings:
     DB_USER: str = os.getenv("DB_USER", "root")
     DB_PASS: str = os.getenv("DB_PASS", "toor")
     DB_NAME: str = os.getenv("DB_NAME", "sp500_data")
+    # Backend: "mysql" (servidor) o "sqlite" (embebido, WAL; una sola máquina)
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "mysql")
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", "data/sp500.db")
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    ARTIFACTS_DIR: str = os.getenv("ARTIFACTS_DIR", "data/artifacts")
+    REPORTS_DIR: str = os.getenv("REPORTS_DIR", "data/reports")
+    DAEMON_SOCKET: str = os.getenv("DAEMON_SOCKET", "data/sp500d.sock")
+    PRICE_ARCHIVE_DIR: str = os.getenv("PRICE_ARCHIVE_DIR", "data/archive/prices")
+    PRICE_ARCHIVE_DAYS: int = int(os.getenv("PRICE_ARCHIVE_DAYS", "1095"))
+    PROFILE_MEMORY: bool = os.getenv("PROFILE_MEMORY", "0") == "1"  # tracemalloc: ralentiza pandas/sklearn
     
     @property
     def database_url(self) -> str:
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
+        if self.DB_BACKEND == "sqlite":
+            return f"sqlite:///{self.SQLITE_PATH}"
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
 settings = Settings()
@@ -1,15 +1,45 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from .config import settings
 from typing import Generator
+import os
 
-engine = create_engine(
-    settings.database_url,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-    echo=False
-)
+# WAL: lectores concurrentes con un escritor; NORMAL es seguro en WAL (solo el último
+# commit puede perderse ante un corte de luz, nunca se corrompe la base)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'foreign_keys': 'ON',
+    'busy_timeout': 30000,
+    'cache_size': -65536,       # 64 MB
+    'temp_store': 'MEMORY',
+    'mmap_size': 268435456,     # 256 MB
+}
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def create_db_engine(url: str) -> Engine:
+    """Engine para MySQL o SQLite embebido (WAL + pragmas en cada conexión)"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite':
+        return create_engine(url, pool_pre_ping=True, pool_recycle=3600, echo=False)
+    if parsed.database and parsed.database != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(parsed.database)), exist_ok=True)
+    sqlite_engine = create_engine(url, echo=False,
+                                  connect_args={'check_same_thread': False, 'timeout': 30})
+    event.listen(sqlite_engine, 'connect', _sqlite_pragmas)
+    return sqlite_engine
+
+
+engine = create_db_engine(settings.database_url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
@@ -0,0 +1,209 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from contextlib import contextmanager
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+import os
+import re
+import threading
+import time
+import tracemalloc
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _new_counter():
+    return {'count': 0, 'seconds': 0.0, 'rows': 0}
+
+
+class RunProfiler:
+    """Timings por stage/ticker, contadores SQL (event hooks), HTTP por fuente y memoria pico"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._engines = []
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.utcnow()
+            self._t0 = time.perf_counter()
+            self._cpu0 = time.process_time()
+            self.stages = {}
+            self.tickers = defaultdict(dict)
+            self.sql_by_stage = defaultdict(_new_counter)
+            self.sql_by_statement = defaultdict(_new_counter)
+            self.http = defaultdict(lambda: {'ok': 0, 'error': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+
+    # ---------- contexto ----------
+
+    @property
+    def current_stage(self) -> str:
+        return getattr(self._local, 'stage', None) or 'main'
+
+    @contextmanager
+    def stage(self, name: str):
+        """Wall + CPU (del thread) de un stage; las queries del thread se le atribuyen"""
+        previous = getattr(self._local, 'stage', None)
+        self._local.stage = name
+        wall0, cpu0 = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall0, time.thread_time() - cpu0
+            with self._lock:
+                entry = self.stages.setdefault(name, {'wall_s': 0.0, 'cpu_s': 0.0, 'runs': 0})
+                entry['wall_s'] += wall
+                entry['cpu_s'] += cpu
+                entry['runs'] += 1
+            self._local.stage = previous
+
+    @contextmanager
+    def ticker(self, ticker: str):
+        """Tiempo por ticker dentro del stage actual"""
+        stage = self.current_stage
+        wall0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - wall0
+            with self._lock:
+                self.tickers[stage][ticker] = self.tickers[stage].get(ticker, 0.0) + elapsed
+
+    # ---------- SQL ----------
+
+    def instrument_engine(self, engine: Engine):
+        """Registra hooks before/after_cursor_execute (idempotente)"""
+        if engine in self._engines:
+            return
+        self._engines.append(engine)
+        event.listen(engine, "before_cursor_execute", self._before_execute)
+        event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        rows = cursor.rowcount if cursor.rowcount and cursor.rowcount > 0 else 0
+        key = _WHITESPACE.sub(" ", statement).strip()[:120]
+        with self._lock:
+            for counter in (self.sql_by_stage[self.current_stage], self.sql_by_statement[key]):
+                counter['count'] += 1
+                counter['seconds'] += elapsed
+                counter['rows'] += rows
+
+    # ---------- HTTP ----------
+
+    def record_http(self, source: str, seconds: float, ok: bool):
+        with self._lock:
+            entry = self.http[source]
+            entry['ok' if ok else 'error'] += 1
+            entry['seconds'] += seconds
+            entry['max_seconds'] = max(entry['max_seconds'], seconds)
+
+    # ---------- memoria ----------
+
+    def start_memory_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    # ---------- reportes ----------
+
+    def report(self, mode: Optional[str] = None) -> dict:
+        with self._lock:
+            stages = {}
+            for name in set(self.stages) | set(self.sql_by_stage) | set(self.tickers):
+                timings = self.tickers.get(name, {})
+                slowest = sorted(timings.items(), key=lambda kv: kv[1], reverse=True)[:10]
+                stages[name] = {
+                    **{k: round(v, 4) for k, v in self.stages.get(name, {}).items()},
+                    'sql': dict(self.sql_by_stage.get(name, _new_counter())),
+                    'tickers': {
+                        'count': len(timings),
+                        'total_s': round(sum(timings.values()), 4),
+                        'max_s': round(max(timings.values(), default=0.0), 4),
+                        'slowest': [[t, round(s, 4)] for t, s in slowest],
+                    },
+                }
+            statements = sorted(self.sql_by_statement.items(), key=lambda kv: kv[1]['seconds'], reverse=True)
+            return {
+                'mode': mode,
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'wall_s': round(time.perf_counter() - self._t0, 4),
+                'cpu_s': round(time.process_time() - self._cpu0, 4),
+                'peak_memory_bytes': tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+                'stages': stages,
+                'top_statements': [{'statement': k, **v} for k, v in statements[:20]],
+                'http': {k: dict(v) for k, v in self.http.items()},
+            }
+
+    @staticmethod
+    def to_prometheus(report: dict) -> str:
+        """Formato texto de Prometheus (textfile collector)"""
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f"# HELP sp500_{name} {help_text}")
+            lines.append(f"# TYPE sp500_{name} gauge")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"sp500_{name}{{{label_str}}} {value}" if label_str else f"sp500_{name} {value}")
+
+        stages = report['stages']
+        metric('run_wall_seconds', 'Duración total del run', [({}, report['wall_s'])])
+        metric('run_cpu_seconds', 'CPU total del proceso', [({}, report['cpu_s'])])
+        metric('peak_memory_bytes', 'Memoria pico (tracemalloc)', [({}, report['peak_memory_bytes'])])
+        metric('stage_wall_seconds', 'Wall time por stage',
+               [({'stage': s}, v.get('wall_s')) for s, v in stages.items()])
+        metric('stage_cpu_seconds', 'CPU time por stage',
+               [({'stage': s}, v.get('cpu_s')) for s, v in stages.items()])
+        metric('stage_tickers', 'Tickers procesados por stage',
+               [({'stage': s}, v['tickers']['count']) for s, v in stages.items()])
+        metric('stage_ticker_max_seconds', 'Ticker más lento por stage',
+               [({'stage': s}, v['tickers']['max_s']) for s, v in stages.items()])
+        metric('sql_queries', 'Queries SQL por stage',
+               [({'stage': s}, v['sql']['count']) for s, v in stages.items()])
+        metric('sql_seconds', 'Tiempo en SQL por stage',
+               [({'stage': s}, round(v['sql']['seconds'], 6)) for s, v in stages.items()])
+        metric('sql_rows', 'Filas afectadas/devueltas (rowcount) por stage',
+               [({'stage': s}, v['sql']['rows']) for s, v in stages.items()])
+        metric('http_requests', 'Requests HTTP por fuente',
+               [({'source': s, 'status': st}, v[st]) for s, v in report['http'].items() for st in ('ok', 'error')])
+        metric('http_seconds', 'Latencia acumulada HTTP por fuente',
+               [({'source': s}, round(v['seconds'], 6)) for s, v in report['http'].items()])
+        metric('http_max_seconds', 'Latencia máxima HTTP por fuente',
+               [({'source': s}, round(v['max_seconds'], 6)) for s, v in report['http'].items()])
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, mode: Optional[str] = None, directory: Optional[str] = None) -> dict:
+        """JSON del run + latest.json + metrics.prom (escritura atómica)"""
+        report = self.report(mode)
+        out = Path(directory or settings.REPORTS_DIR)
+        out.mkdir(parents=True, exist_ok=True)
+        stamp = self.started_at.strftime('%Y%m%dT%H%M%S')
+
+        payload = json.dumps(report, indent=2, default=str)
+        (out / f"run_{stamp}_{mode or 'run'}.json").write_text(payload)
+        for name, content in (("latest.json", payload), ("metrics.prom", self.to_prometheus(report))):
+            tmp = out / f".{name}.tmp"
+            tmp.write_text(content)
+            os.replace(tmp, out / name)
+
+        sql_total = sum(v['sql']['count'] for v in report['stages'].values())
+        logger.info(f"⏱️ Run {report['wall_s']:.1f}s | CPU {report['cpu_s']:.1f}s | {sql_total} queries | "
+                    f"reporte en {out}")
+        return report
+
+
+profiler = RunProfiler()
@@ -0,0 +1,103 @@
+from sqlalchemy import text, inspect, UniqueConstraint
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+import hashlib
+import logging
+from .database import Base, engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+_checked = set()
+
+
+# Súbela cuando cambie la lógica de migración: fuerza a revisar bases ya marcadas al día
+SCHEMA_REVISION = 2
+
+
+def add_missing_columns(engine: Engine) -> dict:
+    """Compara columnas declaradas con las reales (create_all no hace ALTER) y añade las que
+    faltan; una columna NOT NULL sin DEFAULT no se puede añadir a filas existentes -> error"""
+    inspector = inspect(engine)
+    missing = {}
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        live = {c['name'] for c in inspector.get_columns(table.name)}
+        columns = [c for c in table.columns if c.name not in live]
+        if columns:
+            missing[table.name] = columns
+
+    blocking = [f"{t}.{c.name}" for t, cols in missing.items() for c in cols
+                if c.primary_key or (not c.nullable and c.server_default is None)]
+    if blocking:
+        raise RuntimeError(f"Columnas NOT NULL sin DEFAULT no migrables automáticamente: "
+                           f"{', '.join(blocking)} (migrar a mano)")
+
+    added = {}
+    with engine.begin() as conn:
+        for table_name, columns in missing.items():
+            for column in columns:
+                ddl = column.type.compile(dialect=engine.dialect)
+                default = ""
+                if column.server_default is not None:
+                    arg = column.server_default.arg
+                    default = " DEFAULT " + (f"'{arg}'" if isinstance(arg, str) else
+                                             str(arg.compile(dialect=engine.dialect)))
+                null = " NULL" if column.nullable else " NOT NULL"
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column.name} {ddl}{default}{null}"))
+                added.setdefault(table_name, []).append(column.name)
+                logger.info(f"🔧 {table_name}: columna {column.name} {ddl} añadida")
+    return added
+
+
+def schema_fingerprint() -> str:
+    """Hash estable de tablas/columnas/índices declarados en los modelos"""
+    from .. import models  # noqa: F401  (registra todos los modelos en Base.metadata)
+    parts = []
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(f"{c.name}:{c.type}:{c.nullable}:{c.primary_key}" for c in table.columns)
+        parts.extend(sorted(f"ix:{ix.name}:{ix.unique}" for ix in table.indexes))
+        parts.extend(sorted(f"uq:{','.join(c.name for c in uc.columns)}"
+                            for uc in table.constraints if isinstance(uc, UniqueConstraint)))
+    parts.append(f"rev:{SCHEMA_REVISION}")
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+def ensure_schema(engine: Engine = default_engine, force: bool = False) -> bool:
+    """1 query contra schema_version; create_all solo si la huella cambió -> True si migró"""
+    url = str(engine.url)
+    if url in _checked and not force:
+        return False
+
+    fingerprint = schema_fingerprint()
+    if not force:
+        try:
+            with engine.connect() as conn:
+                stored = conn.execute(text("SELECT fingerprint FROM schema_version WHERE id = 1")).scalar()
+            if stored == fingerprint:
+                _checked.add(url)
+                return False
+        except SQLAlchemyError:
+            pass  # Tabla aún no existe
+
+    logger.info("📊 Esquema desactualizado: creando tablas...")
+    Base.metadata.create_all(bind=engine)
+    # ...ni añade columnas a tablas existentes: sin esto la huella se marcaría como aplicada
+    # con columnas ausentes (falla antes de actualizar schema_version si no se puede)
+    add_missing_columns(engine)
+    # create_all no toca tablas existentes: añade los índices nuevos
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        updated = conn.execute(text(
+            "UPDATE schema_version SET fingerprint = :fp, applied_at = CURRENT_TIMESTAMP WHERE id = 1"
+        ), {'fp': fingerprint}).rowcount
+        if not updated:
+            conn.execute(text(
+                "INSERT INTO schema_version (id, fingerprint, applied_at) VALUES (1, :fp, CURRENT_TIMESTAMP)"
+            ), {'fp': fingerprint})
+    _checked.add(url)
+    logger.info(f"✅ Esquema v{fingerprint[:12]}")
+    return True
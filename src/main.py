@@ -1,10 +1,13 @@
+import time
+_STARTED = time.perf_counter()
+
+import argparse
 import logging
 import sys
 import traceback
-from .core.database import get_db, engine, Base
-from .models.sp500 import Company, DailyPrice
-from .services.data_loader import SP500DataLoader
-from sqlalchemy import text
+from .core.database import get_db, engine
+from .core.config import settings
+from .core.instrumentation import profiler
 
 logging.basicConfig(
     level=logging.INFO,
@@ -12,90 +15,355 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def create_all_tables():
-    """Crea TODAS las tablas"""
-    logger.info("📊 Creando esquema completo...")
-    Base.metadata.create_all(bind=engine)
-    logger.info("✅ Tablas creadas")
-
-def main(mode: str = "incremental"):
-    """incremental | full | ml_train"""
-    create_all_tables()
-    
-    db = next(get_db())
+# ---------- comandos (imports pesados dentro de cada uno) ----------
+
+def cmd_full(db, args):
+    logger.info("🔥 MODO FULL: Carga 5 años")
+    from .services.data_loader import SP500DataLoader
     loader = SP500DataLoader(db)
-    
-    try:
-        logger.info("🏢 Actualizando empresas S&P500...")
-        loader.load_companies()
-        
-        if mode == "full":
-            logger.info("🔥 MODO FULL: Carga 5 años")
-            loader.load_historical_prices(days_back=1825)
-            
-        elif mode == "incremental":
-            logger.info("🔄 MODO INCREMENTAL: 7 días nuevos")
-            loader.load_historical_prices_incremental(days_back=7)
-            
-        elif mode == "ml_train":
-            logger.info("🤖 MODO ML: Entrenar predicciones")
-            from .services.ml_predictor import MLPredictor
-            predictor = MLPredictor()
-            
-            companies = db.query(Company.id).join(
-                DailyPrice, Company.id == DailyPrice.company_id
-            ).group_by(Company.id).limit(20).all()
-            
-            for company_row in companies:
-                company_id = company_row[0]
-                predictor.train_predict(db, company_id)
-            
-            logger.info("✅ ML entrenado!")
-
-        elif mode == "backtest":
-            logger.info("📊 MODO BACKTEST: Validar estrategia histórica")
-            from .services.backtester import Backtester
-            bt = Backtester()
-            results = bt.backtest_top_stocks(db, limit=20)
-            logger.info(f"✅ Backtest completado: {len(results)} empresas analizadas")
-
-        elif mode == "portfolio":
-            logger.info("💼 MODO PORTFOLIO: Kelly + Sharpe Optimizer")
-            from .services.portfolio_optimizer import PortfolioOptimizer
-            optimizer = PortfolioOptimizer()
-            recommendations = optimizer.optimize_portfolio(db, top_signals=20)
-            if recommendations:
-                logger.info(f"✅ Portfolio optimizado: {len(recommendations)} posiciones")
-            else:
-                logger.warning("⚠️ Sin datos suficientes para portfolio")
-
-                    
-        else:
-            logger.error(f"❌ Modo inválido: {mode}")
+    logger.info("🏢 Actualizando empresas S&P500...")
+    loader.load_companies()
+    loader.load_historical_prices_checkpointed(days_back=1825)
+
+def cmd_incremental(db, args):
+    logger.info("🔄 MODO INCREMENTAL: 7 días nuevos")
+    from .services.data_loader import SP500DataLoader
+    from .services.risk_model import RiskModelStore
+    loader = SP500DataLoader(db)
+    logger.info("🏢 Actualizando empresas S&P500...")
+    loader.load_companies()
+    loader.load_historical_prices_incremental(days_back=7)
+    RiskModelStore().update(db)
+
+def cmd_ml_train(db, args):
+    logger.info("🤖 MODO ML: Entrenar predicciones")
+    from .services.ml_predictor import MLPredictor
+    predictor = MLPredictor()
+    predictor.train_all(db, limit=args.limit, online=args.online)
+    logger.info("✅ ML entrenado!")
+
+def cmd_backtest(db, args):
+    logger.info("📊 MODO BACKTEST: Validar estrategia histórica")
+    from .services.backtester import Backtester
+    from .services.backtest_stats import SignificanceTester
+    bt = Backtester()
+    results = bt.backtest_top_stocks(db, limit=args.limit)
+    logger.info(f"✅ Backtest completado: {len(results)} empresas analizadas")
+    SignificanceTester().run(db)
+
+def cmd_sweep(db, args):
+    logger.info("🧪 MODO SWEEP: Grid de parámetros del backtest")
+    from .services.strategy_sweep import StrategySweep
+    summary = StrategySweep().run(db, limit=args.limit)
+    logger.info(f"✅ Sweep completado: {len(summary)} combinaciones")
+
+def cmd_score(db, args):
+    logger.info("🌲 MODO SCORE: predicción con modelos compilados (sin sklearn)")
+    from .models.sp500 import Company
+    from .services.ml_predictor import MLPredictor
+    scores = MLPredictor().score_compiled(db)
+    tickers = dict(db.query(Company.id, Company.ticker).all())
+    for i, row in enumerate(scores.nlargest(args.limit, 'change_1d').itertuples(), 1):
+        print(f"{i:2d}. {tickers.get(row.company_id, row.company_id):6} ${row.price:8.2f} -> "
+              f"1d ${row.pred_price_1d:8.2f} ({row.change_1d:+.2%}) | 5d ${row.pred_price_5d:8.2f}")
+
+def cmd_tune(db, args):
+    logger.info("🎛️ MODO TUNE: hiperparámetros ML (TimeSeriesSplit + successive halving)")
+    from .services.hyperparam_search import HyperparamSearch
+    HyperparamSearch(n_jobs=args.n_jobs).run(db, limit=args.limit, per_cluster=args.per_cluster,
+                                             max_per_cluster=args.max_per_cluster)
+
+def cmd_portfolio_backtest(db, args):
+    logger.info("💼 MODO PORTFOLIO BACKTEST: Replay de recomendaciones")
+    from .services.portfolio_backtester import PortfolioBacktester
+    result = PortfolioBacktester().run(db, days_back=args.days_back)
+    if result:
+        logger.info(f"✅ Portfolio backtest: {result['total_return']:+.1f}% | Sharpe {result['sharpe']:.2f}")
+
+def cmd_portfolio(db, args):
+    logger.info("💼 MODO PORTFOLIO: Kelly + Sharpe Optimizer")
+    from .services.portfolio_optimizer import PortfolioOptimizer
+    recommendations = PortfolioOptimizer().optimize_portfolio(db, top_signals=args.limit)
+    if recommendations:
+        logger.info(f"✅ Portfolio optimizado: {len(recommendations)} posiciones")
+    else:
+        logger.warning("⚠️ Sin datos suficientes para portfolio")
+
+def cmd_correlations(db, args):
+    logger.info("🔗 MODO CORRELACIONES: Clusters + índice top-K")
+    import pandas as pd
+    from .services.correlation import CorrelationEngine
+    data = CorrelationEngine().get(db)
+    if data:
+        sizes = pd.Series(data['labels']).value_counts()
+        logger.info(f"✅ {len(data['tickers'])} empresas en {len(sizes)} clusters "
+                    f"(mayor: {sizes.iloc[0]} empresas)")
+
+def cmd_intraday(db, args):
+    logger.info(f"⏱️ MODO INTRADÍA: barras {args.interval} ({args.days_back} días)")
+    from .services.intraday import IntradayLoader, INTERVALS, intraday_indicators
+    summary = IntradayLoader(db).load(interval=args.interval, days_back=args.days_back)
+    if summary['rows']:
+        intraday_indicators(db, interval_min=INTERVALS[args.interval], days_back=args.days_back)
+
+def cmd_archive(db, args):
+    logger.info("🧊 MODO ARCHIVO: precios antiguos -> ficheros columnares por año")
+    from .services.price_archive import PriceArchive
+    PriceArchive(horizon_days=args.horizon_days).run(db, compact=args.compact)
+
+def cmd_signals(db, args):
+    """Top señales (solo lectura, arranque rápido)"""
+    from .services.predictions import get_top_signals
+    for i, (signal, company) in enumerate(get_top_signals(db, limit=args.limit), 1):
+        print(f"{i:2d}. {company.ticker:6} {signal.action:4} score:{signal.score:.3f} ({signal.signal_date})")
+
+def cmd_stats(db, args):
+    """Resumen desde table_stats; --reconcile recalcula los recuentos exactos"""
+    from .services.table_stats import reconcile
+    if args.reconcile:
+        reconcile(db)
+    log_stats(db, detail=True)
+
+def log_stats(db, detail: bool = False):
+    """Resumen en tiempo constante: lee table_stats (mantenida por los writers), sin COUNT(*)"""
+    from .services.table_stats import read_stats
+    stats = read_stats(db)  # siembra con COUNT(*) (1 vez) las tablas aún sin estadística
+
+    def count(table: str, fmt: str = "") -> str:
+        entry = stats.get(table)
+        if entry is None:
+            return "?"
+        # Nunca reconciliada: solo cuenta lo escrito desde que existe table_stats
+        return f"{entry['rows']:{fmt}}" + ("" if entry['reconciled_at'] else " (≈ sin reconciliar)")
+
+    logger.info(f"📊 ESTADO FINAL:")
+    logger.info(f"   🏢 Empresas: {count('companies')}")
+    logger.info(f"   💰 Precios: {count('prices_daily', ',')}")
+    logger.info(f"   📈 Indicadores: {count('technical_indicators')}")
+    logger.info(f"   🎯 Señales: {count('trading_signals')}")
+    logger.info(f"   🤖 ML Predicciones: {count('ml_predictions')}")
+    if detail:
+        for table, entry in stats.items():
+            logger.info(f"   {table}: {entry['min_date'] or '-'} → {entry['max_date'] or '-'} | "
+                        f"{entry['stage'] or '-'} @ {entry['updated_at']} | "
+                        f"reconciliado {entry['reconciled_at'] or 'nunca'}")
+
+# nombre -> (función, ayuda, límite por defecto, ligero)
+COMMANDS = {
+    'full': (cmd_full, "Carga histórica completa (5 años)", None, False),
+    'incremental': (cmd_incremental, "Últimos 7 días + risk model", None, False),
+    'ml_train': (cmd_ml_train, "Entrena predicciones ML", 20, False),
+    'score': (cmd_score, "Predice con los ensembles compilados", 10, False),
+    'tune': (cmd_tune, "Afina hiperparámetros ML por empresa o cluster", 20, False),
+    'backtest': (cmd_backtest, "Backtest de las top empresas + significancia", 20, False),
+    'sweep': (cmd_sweep, "Grid de parámetros del backtest", 500, False),
+    'portfolio_backtest': (cmd_portfolio_backtest, "Replay de recomendaciones", None, False),
+    'portfolio': (cmd_portfolio, "Optimizador mean-variance", 20, False),
+    'correlations': (cmd_correlations, "Clusters de correlación + top-K", None, False),
+    'intraday': (cmd_intraday, "Barras intradía (bulk) + indicadores", None, False),
+    'archive': (cmd_archive, "Archiva prices_daily fuera del horizonte", None, False),
+    'signals': (cmd_signals, "Imprime las top señales", 10, True),
+    'stats': (cmd_stats, "Estadísticas de tablas (--reconcile: recuentos exactos)", None, True),
+}
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.main", description="S&P500 analyzer")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Reporta tiempos de arranque (imports, esquema, comando)")
+    sub = parser.add_subparsers(dest='mode')
+    for name, (_, help_text, limit, _) in COMMANDS.items():
+        cmd = sub.add_parser(name, help=help_text)
+        if limit is not None:
+            cmd.add_argument('--limit', type=int, default=limit)
+        if name == 'portfolio_backtest':
+            cmd.add_argument('--days-back', type=int, default=365)
+        if name == 'ml_train':
+            cmd.add_argument('--online', action='store_true',
+                             help="Corrección incremental diaria; reentrena solo si toca o hay deriva")
+        if name == 'tune':
+            cmd.add_argument('--n-jobs', type=int, default=-1)
+            cmd.add_argument('--per-cluster', action='store_true',
+                             help="1 búsqueda por cluster de correlación, aplicada a todos sus miembros")
+            cmd.add_argument('--max-per-cluster', type=int, default=3)
+        if name == 'stats':
+            cmd.add_argument('--reconcile', action='store_true',
+                             help="Recalcula con COUNT(*) (lento en tablas grandes)")
+        if name == 'archive':
+            cmd.add_argument('--horizon-days', type=int, default=None,
+                             help=f"Por defecto PRICE_ARCHIVE_DAYS ({settings.PRICE_ARCHIVE_DAYS})")
+            cmd.add_argument('--compact', action='store_true', help="OPTIMIZE/VACUUM tras borrar")
+        if name == 'intraday':
+            cmd.add_argument('--interval', default='5m', help="1m, 2m, 5m, 15m, 30m, 60m")
+            cmd.add_argument('--days-back', type=int, default=5)
+    pipeline = sub.add_parser('full_pipeline', help="DAG ingest → indicadores/ML → backtest → portfolio")
+    pipeline.add_argument('--force', action='store_true', help="Ignora watermarks")
+    sub.add_parser('schema', help="Verifica/crea el esquema").add_argument(
+        '--force', action='store_true', help="create_all aunque la versión coincida")
+    daemon = sub.add_parser('daemon', help="Proceso residente: cierre de mercado + socket de control")
+    daemon.add_argument('--interval-minutes', type=int, default=None, help="Refresco intradía")
+    daemon.add_argument('--intraday-interval', default='5m', help="Barras del refresco intradía")
+    daemon.add_argument('--socket', default=None)
+    daemon.add_argument('--api-port', type=int, default=None, help="Embebe la API de lectura")
+    api = sub.add_parser('api', help="API HTTP/JSON de solo lectura (snapshot en memoria)")
+    api.add_argument('--host', default="127.0.0.1")
+    api.add_argument('--port', type=int, default=8050)
+    api.add_argument('--refresh-seconds', type=float, default=60.0)
+    bench = sub.add_parser('bench', help="Benchmarks sintéticos por stage (SQLite local)")
+    bench.add_argument('--scales', type=int, nargs='+', default=[50, 500, 5000])
+    bench.add_argument('--days', type=int, default=400)
+    bench.add_argument('--stages', nargs='+', default=None)
+    bench.add_argument('--ml-limit', type=int, default=20)
+    bench.add_argument('--baseline', default=None, help="Por defecto REPORTS_DIR/benchmarks/baseline.json")
+    bench.add_argument('--tolerance', type=float, default=0.25)
+    bench.add_argument('--update-baseline', action='store_true')
+    tasks = sub.add_parser('queue', help="Cola de tareas multi-nodo (encolar / estado)")
+    tasks.add_argument('action', choices=['enqueue', 'status'])
+    tasks.add_argument('--kinds', nargs='+', default=['ingest', 'train', 'backtest'])
+    tasks.add_argument('--batch', default=None, help="Clave del lote (por defecto, la fecha)")
+    tasks.add_argument('--limit', type=int, default=None, help="Primeros N tickers activos")
+    tasks.add_argument('--days-back', type=int, default=None)
+    tasks.add_argument('--priority', type=int, default=0)
+    worker = sub.add_parser('worker', help="Worker de la cola (lanzar N en N hosts)")
+    worker.add_argument('--kinds', nargs='+', default=None)
+    worker.add_argument('--worker-id', default=None)
+    worker.add_argument('--poll-seconds', type=float, default=5.0)
+    worker.add_argument('--lease-seconds', type=int, default=300)
+    worker.add_argument('--max-tasks', type=int, default=None)
+    worker.add_argument('--drain', action='store_true', help="Sale cuando no queda nada pendiente ni en curso")
+    ctl = sub.add_parser('ctl', help="Envía un comando al daemon")
+    ctl.add_argument('action', choices=['run', 'status', 'stop'])
+    ctl.add_argument('--stages', nargs='+', default=None)
+    ctl.add_argument('--force', action='store_true')
+    ctl.add_argument('--no-wait', action='store_true')
+    ctl.add_argument('--socket', default=None)
+    return parser
+
+def startup_report(marks: list):
+    """Tiempos acumulados desde el arranque del módulo + módulos pesados cargados"""
+    heavy = [m for m in ('pandas', 'numpy', 'sklearn', 'yfinance', 'requests') if m in sys.modules]
+    previous = 0.0
+    for label, at in marks:
+        logger.info(f"⏱️ {label:<10} +{(at - previous) * 1000:7.1f} ms  (total {at * 1000:7.1f} ms)")
+        previous = at
+    logger.info(f"⏱️ Módulos cargados: {len(sys.modules)} | pesados: {heavy or 'ninguno'}")
+
+def main(mode: str = "incremental", force: bool = False, argv=None):
+    """incremental | full | ml_train | backtest | portfolio | full_pipeline | signals | ..."""
+    if argv is None:
+        argv = [mode] + (['--force'] if force else [])
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.mode is None:
+        args = parser.parse_args(list(argv) + ["incremental"])
+    mode = args.mode
+    marks = [('imports', time.perf_counter() - _STARTED)]
+
+    if mode == "ctl":
+        import json
+        from .services.daemon import send_command
+        response = send_command({'cmd': args.action, 'stages': args.stages, 'force': args.force,
+                                 'wait': not args.no_wait}, socket_path=args.socket)
+        print(json.dumps(response, indent=2, default=str))
+        if not response.get('ok'):
+            sys.exit(1)
+        return
+
+    if mode == "bench":
+        from .benchmarks.suite import BenchmarkSuite, write_results, compare_to_baseline, update_baseline
+        report = BenchmarkSuite(scales=args.scales, days=args.days, stages=args.stages,
+                                ml_limit=args.ml_limit).run()
+        write_results(report)
+        if args.update_baseline:
+            update_baseline(report, args.baseline)
             return
-        
-        stats = db.execute(text("""
-            SELECT 
-                (SELECT COUNT(*) FROM companies WHERE is_active=1) as empresas,
-                (SELECT COUNT(*) FROM prices_daily) as precios,
-                COALESCE((SELECT COUNT(*) FROM technical_indicators), 0) as indicadores,
-                COALESCE((SELECT COUNT(*) FROM trading_signals), 0) as señales,
-                COALESCE((SELECT COUNT(*) FROM ml_predictions), 0) as ml_predicciones
-        """)).fetchone()
-        
-        logger.info(f"📊 ESTADO FINAL:")
-        logger.info(f"   🏢 Empresas: {stats[0]}")
-        logger.info(f"   💰 Precios: {stats[1]:,}")
-        logger.info(f"   📈 Indicadores: {stats[2]}")
-        logger.info(f"   🎯 Señales: {stats[3]}")
-        logger.info(f"   🤖 ML Predicciones: {stats[4]}")
-        
-    except Exception as e:
-        logger.error(f"❌ Error: {str(e)}")
-        traceback.print_exc()
-    finally:
-        db.close()
+        try:
+            regressions = compare_to_baseline(report, args.baseline, tolerance=args.tolerance)
+        except (FileNotFoundError, ValueError) as e:
+            logger.error(f"❌ {e}")
+            sys.exit(1)
+        if regressions:
+            logger.error(f"❌ {len(regressions)} regresiones de rendimiento:")
+            for line in regressions:
+                logger.error(f"   {line}")
+            sys.exit(1)
+        return
+
+    light = mode in ("daemon", "api", "queue", "worker") or (mode in COMMANDS and COMMANDS[mode][3])
+    if not light:
+        profiler.reset()
+        profiler.instrument_engine(engine)
+        if settings.PROFILE_MEMORY:
+            profiler.start_memory_tracing()
+
+    from .core.schema import ensure_schema
+    ensure_schema(engine, force=mode == 'schema' and args.force)
+    marks.append(('esquema', time.perf_counter() - _STARTED))
+
+    if mode == "schema":
+        pass
+
+    elif mode == "daemon":
+        from .services.daemon import PipelineDaemon
+        PipelineDaemon(socket_path=args.socket, interval_minutes=args.interval_minutes,
+                       api_port=args.api_port, intraday_interval=args.intraday_interval).serve_forever()
+
+    elif mode == "api":
+        from .services.read_api import ReadAPI
+        ReadAPI(host=args.host, port=args.port).serve_forever(refresh_seconds=args.refresh_seconds)
+
+    elif mode == "queue":
+        import json
+        from .models.sp500 import Company
+        from .services.task_queue import TaskQueue
+        queue = TaskQueue()
+        if args.action == 'enqueue':
+            db = next(get_db())
+            try:
+                query = db.query(Company.ticker).filter(Company.is_active == True).order_by(Company.ticker)
+                tickers = [t for (t,) in (query.limit(args.limit) if args.limit else query).all()]
+            finally:
+                db.close()
+            payload = {'days_back': args.days_back} if args.days_back else None
+            # Prioridad por etapa: ingest antes que train antes que backtest
+            for rank, kind in enumerate(args.kinds):
+                queue.enqueue(kind, tickers, batch=args.batch, payload=payload,
+                              priority=args.priority + len(args.kinds) - rank)
+        print(json.dumps(queue.stats(args.batch), indent=2))
+
+    elif mode == "worker":
+        from .services.task_queue import TaskQueue, TaskWorker
+        profiler.instrument_engine(engine)
+        TaskWorker(TaskQueue(lease_seconds=args.lease_seconds), worker_id=args.worker_id,
+                   kinds=args.kinds, poll_seconds=args.poll_seconds).run(
+            max_tasks=args.max_tasks, drain=args.drain)
+        profiler.write_reports(mode)
+
+    elif mode == "full_pipeline":
+        logger.info("🚀 MODO FULL PIPELINE: ingest → indicadores/ML → backtest → portfolio")
+        from .services.pipeline import PipelineRunner
+        status = PipelineRunner(force=args.force).run()
+        profiler.write_reports(mode)
+        if any(s in ('failed', 'blocked') for s in status.values()):
+            sys.exit(1)
+
+    else:
+        db = next(get_db())
+        try:
+            with profiler.stage(mode):
+                COMMANDS[mode][0](db, args)
+            if not light:
+                log_stats(db)
+        except Exception as e:
+            logger.error(f"❌ Error: {str(e)}")
+            traceback.print_exc()
+        finally:
+            db.close()
+            if not light:
+                profiler.write_reports(mode)
+
+    marks.append(('comando', time.perf_counter() - _STARTED))
+    if args.profile_startup:
+        startup_report(marks)
 
 if __name__ == "__main__":
-    mode = sys.argv[1] if len(sys.argv) > 1 else "incremental"
-    main(mode)
+    main(argv=sys.argv[1:])
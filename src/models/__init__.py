@@ -1,4 +1,6 @@
 from .sp500 import Company, DailyPrice
 from .predictions import TechnicalIndicator, TradingSignal, MLPrediction
+from .pipeline import StageWatermark, SchemaVersion, LoadJob, TaskJob, TableStat
+from .intraday import IntradayBar
 
-__all__ = ['Company', 'DailyPrice', 'TechnicalIndicator', 'TradingSignal', 'MLPrediction']
+__all__ = ['Company', 'DailyPrice', 'TechnicalIndicator', 'TradingSignal', 'MLPrediction', 'StageWatermark', 'SchemaVersion', 'LoadJob', 'TaskJob', 'TableStat', 'IntradayBar']
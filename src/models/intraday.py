@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, SmallInteger, DATETIME, Float, BigInteger
+from ..core.database import Base
+
+
+class IntradayBar(Base):
+    """Barras intradía (1m/5m/...): PK (company_id, interval_min, bar_time) = orden físico
+    de InnoDB por ticker y tiempo. En MySQL se particiona por mes sobre bar_time
+    (ver services/intraday.ensure_partitions); por eso sin FK ni id autoincremental."""
+    __tablename__ = "prices_intraday"
+
+    company_id = Column(Integer, primary_key=True, autoincrement=False)
+    interval_min = Column(SmallInteger, primary_key=True, autoincrement=False)
+    bar_time = Column(DATETIME, primary_key=True)  # inicio de la barra, UTC naive
+
+    open = Column(Float(53), nullable=True)
+    high = Column(Float(53), nullable=True)
+    low = Column(Float(53), nullable=True)
+    close = Column(Float(53), nullable=True)
+    volume = Column(BigInteger, nullable=True)
+
+    __table_args__ = (
+        {"mysql_engine": "InnoDB"},
+    )
@@ -0,0 +1,85 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DATETIME, Float, JSON, Index, UniqueConstraint
+from ..core.database import Base
+from datetime import datetime
+
+class StageWatermark(Base):
+    __tablename__ = "pipeline_watermarks"
+
+    stage = Column(String(50), primary_key=True)
+    input_watermark = Column(String(255), nullable=True)
+    last_success_at = Column(DATETIME, nullable=True)
+    last_duration_s = Column(Float, nullable=True)
+    updated_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchemaVersion(Base):
+    __tablename__ = "schema_version"
+
+    id = Column(Integer, primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    applied_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class LoadJob(Base):
+    """Checkpoint de carga histórica: 1 fila por (corrida, ticker, rango de fechas)"""
+    __tablename__ = "load_jobs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_key = Column(String(50), nullable=False)
+    ticker = Column(String(10), nullable=False)
+    start_date = Column(Date, nullable=False)
+    end_date = Column(Date, nullable=False)
+    status = Column(String(10), nullable=False, default='pending')  # pending | done | failed
+    attempts = Column(Integer, nullable=False, default=0)
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    duration_s = Column(Float, nullable=True)
+    last_error = Column(String(255), nullable=True)
+    updated_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('run_key', 'ticker', 'start_date', name='uq_load_job'),
+        Index('idx_load_job_status', 'run_key', 'status'),
+    )
+
+
+class TaskJob(Base):
+    """Cola de trabajo multi-nodo: 1 fila por (lote, tipo, ticker), reclamada con lease"""
+    __tablename__ = "task_queue"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    batch = Column(String(50), nullable=False)
+    kind = Column(String(20), nullable=False)  # ingest | train | backtest
+    ticker = Column(String(10), nullable=False)
+    payload = Column(JSON, nullable=True)
+    status = Column(String(10), nullable=False, default='pending')  # pending | running | done | failed
+    priority = Column(Integer, nullable=False, default=0)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    worker_id = Column(String(100), nullable=True)
+    available_at = Column(DATETIME, nullable=False, default=datetime.utcnow)
+    lease_until = Column(DATETIME, nullable=True)
+    duration_s = Column(Float, nullable=True)
+    last_error = Column(String(255), nullable=True)
+    created_at = Column(DATETIME, default=datetime.utcnow)
+    updated_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        UniqueConstraint('batch', 'kind', 'ticker', name='uq_task_job'),
+        Index('idx_task_claim', 'status', 'available_at'),
+        Index('idx_task_lease', 'status', 'lease_until'),
+    )
+
+
+class TableStat(Base):
+    """Estadísticas que mantienen los writers (sin COUNT(*)): company_id=0 es el agregado de
+    la tabla (filas, rango de fechas); el resto, rango de fechas por empresa (row_count NULL)"""
+    __tablename__ = "table_stats"
+
+    table_name = Column(String(50), primary_key=True)
+    company_id = Column(Integer, primary_key=True, autoincrement=False)
+    row_count = Column(BigInteger, nullable=True)
+    min_date = Column(Date, nullable=True)
+    max_date = Column(Date, nullable=True)
+    last_stage = Column(String(50), nullable=True)
+    updated_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
+    reconciled_at = Column(DATETIME, nullable=True)
@@ -68,6 +68,26 @@ class MLPrediction(Base):
     accuracy_5d = Column(DECIMAL(5,3))
     
     ml_score = Column(DECIMAL(5,3))
+    # Cambia también cuando un re-entrenamiento del mismo día sobreescribe la fila (upsert)
+    updated_at = Column(DATETIME, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_ml_company_date', 'company_id', 'prediction_date'),
+        Index('uq_ml_company_date', 'company_id', 'prediction_date', unique=True),
+        Index('idx_ml_updated', 'updated_at'),
+    )
+
+class MLHyperParams(Base):
+    """Mejores hiperparámetros por empresa (source: 'company' o 'cluster:<n>' si se afinó por cluster)"""
+    __tablename__ = "ml_hyperparams"
+
+    company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), primary_key=True)
+    params = Column(JSON, nullable=False)
+    source = Column(String(20), nullable=False, default='company')
+    cv_score = Column(DECIMAL(12,8), nullable=True)  # MSE de retornos 1d (TimeSeriesSplit)
+    n_candidates = Column(Integer, nullable=True)
+    tuned_through = Column(Date, nullable=True)
+    created_at = Column(DATETIME, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class BacktestResult(Base):
     __tablename__ = "backtest_results"
@@ -82,6 +102,8 @@ class BacktestResult(Base):
     max_drawdown = Column(DECIMAL(8,4))
     win_rate = Column(DECIMAL(5,3))
     total_trades = Column(Integer)
+    params = Column(JSON, nullable=True)
+    artifact_path = Column(String(255), nullable=True)
     created_at = Column(DATETIME, default=datetime.utcnow)
 
 class PortfolioRecommendation(Base):
@@ -92,4 +114,20 @@ class PortfolioRecommendation(Base):
     total_recommended_positions = Column(Integer)
     expected_sharpe = Column(DECIMAL(5,3))
     kelly_fraction = Column(DECIMAL(5,3))
-    recommendations = Column(JSON)
\ No newline at end of file
+    recommendations = Column(JSON)
+
+class BacktestSignificance(Base):
+    __tablename__ = "backtest_significance"
+
+    id = Column(Integer, primary_key=True)
+    backtest_result_id = Column(Integer, ForeignKey("backtest_results.id", ondelete="CASCADE"),
+                                nullable=False, unique=True)
+    n_resamples = Column(Integer)
+    block_size = Column(Integer)
+    sharpe_ci_low = Column(DECIMAL(8,4))
+    sharpe_ci_high = Column(DECIMAL(8,4))
+    return_ci_low = Column(DECIMAL(10,4))
+    return_ci_high = Column(DECIMAL(10,4))
+    sharpe_pvalue = Column(DECIMAL(6,5))
+    random_entry_pvalue = Column(DECIMAL(6,5))
+    created_at = Column(DATETIME, default=datetime.utcnow)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Date, DECIMAL, DATETIME, Boolean, BigInteger, ForeignKey
+from sqlalchemy import Column, Integer, String, Date, DECIMAL, DATETIME, Boolean, BigInteger, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from ..core.database import Base
 from sqlalchemy.sql import func
@@ -21,7 +21,7 @@ class Company(Base):
 class DailyPrice(Base):
     __tablename__ = "prices_daily"
     
-    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True, autoincrement=True)
     company_id = Column(Integer, ForeignKey("companies.id", ondelete="CASCADE"), nullable=False, index=True)
     price_date = Column(Date, nullable=False, index=True)
     
@@ -38,5 +38,6 @@ class DailyPrice(Base):
     company = relationship("Company", back_populates="prices")
     
     __table_args__ = (
+        Index('uq_price_company_date', 'company_id', 'price_date', unique=True),
         {"mysql_engine": "InnoDB"},
     )
\ No newline at end of file
@@ -0,0 +1,151 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+from ..models.sp500 import Company
+from ..models.predictions import BacktestResult, BacktestSignificance
+from .backtest_store import BacktestStore
+
+logger = logging.getLogger(__name__)
+
+
+def _block_sums(values: np.ndarray, length: int) -> np.ndarray:
+    """Suma circular de `length` valores empezando en cada posición -> (n_days,)"""
+    n_days = len(values)
+    extended = np.concatenate([values, values[:length]])
+    csum = np.concatenate([[0.0], np.cumsum(extended)])
+    return csum[length:length + n_days] - csum[:n_days]
+
+
+class SignificanceTester:
+    """Block bootstrap + Monte Carlo de entradas aleatorias sobre equity curves guardadas"""
+
+    def __init__(self, n_resamples: int = 10_000, block_size: int = 5,
+                 max_chunk_mb: int = 64, seed: int = 42,
+                 store: Optional[BacktestStore] = None):
+        self.n_resamples = n_resamples
+        self.block_size = block_size
+        self.max_chunk_mb = max_chunk_mb
+        self.seed = seed
+        self.store = store or BacktestStore()
+
+    def _chunks(self, n_blocks: int):
+        """Tamaños de chunk para acotar memoria (~4 matrices de 8 bytes vivas por chunk)"""
+        rows = max(1, int(self.max_chunk_mb * 1024**2 / (n_blocks * 8 * 4)))
+        for start in range(0, self.n_resamples, rows):
+            yield min(rows, self.n_resamples - start)
+
+    def test(self, equity: np.ndarray, exposure: np.ndarray, prices: np.ndarray) -> Optional[dict]:
+        """CIs de Sharpe/retorno y p-values (bootstrap centrado + entradas aleatorias).
+
+        El circular block bootstrap se resuelve con sumas por bloque precalculadas:
+        cada resample es (resamples × bloques) en lugar de (resamples × días).
+        """
+        returns = equity[1:] / equity[:-1] - 1
+        asset_returns = prices[1:] / prices[:-1] - 1
+        held = exposure[:-1]
+        n_days = len(returns)
+        if n_days < 10 or returns.std() == 0:
+            return None
+
+        block = min(self.block_size, n_days)
+        n_blocks = -(-n_days // block)
+        last_block = n_days - (n_blocks - 1) * block
+        sums = {name: (_block_sums(x, block), _block_sums(x, last_block))
+                for name, x in (('r', returns), ('r2', returns ** 2), ('log', np.log1p(returns)))}
+
+        observed_mean = returns.mean()
+        observed_sharpe = observed_mean / returns.std(ddof=1) * np.sqrt(252)
+
+        # Entradas aleatorias: misma secuencia de exposición desplazada circularmente.
+        # Solo hay n_days desplazamientos distintos -> se precalculan y se muestrean.
+        shift_idx = (np.arange(n_days)[None, :] - np.arange(n_days)[:, None]) % n_days
+        shift_returns = np.expm1(np.log1p(held[shift_idx] * asset_returns).sum(axis=1))
+        observed_mc_return = shift_returns[0]
+
+        rng = np.random.default_rng(self.seed)
+        sharpes, total_returns = [], []
+        null_hits = mc_hits = 0
+        for n in self._chunks(n_blocks):
+            starts = rng.integers(0, n_days, size=(n, n_blocks))
+            totals = {name: full[starts[:, :-1]].sum(axis=1) + last[starts[:, -1]]
+                      for name, (full, last) in sums.items()}
+
+            mean = totals['r'] / n_days
+            var = np.maximum(totals['r2'] - n_days * mean ** 2, 0.0) / (n_days - 1)
+            std = np.sqrt(var)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sharpe = np.where(std > 0, mean / std * np.sqrt(252), 0.0)
+                centered_sharpe = np.where(std > 0, (mean - observed_mean) / std * np.sqrt(252), 0.0)
+
+            sharpes.append(sharpe)
+            total_returns.append(np.expm1(totals['log']))
+            null_hits += int((centered_sharpe >= observed_sharpe).sum())
+
+            shifts = rng.integers(1, n_days, size=n)
+            mc_hits += int((shift_returns[shifts] >= observed_mc_return).sum())
+
+        sharpes = np.concatenate(sharpes)
+        total_returns = np.concatenate(total_returns) * 100
+
+        return {
+            'sharpe_ci_low': float(np.percentile(sharpes, 2.5)),
+            'sharpe_ci_high': float(np.percentile(sharpes, 97.5)),
+            'return_ci_low': float(np.percentile(total_returns, 2.5)),
+            'return_ci_high': float(np.percentile(total_returns, 97.5)),
+            'sharpe_pvalue': (null_hits + 1) / (self.n_resamples + 1),
+            'random_entry_pvalue': (mc_hits + 1) / (self.n_resamples + 1),
+        }
+
+    def run(self, db: Session, strategy: str = 'ML_Momentum') -> pd.DataFrame:
+        """Calcula significancia para los BacktestResult con artefacto y sin evaluar"""
+        pending = db.query(BacktestResult, Company.ticker).join(
+            Company, BacktestResult.company_id == Company.id
+        ).outerjoin(
+            BacktestSignificance, BacktestSignificance.backtest_result_id == BacktestResult.id
+        ).filter(
+            BacktestResult.strategy == strategy,
+            BacktestResult.artifact_path.isnot(None),
+            BacktestSignificance.id.is_(None)
+        ).all()
+
+        logger.info(f"🎲 Significancia: {len(pending)} backtests × {self.n_resamples:,} resamples")
+
+        rows, records = [], []
+        for result, ticker in pending:
+            try:
+                artifact = self.store.load(result)
+            except FileNotFoundError:
+                logger.warning(f"⚠️ {ticker}: artefacto no encontrado ({result.artifact_path})")
+                continue
+
+            curve = artifact['equity']
+            stats = self.test(curve['equity'].to_numpy(), curve['exposure'].to_numpy(dtype=float),
+                              curve['price'].to_numpy())
+            if stats is None:
+                continue
+
+            rows.append(BacktestSignificance(
+                backtest_result_id=result.id,
+                n_resamples=self.n_resamples,
+                block_size=self.block_size,
+                **stats
+            ))
+            records.append({'ticker': ticker, 'sharpe': float(result.sharpe_ratio), **stats})
+
+        if not rows:
+            logger.warning("⚠️ Sin backtests pendientes de significancia")
+            return pd.DataFrame()
+
+        db.add_all(rows)
+        db.commit()
+
+        df = pd.DataFrame(records).sort_values('sharpe_pvalue')
+        significant = int((df['sharpe_pvalue'] < 0.05).sum())
+        logger.info(f"🎲 {significant}/{len(df)} estrategias con Sharpe significativo (p<0.05)")
+        for _, r in df.head(5).iterrows():
+            logger.info(f"   {r['ticker']:6} Sharpe:{r['sharpe']:.2f} "
+                        f"[{r['sharpe_ci_low']:.2f}, {r['sharpe_ci_high']:.2f}] "
+                        f"p={r['sharpe_pvalue']:.4f} | random-entry p={r['random_entry_pvalue']:.4f}")
+        return df
@@ -0,0 +1,55 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Optional, Union
+import logging
+import uuid
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BacktestStore:
+    """Side store binario (.npz) con equity curve + trade log de cada backtest"""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.ARTIFACTS_DIR) / "backtests"
+
+    def save(self, key: str, dates, equity, exposure, prices, trades: pd.DataFrame) -> str:
+        """Guarda arrays comprimidos; devuelve la ruta relativa para BacktestResult.artifact_path"""
+        rel_path = f"{key}_{uuid.uuid4().hex[:8]}.npz"
+        path = self.root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        np.savez_compressed(
+            path,
+            dates=np.asarray(pd.to_datetime(dates).values, dtype='datetime64[D]'),
+            equity=np.asarray(equity, dtype=np.float64),
+            exposure=np.asarray(exposure, dtype=np.float32),
+            prices=np.asarray(prices, dtype=np.float64),
+            trade_dates=np.asarray(pd.to_datetime(trades['signal_date']).values, dtype='datetime64[D]'),
+            trade_side=np.asarray(trades['side'], dtype=np.int8),
+            trade_price=np.asarray(trades['close'], dtype=np.float64),
+            trade_score=np.asarray(trades['ml_score'], dtype=np.float32),
+        )
+        return rel_path
+
+    def load(self, result_or_path: Union[str, object]) -> dict:
+        """Equity curve + trades de un BacktestResult (o ruta) sin re-ejecutar el backtest"""
+        rel_path = getattr(result_or_path, 'artifact_path', result_or_path)
+        if not rel_path:
+            raise FileNotFoundError("BacktestResult sin artifact_path")
+
+        with np.load(self.root / rel_path) as data:
+            equity = pd.DataFrame({
+                'equity': data['equity'],
+                'exposure': data['exposure'],
+                'price': data['prices'],
+            }, index=pd.DatetimeIndex(data['dates'], name='date'))
+            trades = pd.DataFrame({
+                'date': data['trade_dates'],
+                'side': np.where(data['trade_side'] > 0, 'BUY', 'SELL'),
+                'price': data['trade_price'],
+                'ml_score': data['trade_score'],
+            })
+        return {'equity': equity, 'trades': trades}
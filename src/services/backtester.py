@@ -4,93 +4,199 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 from datetime import datetime, timedelta
 import logging
-from ..models.sp500 import Company, DailyPrice
+from typing import Optional, Sequence
+from ..core.instrumentation import profiler
+from ..models.sp500 import Company
 from ..models.predictions import MLPrediction, BacktestResult
+from .backtest_store import BacktestStore
+from .market_data import load_prices, load_ml_signals
+from .result_writer import write_rows
 
 logger = logging.getLogger(__name__)
 
+INITIAL_CAPITAL = 10000.0
+
+# Sizing: fracción del capital = fixed + score_weight * ml_score (recortada a [0, 1])
+SIZING_RULES = {
+    'all_in': (1.0, 0.0),
+    'half': (0.5, 0.0),
+    'score': (0.0, 1.0),
+}
+
+
+def simulate_strategy(prices: np.ndarray, scores: np.ndarray,
+                      buy_thresholds, sell_thresholds,
+                      size_fixed=None, size_score=None,
+                      initial_capital: float = INITIAL_CAPITAL) -> dict:
+    """Simula C combinaciones de umbrales/sizing a la vez (vectorizado sobre C)"""
+    buy_th = np.asarray(buy_thresholds, dtype=float)
+    sell_th = np.asarray(sell_thresholds, dtype=float)
+    n_combos, n_steps = len(buy_th), len(prices)
+    size_fixed = np.ones(n_combos) if size_fixed is None else np.asarray(size_fixed, dtype=float)
+    size_score = np.zeros(n_combos) if size_score is None else np.asarray(size_score, dtype=float)
+
+    cash = np.full(n_combos, initial_capital)
+    shares = np.zeros(n_combos)
+    equity = np.empty((n_combos, n_steps + 1))
+    equity[:, 0] = initial_capital
+    buys = np.zeros((n_combos, n_steps), dtype=bool)
+    sells = np.zeros((n_combos, n_steps), dtype=bool)
+    exposure = np.zeros((n_combos, n_steps))
+
+    for t in range(n_steps):
+        price, score = prices[t], scores[t]
+        flat = shares == 0
+
+        buy = flat & (score > buy_th)
+        if buy.any():
+            fraction = np.clip(size_fixed[buy] + size_score[buy] * score, 0.0, 1.0)
+            invested = cash[buy] * fraction
+            shares[buy] = invested / price
+            cash[buy] -= invested
+
+        sell = ~flat & (score < sell_th)
+        if sell.any():
+            cash[sell] += shares[sell] * price
+            shares[sell] = 0.0
+
+        buys[:, t] = buy
+        sells[:, t] = sell
+        equity[:, t + 1] = cash + shares * price
+        exposure[:, t] = shares * price / equity[:, t + 1]
+
+    return {
+        'equity': equity,
+        'cash': cash,
+        'shares': shares,
+        'buys': buys,
+        'sells': sells,
+        'exposure': exposure,
+        'initial_capital': initial_capital,
+    }
+
+
+def summarize_simulation(sim: dict, final_price: float, periods_per_year: int = 252) -> dict:
+    """Métricas (return, Sharpe, drawdown, win rate) por combinación (periods_per_year: barras/año)"""
+    equity = sim['equity']
+    initial = sim['initial_capital']
+    final_equity = sim['cash'] + sim['shares'] * final_price
+
+    if equity.shape[1] > 2:
+        returns = equity[:, 1:] / equity[:, :-1] - 1
+        std = returns.std(axis=1, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.where(std > 0, returns.mean(axis=1) / std * np.sqrt(periods_per_year), 0.0)
+    else:
+        sharpe = np.zeros(equity.shape[0])
+
+    peak = np.maximum.accumulate(equity, axis=1)
+    max_drawdown = ((peak - equity) / peak * 100).max(axis=1)
+
+    n_buys = sim['buys'].sum(axis=1)
+    n_sells = sim['sells'].sum(axis=1)
+    total_trades = n_buys + n_sells
+
+    return {
+        'total_return': (final_equity / initial - 1) * 100,
+        'sharpe': sharpe,
+        'max_drawdown': max_drawdown,
+        'win_rate': n_sells / np.maximum(1, total_trades / 2),
+        'total_trades': total_trades,
+    }
+
+
+def _result_row(result: BacktestResult) -> dict:
+    """BacktestResult sin persistir -> fila para write_rows/ResultWriter"""
+    return {c.name: getattr(result, c.name) for c in BacktestResult.__table__.columns
+            if getattr(result, c.name) is not None}
+
+
 class Backtester:
-    def run_single_stock(self, db: Session, company_id: int, days_back: int = 365):
-        """Backtest 1 empresa (ML signals)"""
+    BUY_THRESHOLD = 0.7
+    SELL_THRESHOLD = 0.3
+
+    def __init__(self, store: Optional[BacktestStore] = None):
+        self.store = store or BacktestStore()
+
+    def run_single_stock(self, db: Session, company_id: int, days_back: int = 365,
+                         buy_threshold: float = BUY_THRESHOLD,
+                         sell_threshold: float = SELL_THRESHOLD, writer=None):
+        """Backtest 1 empresa (ML signals); writer: ResultWriter opcional (escritura en lote)"""
+        outcome = self._run(db, company_id, days_back, buy_threshold, sell_threshold)
+        if outcome is None:
+            return None
+        summary, result = outcome
+        if writer is not None:
+            writer.put(BacktestResult, _result_row(result))
+        else:
+            write_rows(db, BacktestResult, [_result_row(result)])
+            db.commit()
+        return summary
+
+    def _run(self, db: Session, company_id: int, days_back: int,
+             buy_threshold: float, sell_threshold: float):
+        """Backtest sin persistir -> (resumen, BacktestResult pendiente de guardar)"""
         company = db.query(Company).get(company_id)
         if not company:
             return None
         
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=days_back)
-        
-        logger.info(f"📊 Backtest {company.ticker} ({days_back} días)...")
 
-        prices = db.query(DailyPrice).filter(
-            DailyPrice.company_id == company_id,
-            DailyPrice.price_date >= start_date
-        ).order_by(DailyPrice.price_date).all()
-        
-        if len(prices) < 50:
-            logger.warning(f"⚠️ {company.ticker}: Pocos datos")
-            return None
-        
-        df_prices = pd.DataFrame([{
-            'date': p.price_date,
-            'close': float(p.close)
-        } for p in prices if p.close])
-        df_prices.set_index('date', inplace=True)
-        
-        ml_signals = db.execute(text("""
-            SELECT prediction_date as signal_date, ml_score, pred_price_1d
-            FROM ml_predictions 
-            WHERE company_id = :company_id 
-            AND prediction_date >= :start_date
-            AND prediction_date <= :end_date
-            ORDER BY prediction_date ASC
-        """), {
-            'company_id': company_id, 
-            'start_date': start_date,
-            'end_date': end_date
-        }).fetchall()
-        
-        if not ml_signals:
-            logger.warning(f"⚠️ {company.ticker}: Sin señales ML")
+        df_prices = load_prices(db, [company_id], start_date)
+        df_signals = load_ml_signals(db, [company_id], start_date, end_date)
+        return self.evaluate(company.ticker, company_id, df_prices, df_signals,
+                             start_date, end_date, buy_threshold, sell_threshold)
+
+    def evaluate(self, ticker: str, company_id: int,
+                 df_prices: pd.DataFrame, df_signals: pd.DataFrame,
+                 start_date, end_date,
+                 buy_threshold: float = BUY_THRESHOLD,
+                 sell_threshold: float = SELL_THRESHOLD):
+        """Backtest en memoria (precios + señales ya cargados) -> (resumen, BacktestResult)"""
+        logger.info(f"📊 Backtest {ticker} ({(end_date - start_date).days} días)...")
+
+        if len(df_prices) < 50:
+            logger.warning(f"⚠️ {ticker}: Pocos datos")
             return None
 
-        portfolio_value = 10000.0
-        position_shares = 0
-        equity_curve = [10000.0]
-        trades = []
-        
-        for signal_date, ml_score, pred_price in ml_signals:
-            if signal_date not in df_prices.index:
-                continue
-                
-            current_price = df_prices.loc[signal_date, 'close']
+        df_prices = df_prices[['price_date', 'close']].rename(columns={'price_date': 'date'}).set_index('date')
 
-            if ml_score > 0.7 and position_shares == 0:
-                position_shares = portfolio_value / current_price
-                trades.append(('BUY', signal_date, current_price, ml_score))
+        if df_signals.empty:
+            logger.warning(f"⚠️ {ticker}: Sin señales ML")
+            return None
 
-            elif ml_score < 0.3 and position_shares > 0:
-                portfolio_value = position_shares * current_price
-                trades.append(('SELL', signal_date, current_price, ml_score))
-                position_shares = 0
+        df_signals = df_signals[['signal_date', 'ml_score', 'pred_price_1d']]
+        aligned = df_signals.merge(df_prices, left_on='signal_date', right_index=True, how='inner')
 
-            current_equity = portfolio_value if position_shares == 0 else position_shares * current_price
-            equity_curve.append(current_equity)
+        sim = simulate_strategy(
+            aligned['close'].to_numpy(dtype=float),
+            aligned['ml_score'].to_numpy(dtype=float),
+            buy_thresholds=[buy_threshold],
+            sell_thresholds=[sell_threshold]
+        )
+        traded = sim['buys'][0] | sim['sells'][0]
+        trades = aligned.loc[traded, ['signal_date', 'close', 'ml_score']].assign(
+            side=np.where(sim['buys'][0][traded], 1, -1)
+        )
 
         final_price = df_prices['close'].iloc[-1]
-        final_equity = portfolio_value if position_shares == 0 else position_shares * final_price
-
-        total_return_pct = ((final_equity / 10000.0) - 1) * 100
+        metrics = summarize_simulation(sim, final_price)
+        total_return_pct = metrics['total_return'][0]
+        sharpe_ratio = metrics['sharpe'][0]
+        max_drawdown = metrics['max_drawdown'][0]
+        win_rate = metrics['win_rate'][0]
 
         buy_hold_return = ((final_price / df_prices['close'].iloc[0]) - 1) * 100
 
-        returns_daily = pd.Series(equity_curve).pct_change().dropna()
-        sharpe_ratio = returns_daily.mean() / returns_daily.std() * np.sqrt(252) if returns_daily.std() > 0 else 0
-        
-        peak = pd.Series(equity_curve).cummax()
-        drawdown = (peak - equity_curve) / peak * 100
-        max_drawdown = drawdown.max()
-        
-        win_rate = len([t for t in trades if t[0] == 'SELL']) / max(1, len(trades) / 2)
+        artifact_path = self.store.save(
+            f"ML_Momentum/{ticker}_{start_date}_{end_date}",
+            dates=np.concatenate([[df_prices.index[0]], aligned['signal_date'].to_numpy()]),
+            equity=sim['equity'][0],
+            exposure=np.concatenate([[0.0], sim['exposure'][0]]),
+            prices=np.concatenate([[df_prices['close'].iloc[0]], aligned['close'].to_numpy(dtype=float)]),
+            trades=trades
+        )
 
         result = BacktestResult(
             strategy='ML_Momentum',
@@ -101,48 +207,71 @@ class Backtester:
             sharpe_ratio=float(sharpe_ratio),
             max_drawdown=float(max_drawdown),
             win_rate=float(win_rate),
-            total_trades=len(trades)
+            total_trades=len(trades),
+            artifact_path=artifact_path
         )
-        db.add(result)
-        db.commit()
-        
-        logger.info(f"📊 {company.ticker}: ML:{total_return_pct:+.1f}% | "
+
+        logger.info(f"📊 {ticker}: ML:{total_return_pct:+.1f}% | "
                    f"Buy&Hold:{buy_hold_return:+.1f}% | "
                    f"Alpha:{total_return_pct-buy_hold_return:+.1f}% | "
                    f"Sharpe:{sharpe_ratio:.2f} | Trades:{len(trades)}")
         
         return {
-            'ticker': company.ticker,
+            'ticker': ticker,
             'ml_return': total_return_pct,
             'buy_hold': buy_hold_return,
             'alpha': total_return_pct - buy_hold_return,
             'sharpe': sharpe_ratio,
             'trades': len(trades),
             'win_rate': win_rate
-        }
+        }, result
     
-    def backtest_top_stocks(self, db: Session, limit: int = 20):
+    def backtest_top_stocks(self, db: Session, limit: int = 20, days_back: int = 365):
         """Backtest TOP 20 empresas con ML"""
         logger.info(f"🚀 BACKTEST MASIVO: {limit} empresas...")
 
         companies_with_ml = db.execute(text("""
-            SELECT DISTINCT c.id 
+            SELECT c.id, c.ticker
             FROM companies c
             JOIN ml_predictions p ON c.id = p.company_id
             WHERE c.is_active = 1
+            GROUP BY c.id, c.ticker
+            ORDER BY MAX(p.ml_score) DESC, c.ticker
             LIMIT :limit
         """), {'limit': limit}).fetchall()
-        
+        ticker_by_id = {row[0]: row[1] for row in companies_with_ml}
+
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days_back)
+
+        # 2 queries set-based para TODAS las empresas, particionadas en memoria
+        df_prices = load_prices(db, list(ticker_by_id), start_date)
+        df_signals = load_ml_signals(db, list(ticker_by_id), start_date, end_date)
+        prices_by_company = dict(tuple(df_prices.groupby('company_id')))
+        signals_by_company = dict(tuple(df_signals.groupby('company_id')))
+
         results = []
-        for row in companies_with_ml:
-            result = self.run_single_stock(db, row[0])
-            if result:
-                results.append(result)
+        pending = []
+        for company_id, ticker in ticker_by_id.items():
+            with profiler.ticker(ticker):
+                outcome = self.evaluate(
+                    ticker, company_id,
+                    prices_by_company.get(company_id, df_prices.iloc[0:0]),
+                    signals_by_company.get(company_id, df_signals.iloc[0:0]),
+                    start_date, end_date
+                )
+            if outcome:
+                results.append(outcome[0])
+                pending.append(outcome[1])
         
         if not results:
             logger.warning("⚠️ Sin empresas con ML predictions")
             return []
 
+        # Un solo INSERT multi-fila (executemany) para todos los resultados
+        write_rows(db, BacktestResult, [_result_row(r) for r in pending])
+        db.commit()
+
         df_results = pd.DataFrame(results)
         avg_ml = df_results['ml_return'].mean()
         avg_bh = df_results['buy_hold'].mean()
@@ -162,3 +291,49 @@ class Backtester:
         logger.info("="*60)
         
         return results
+
+    def backtest_intraday(self, db: Session, company_ids: Sequence[int], interval_min: int = 5,
+                          days_back: int = 30, rule: Optional[str] = None,
+                          buy_threshold: float = BUY_THRESHOLD,
+                          sell_threshold: float = SELL_THRESHOLD):
+        """Backtest ML sobre barras intradía (streaming empresa a empresa, sin persistir).
+        Cada barra usa el score ML del último día ANTERIOR a su sesión (sin look-ahead)"""
+        from .intraday import iter_bars, periods_per_year
+
+        start = datetime.utcnow() - timedelta(days=days_back)
+        tickers = dict(db.query(Company.id, Company.ticker).filter(Company.id.in_(list(company_ids))).all())
+        df_signals = load_ml_signals(db, list(tickers), start.date() - timedelta(days=10))
+        signals_by_company = dict(tuple(df_signals.groupby('company_id')))
+        per_year = periods_per_year(pd.Timedelta(rule).total_seconds() / 60 if rule else interval_min)
+
+        results = []
+        for company_id, bars in iter_bars(db, list(tickers), interval_min, start, rule=rule):
+            signals = signals_by_company.get(company_id)
+            if signals is None:
+                continue
+            signal_days = pd.to_datetime(signals['signal_date']).to_numpy()
+            bar_days = pd.to_datetime(bars.index.date).to_numpy()
+            pos = np.searchsorted(signal_days, bar_days, side='left') - 1
+            valid = pos >= 0
+            if valid.sum() < 50:
+                continue
+
+            closes = bars['close'].to_numpy()[valid]
+            scores = signals['ml_score'].to_numpy(dtype=float)[pos[valid]]
+            sim = simulate_strategy(closes, scores, [buy_threshold], [sell_threshold])
+            metrics = summarize_simulation(sim, closes[-1], per_year)
+            buy_hold = (closes[-1] / closes[0] - 1) * 100
+            results.append({
+                'ticker': tickers[company_id],
+                'ml_return': metrics['total_return'][0],
+                'buy_hold': buy_hold,
+                'alpha': metrics['total_return'][0] - buy_hold,
+                'sharpe': metrics['sharpe'][0],
+                'trades': int(metrics['total_trades'][0]),
+                'win_rate': metrics['win_rate'][0],
+                'bars': len(closes),
+            })
+            logger.info(f"📊 {tickers[company_id]} [{rule or f'{interval_min}m'}]: "
+                        f"ML:{results[-1]['ml_return']:+.1f}% | Buy&Hold:{buy_hold:+.1f}% | "
+                        f"Sharpe:{results[-1]['sharpe']:.2f} | Barras:{len(closes)}")
+        return results
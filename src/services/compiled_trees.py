@@ -0,0 +1,187 @@
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+import json
+import logging
+import os
+import shutil
+from contextlib import contextmanager
+from ..core.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin bloqueo entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+ARRAYS = ['feature', 'threshold', 'left', 'right', 'value']
+
+
+def _threshold_f32(threshold: np.ndarray) -> np.ndarray:
+    """float32 redondeado hacia -inf: para x float32, x <= t32 ⟺ x <= t (exacto, como sklearn)"""
+    t32 = threshold.astype(np.float32)
+    above = t32.astype(np.float64) > threshold
+    t32[above] = np.nextafter(t32[above], np.float32(-np.inf))
+    return t32
+
+
+def compile_gbr(model, X_check=None) -> dict:
+    """GradientBoostingRegressor ajustado -> arrays planos (nodos de todos los árboles
+    concatenados, hijos con índice global, hojas apuntándose a sí mismas).
+    X_check: filas (DataFrame con las features de entrenamiento) para verificar contra predict"""
+    trees = [est[0].tree_ for est in model.estimators_]
+    sizes = np.array([t.node_count for t in trees])
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    feature, threshold, left, right, value = [], [], [], [], []
+    for tree, root in zip(trees, roots):
+        leaf = tree.children_left == -1
+        own = np.arange(root, root + tree.node_count, dtype=np.int32)
+        feature.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        threshold.append(np.where(leaf, np.inf, tree.threshold))
+        left.append(np.where(leaf, own, tree.children_left + root).astype(np.int32))
+        right.append(np.where(leaf, own, tree.children_right + root).astype(np.int32))
+        value.append(tree.value[:, 0, 0] * model.learning_rate)
+
+    init = model.init_
+    compiled = {
+        'feature': np.concatenate(feature),
+        'threshold': _threshold_f32(np.concatenate(threshold)),
+        'left': np.concatenate(left),
+        'right': np.concatenate(right),
+        'value': np.concatenate(value),
+        'roots': roots.astype(np.int32),
+        'init': 0.0 if isinstance(init, str) else float(np.ravel(init.constant_)[0]),
+        'depth': int(max(t.max_depth for t in trees)),
+        'n_features': int(model.n_features_in_),
+    }
+    if X_check is not None:
+        expected = model.predict(X_check)
+        got = predict_compiled(compiled, np.asarray(X_check, dtype=np.float64))
+        if not np.allclose(got, expected, rtol=1e-9, atol=1e-9):
+            raise ValueError(f"Ensemble compilado no coincide con predict (máx. dif "
+                             f"{np.abs(got - expected).max():.3e})")
+    return compiled
+
+
+def _traverse(arrays: dict, X32: np.ndarray, rows: np.ndarray, nodes: np.ndarray, depth: int) -> np.ndarray:
+    """Baja todos los (árbol, muestra) a la vez: `depth` pasos vectorizados -> valor de hoja"""
+    feature, threshold, left, right = (arrays[k] for k in ('feature', 'threshold', 'left', 'right'))
+    for _ in range(depth):
+        go_left = X32[rows, feature[nodes]] <= threshold[nodes]
+        nodes = np.where(go_left, left[nodes], right[nodes])
+    return arrays['value'][nodes]
+
+
+def predict_compiled(compiled: dict, X: np.ndarray) -> np.ndarray:
+    """init + Σ lr·hoja, vectorizado sobre árboles × muestras"""
+    X32 = np.asarray(X, dtype=np.float32)
+    n_samples, n_trees = len(X32), len(compiled['roots'])
+    rows = np.repeat(np.arange(n_samples), n_trees)
+    nodes = np.tile(compiled['roots'], n_samples)
+    leaves = _traverse(compiled, X32, rows, nodes, compiled['depth'])
+    return compiled['init'] + leaves.reshape(n_samples, n_trees).sum(axis=1)
+
+
+class CompiledModelStore:
+    """Todos los ensembles de MLPredictor en un único paquete de .npy memmapeables
+    (nodos concatenados) + index.json con raíces/init/profundidad por modelo."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = Path(root or settings.ARTIFACTS_DIR) / "compiled_models"
+        self.index: Dict[str, dict] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def key(company_id: int, horizon: str) -> str:
+        return f"{company_id}:{horizon}"
+
+    @contextmanager
+    def _locked(self):
+        """Exclusión entre procesos (workers de la cola exportando a la vez): sin ella dos
+        fusiones leerían el mismo paquete y la última en renombrar perdería los modelos de la otra"""
+        self.root.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.root.with_name(self.root.name + ".lock"), "w") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield
+
+    def save(self, models: Dict[int, dict]) -> int:
+        """Compila y verifica models[company_id][horizon] y reescribe el paquete (fusiona con el existente)"""
+        with self._locked():
+            return self._save(models)
+
+    def _save(self, models: Dict[int, dict]) -> int:
+        self.load()
+        compiled = {}
+        for key, meta in self.index.items():
+            start, end = meta['nodes']
+            compiled[key] = {**meta, **{k: np.asarray(self.arrays[k][start:end]) for k in ARRAYS}}
+            for k in ('left', 'right'):
+                compiled[key][k] = compiled[key][k] - start
+            compiled[key]['roots'] = np.asarray(self.arrays['roots'][meta['trees'][0]:meta['trees'][1]]) - start
+        for company_id, entry in models.items():
+            for horizon in ('1d', '5d'):
+                if horizon in entry:
+                    compiled[self.key(company_id, horizon)] = {
+                        **compile_gbr(entry[horizon], entry.get('X_check')),
+                        'trained_through': str(entry.get('trained_through')),
+                    }
+
+        parts = {k: [] for k in ARRAYS + ['roots']}
+        index, offset, tree_offset = {}, 0, 0
+        for key, c in compiled.items():
+            n_nodes, n_trees = len(c['feature']), len(c['roots'])
+            for k in ('feature', 'threshold', 'value'):
+                parts[k].append(c[k])
+            parts['left'].append(c['left'] + offset)
+            parts['right'].append(c['right'] + offset)
+            parts['roots'].append(c['roots'] + offset)
+            index[key] = {'nodes': [offset, offset + n_nodes], 'trees': [tree_offset, tree_offset + n_trees],
+                          'init': c['init'], 'depth': c['depth'], 'n_features': c['n_features'],
+                          'trained_through': c.get('trained_through')}
+            offset += n_nodes
+            tree_offset += n_trees
+
+        # Escritura a directorio temporal + rename: los lectores nunca ven un paquete a medias
+        tmp = self.root.with_name(self.root.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        for k, chunks in parts.items():
+            dtype = {'threshold': np.float32, 'value': np.float64}.get(k, np.int32)
+            np.save(tmp / f"{k}.npy", np.concatenate(chunks).astype(dtype) if chunks else np.empty(0, dtype))
+        (tmp / "index.json").write_text(json.dumps(index))
+        old = self.root.with_name(self.root.name + ".old")
+        shutil.rmtree(old, ignore_errors=True)
+        if self.root.exists():
+            os.replace(self.root, old)
+        os.replace(tmp, self.root)
+        shutil.rmtree(old, ignore_errors=True)
+
+        size = sum(f.stat().st_size for f in self.root.iterdir())
+        logger.info(f"🌲 Modelos compilados: {len(index)} ensembles, {offset:,} nodos "
+                    f"({size / 1e6:.1f} MB) -> {self.root}")
+        self.load()
+        return len(index)
+
+    def load(self) -> "CompiledModelStore":
+        """Abre el paquete con mmap (instantáneo; las páginas se leen al usarse)"""
+        if not (self.root / "index.json").exists():
+            self.index, self.arrays = {}, {}
+            return self
+        self.index = json.loads((self.root / "index.json").read_text())
+        self.arrays = {k: np.load(self.root / f"{k}.npy", mmap_mode='r') for k in ARRAYS + ['roots']}
+        return self
+
+    def predict_many(self, keys: Sequence[str], X: np.ndarray) -> np.ndarray:
+        """1 fila de X por modelo (p.ej. la última de cada ticker) -> 1 predicción por modelo,
+        con TODOS los árboles de TODOS los modelos recorridos en una sola pasada vectorizada"""
+        X32 = np.asarray(X, dtype=np.float32)
+        metas = [self.index[k] for k in keys]
+        roots = [np.asarray(self.arrays['roots'][m['trees'][0]:m['trees'][1]]) for m in metas]
+        counts = np.array([len(r) for r in roots])
+        rows = np.repeat(np.arange(len(keys)), counts)
+        leaves = _traverse(self.arrays, X32, rows, np.concatenate(roots), max(m['depth'] for m in metas))
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        return np.array([m['init'] for m in metas]) + np.add.reduceat(leaves, starts)
@@ -0,0 +1,146 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from sklearn.cluster import AgglomerativeClustering
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Tuple
+import json
+import logging
+from ..core.config import settings
+from ..models.sp500 import Company
+from .market_data import load_prices, prices_watermark
+
+logger = logging.getLogger(__name__)
+
+
+def rolling_correlations(returns: np.ndarray, window: int, step: int, max_chunk_mb: int = 256) -> np.ndarray:
+    """Correlaciones de ventanas móviles en lote -> (ventanas, N, N) vía matmul de bloques estandarizados"""
+    n_days, n_assets = returns.shape
+    ends = np.arange(n_days, window - 1, -step)[::-1]
+    per_window = window * n_assets * 8 * 2 + n_assets * n_assets * 4
+    chunk = max(1, int(max_chunk_mb * 1024**2 / per_window))
+    out = np.empty((len(ends), n_assets, n_assets), dtype=np.float32)
+
+    for start in range(0, len(ends), chunk):
+        batch_ends = ends[start:start + chunk]
+        idx = batch_ends[:, None] - window + np.arange(window)
+        blocks = returns[idx]                                   # (lote, window, N)
+        mean = np.nanmean(blocks, axis=1, keepdims=True)
+        std = np.nanstd(blocks, axis=1, ddof=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = np.nan_to_num((blocks - mean) / std)
+        out[start:start + chunk] = np.matmul(z.transpose(0, 2, 1), z) / (window - 1)
+
+    np.clip(out, -1.0, 1.0, out=out)
+    return out
+
+
+class CorrelationEngine:
+    """Correlaciones del universo + clusters jerárquicos + índice top-K (cacheado por carga de precios)"""
+
+    def __init__(self, window: int = 126, step: int = 21, n_windows: int = 6,
+                 distance_threshold: float = 0.6, top_k: int = 20, root: Optional[str] = None):
+        self.window = window
+        self.step = step
+        self.n_windows = n_windows
+        self.distance_threshold = distance_threshold
+        self.top_k = top_k
+        self.root = Path(root or settings.ARTIFACTS_DIR) / "correlation"
+        self._cache = None
+
+    def _load_cached(self, watermark: str) -> Optional[dict]:
+        if self._cache is not None and self._cache['watermark'] == watermark:
+            return self._cache
+        meta_path = self.root / "meta.json"
+        if not meta_path.exists():
+            return None
+        meta = json.loads(meta_path.read_text())
+        if meta['watermark'] != watermark:
+            return None
+        self._cache = {
+            **meta,
+            'company_ids': np.asarray(meta['company_ids']),
+            'corr': np.load(self.root / "corr.npy", mmap_mode='r'),
+            'labels': np.load(self.root / "labels.npy"),
+            'topk_idx': np.load(self.root / "topk_idx.npy", mmap_mode='r'),
+            'topk_corr': np.load(self.root / "topk_corr.npy", mmap_mode='r'),
+        }
+        return self._cache
+
+    def compute(self, db: Session, watermark: Optional[str] = None) -> Optional[dict]:
+        """Recalcula correlaciones, clusters e índice top-K y los persiste"""
+        watermark = watermark or prices_watermark(db)
+        companies = db.query(Company.id, Company.ticker).filter(Company.is_active == True).all()
+        ticker_by_id = dict(companies)
+        lookback = int((self.window + self.step * (self.n_windows - 1)) * 1.5) + 10
+        df_prices = load_prices(db, list(ticker_by_id), datetime.now().date() - timedelta(days=lookback))
+        closes = df_prices.pivot_table(index='price_date', columns='company_id', values='close').sort_index()
+        returns = closes.pct_change(fill_method=None).iloc[1:]
+        returns = returns.loc[:, returns.notna().sum() >= self.window // 2]
+        if returns.shape[1] < 2 or len(returns) < self.window:
+            logger.warning("⚠️ Correlaciones: historial insuficiente")
+            return None
+
+        windows = rolling_correlations(returns.to_numpy(), self.window, self.step)
+        corr = windows[-self.n_windows:].mean(axis=0)
+        np.fill_diagonal(corr, 1.0)
+
+        distance = np.clip(1.0 - corr.astype(np.float64), 0.0, 2.0)
+        labels = AgglomerativeClustering(
+            n_clusters=None, metric='precomputed', linkage='average',
+            distance_threshold=self.distance_threshold
+        ).fit_predict(distance)
+
+        k = min(self.top_k, corr.shape[0] - 1)
+        masked = corr.copy()
+        np.fill_diagonal(masked, -np.inf)
+        topk_idx = np.argpartition(-masked, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(masked, topk_idx, axis=1), axis=1)
+        topk_idx = np.take_along_axis(topk_idx, order, axis=1)
+        topk_corr = np.take_along_axis(corr, topk_idx, axis=1)
+
+        company_ids = returns.columns.to_numpy()
+        self.root.mkdir(parents=True, exist_ok=True)
+        np.save(self.root / "corr.npy", corr)
+        np.save(self.root / "labels.npy", labels)
+        np.save(self.root / "topk_idx.npy", topk_idx)
+        np.save(self.root / "topk_corr.npy", topk_corr)
+        (self.root / "meta.json").write_text(json.dumps({
+            'watermark': watermark,
+            'company_ids': [int(c) for c in company_ids],
+            'tickers': [ticker_by_id[c] for c in company_ids],
+            'computed_at': datetime.now().isoformat(timespec='seconds'),
+        }))
+        self._cache = None
+
+        logger.info(f"🔗 Correlaciones: {len(company_ids)} empresas, {len(windows)} ventanas de {self.window}d "
+                    f"-> {labels.max() + 1} clusters")
+        return self._load_cached(watermark)
+
+    def get(self, db: Session) -> Optional[dict]:
+        """Resultados cacheados hasta la próxima carga de precios"""
+        watermark = prices_watermark(db)
+        return self._load_cached(watermark) or self.compute(db, watermark)
+
+    def most_correlated(self, db: Session, ticker: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top-K tickers más correlacionados con `ticker` (desde el índice precalculado)"""
+        data = self.get(db)
+        if data is None or ticker not in data['tickers']:
+            return []
+        i = data['tickers'].index(ticker)
+        return [(data['tickers'][j], float(c))
+                for j, c in zip(data['topk_idx'][i][:k], data['topk_corr'][i][:k])]
+
+    def cluster_labels(self, db: Session, company_ids) -> pd.Series:
+        """Cluster por empresa (las que no tienen historial quedan en su propio bucket)"""
+        data = self.get(db)
+        labels = {} if data is None else dict(zip(data['company_ids'].tolist(), data['labels'].tolist()))
+        next_label = max(labels.values(), default=-1) + 1
+        out = {}
+        for cid in company_ids:
+            if cid not in labels:
+                labels[cid] = next_label
+                next_label += 1
+            out[cid] = labels[cid]
+        return pd.Series(out)
@@ -0,0 +1,204 @@
+from datetime import datetime, time as dt_time
+from pathlib import Path
+from typing import Callable, List, Optional
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from ..core.config import settings
+from ..core.database import SessionLocal, engine
+from ..core.instrumentation import profiler
+from .market_data import PriceCache, use_price_cache
+from .pipeline import PipelineRunner, default_stages, expected_market_date, MARKET_TZ, MARKET_CLOSE
+
+logger = logging.getLogger(__name__)
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Una línea JSON por conexión: {"cmd": "run"|"status"|"stop", ...}"""
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+            response = self.server.daemon.handle_command(request)
+        except Exception as e:
+            response = {'ok': False, 'error': str(e)}
+        self.wfile.write((json.dumps(response, default=str) + "\n").encode())
+
+
+class _ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class PipelineDaemon:
+    """Proceso residente: pool SQLAlchemy, caché de precios y modelos ML calientes.
+
+    Dispara el pipeline al cierre de mercado (y opcionalmente cada N minutos en
+    horario de mercado) o bajo demanda vía socket de control local.
+    """
+
+    def __init__(self, socket_path: Optional[str] = None, interval_minutes: Optional[int] = None,
+                 poll_seconds: float = 30.0, api_port: Optional[int] = None, intraday_interval: str = '5m'):
+        from .ml_predictor import MLPredictor
+
+        self.socket_path = Path(socket_path or settings.DAEMON_SOCKET)
+        self.interval = interval_minutes * 60 if interval_minutes else None
+        self.intraday_interval = intraday_interval
+        self.poll_seconds = poll_seconds
+        self.predictor = MLPredictor()
+        self.prices = PriceCache()
+        self.jobs: "queue.Queue[dict]" = queue.Queue()
+        self.on_run_complete: List[Callable[[dict], None]] = []
+        self.last_scheduled_date = None
+        self.last_run_at = None
+        self.last_status = {}
+        self.runs = 0
+        self._stop = threading.Event()
+        self._server = None
+        self.api = None
+        if api_port:
+            from .read_api import ReadAPI
+            self.api = ReadAPI(port=api_port)
+            self.on_run_complete.append(lambda status: self.api.refresh())
+
+    # ---------- control ----------
+
+    def handle_command(self, request: dict) -> dict:
+        cmd = request.get('cmd')
+        if cmd == 'status':
+            return {'ok': True, 'runs': self.runs, 'last_run_at': self.last_run_at,
+                    'last_status': self.last_status, 'queued': self.jobs.qsize(),
+                    'cached_prices': len(self.prices.frame), 'warm_models': len(self.predictor.models)}
+        if cmd == 'stop':
+            self._stop.set()
+            return {'ok': True}
+        if cmd == 'run':
+            job = {'only': request.get('stages'), 'force': bool(request.get('force')),
+                   'source': 'socket', 'done': threading.Event()}
+            self.jobs.put(job)
+            if not request.get('wait', True):
+                return {'ok': True, 'queued': True}
+            job['done'].wait()
+            return {'ok': job.get('error') is None, 'status': job.get('status'), 'error': job.get('error')}
+        return {'ok': False, 'error': f"comando desconocido: {cmd}"}
+
+    def _start_control_socket(self):
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+        self._server = _ControlServer(str(self.socket_path), _ControlHandler)
+        self._server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        threading.Thread(target=self._server.serve_forever, name="daemon-control", daemon=True).start()
+        logger.info(f"🔌 Socket de control: {self.socket_path}")
+
+    # ---------- agenda ----------
+
+    def _scheduled_job(self) -> Optional[dict]:
+        """Cierre de mercado (1 vez por sesión) o intervalo intradía en horario de mercado
+        (barras intradía: la diaria de la sesión en curso no se guarda hasta el cierre)"""
+        market_date = expected_market_date()
+        if market_date != self.last_scheduled_date:
+            self.last_scheduled_date = market_date
+            return {'only': None, 'force': False, 'source': f"cierre {market_date}"}
+
+        if self.interval and self.last_run_at is not None:
+            now = datetime.now(MARKET_TZ)
+            in_session = now.weekday() < 5 and dt_time(9, 30) <= now.time() < MARKET_CLOSE
+            if in_session and (datetime.utcnow() - self.last_run_at).total_seconds() >= self.interval:
+                return {'intraday': True, 'source': 'intradía'}
+        return None
+
+    # ---------- ejecución ----------
+
+    def warm_up(self):
+        """Paga una sola vez: imports pesados, conexión del pool y carga de precios"""
+        started = time.perf_counter()
+        import sklearn.ensemble  # noqa: F401
+        from . import backtester, portfolio_optimizer, predictions  # noqa: F401
+        db = SessionLocal()
+        try:
+            self.prices.refresh(db)
+        finally:
+            db.close()
+        use_price_cache(self.prices)
+        logger.info(f"🔥 Daemon caliente en {time.perf_counter() - started:.1f}s")
+
+    def _refresh_intraday(self, db) -> dict:
+        """Barras intradía del día + sus indicadores (sin tocar prices_daily ni el DAG diario)"""
+        from .intraday import IntradayLoader, INTERVALS, intraday_indicators
+        summary = IntradayLoader(db).load(interval=self.intraday_interval, days_back=1)
+        if summary['rows']:
+            intraday_indicators(db, interval_min=INTERVALS[self.intraday_interval], days_back=1)
+        return {'intraday': 'ok', 'rows': summary['rows']}
+
+    def _run_job(self, job: dict):
+        logger.info(f"⏰ {'Intradía' if job.get('intraday') else 'Pipeline'} disparado ({job['source']})")
+        profiler.reset()
+        try:
+            if job.get('intraday'):
+                db = SessionLocal()
+                try:
+                    job['status'] = self._refresh_intraday(db)
+                finally:
+                    db.close()
+            else:
+                runner = PipelineRunner(stages=default_stages(self.predictor), force=job['force'])
+                job['status'] = runner.run(only=job['only'])
+        except Exception as e:
+            job['error'] = str(e)
+            logger.error(f"❌ Daemon: {e}")
+        self.runs += 1
+        self.last_run_at = datetime.utcnow()
+        self.last_status = job.get('status') or {}
+        profiler.write_reports('daemon')
+
+        for callback in self.on_run_complete:
+            try:
+                callback(self.last_status)
+            except Exception as e:
+                logger.warning(f"⚠️ Callback post-run: {e}")
+        if 'done' in job:
+            job['done'].set()
+
+    def serve_forever(self):
+        profiler.instrument_engine(engine)
+        self.warm_up()
+        self._start_control_socket()
+        if self.api is not None:
+            self.api.start()
+        logger.info("🟢 Daemon en marcha (Ctrl+C para salir)")
+        try:
+            while not self._stop.is_set():
+                job = self._scheduled_job()
+                if job is None:
+                    try:
+                        job = self.jobs.get(timeout=self.poll_seconds)
+                    except queue.Empty:
+                        continue
+                self._run_job(job)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+            if self.api is not None:
+                self.api.stop()
+            if self.socket_path.exists():
+                self.socket_path.unlink()
+            use_price_cache(None)
+            logger.info("🔴 Daemon detenido")
+
+
+def send_command(request: dict, socket_path: Optional[str] = None, timeout: Optional[float] = None) -> dict:
+    """Cliente del socket de control"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(str(socket_path or settings.DAEMON_SOCKET))
+        sock.sendall((json.dumps(request) + "\n").encode())
+        return json.loads(sock.makefile().readline())
@@ -1,10 +1,17 @@
 from sqlalchemy.orm import Session
 from ..models.sp500 import Company, DailyPrice
+from ..models.pipeline import LoadJob
 from ..services.sp500_fetcher import MultiSourceFetcher
+from ..services.price_archive import archive_cutoff
+from ..services.pipeline import expected_market_date
+from ..services.result_writer import write_rows
+from ..services.table_stats import set_total
 import pandas as pd
+from datetime import datetime, timedelta
 from typing import List
 import logging
-from sqlalchemy import func
+import time
+from sqlalchemy import func, insert
 
 logger = logging.getLogger(__name__)
 
@@ -15,8 +22,8 @@ class SP500DataLoader:
     
     def create_schema(self):
         """Crea el esquema si no existe"""
-        from ..core.database import Base
-        Base.metadata.create_all(bind=self.db.bind)
+        from ..core.schema import ensure_schema
+        ensure_schema(self.db.get_bind())
         logger.info("📊 Esquema de base de datos creado/existe")
     
     def load_companies(self) -> List[Company]:
@@ -59,6 +66,9 @@ class SP500DataLoader:
             Company.is_active == True
         ).update({Company.is_active: False}, synchronize_session=False)
         
+        self.db.flush()
+        active = self.db.query(func.count(Company.id)).filter(Company.is_active == True).scalar()
+        set_total(self.db, 'companies', active)
         self.db.commit()
         logger.info(f"📈 Nuevas: {len(new_companies)}, Actualizadas: {len(updated_companies)}, Inactivas: {inactive_companies}")
         logger.info(f"🏢 Total empresas activas: {len(sp500_df)}")
@@ -77,37 +87,10 @@ class SP500DataLoader:
         
         for company in companies:
             if company.ticker in all_data and not all_data[company.ticker].empty:
-                prices_df = all_data[company.ticker]
-                
-                batch_prices = []
-                for date, row in prices_df.iterrows():
-                    if hasattr(date, 'date'):
-                        price_date = date.date()
-                    else:
-                        price_date = date
-                    
-                    existing = self.db.query(DailyPrice).filter(
-                        DailyPrice.company_id == company.id,
-                        DailyPrice.price_date == price_date
-                    ).first()
-                    
-                    if not existing:
-                        price = DailyPrice(
-                            company_id=company.id,
-                            price_date=price_date,
-                            open=(float(row['Open']) if 'Open' in row and pd.notna(row['Open']) else None),
-                            high=(float(row['High']) if 'High' in row and pd.notna(row['High']) else None),
-                            low=(float(row['Low']) if 'Low' in row and pd.notna(row['Low']) else None),
-                            close=(float(row['Close']) if 'Close' in row and pd.notna(row['Close']) else None),
-                            volume=(int(row['Volume']) if 'Volume' in row and pd.notna(row['Volume']) else None)
-                        )
-                        batch_prices.append(price)
-                
-                if batch_prices:
-                    self.db.add_all(batch_prices)
-                    total_prices += len(batch_prices)
-                    logger.info(f"💾 {company.ticker}: {len(batch_prices)} nuevos días")
-                
+                inserted = self._insert_new_prices(company.id, all_data[company.ticker])
+                if inserted:
+                    total_prices += inserted
+                    logger.info(f"💾 {company.ticker}: {inserted} nuevos días")
                 self.db.commit()
             else:
                 failed_tickers.append(company.ticker)
@@ -138,36 +121,174 @@ class SP500DataLoader:
                     func.max(DailyPrice.price_date)
                 ).filter(DailyPrice.company_id == company.id).scalar()
                 
-                new_prices = []
-                for date, row in prices_df.iterrows():
-                    price_date = date.date() if hasattr(date, 'date') else date
-
-                    if last_date_db is None or price_date > last_date_db:
-                        existing = self.db.query(DailyPrice).filter(
-                            DailyPrice.company_id == company.id,
-                            DailyPrice.price_date == price_date
-                        ).first()
-                        
-                        if not existing:
-                            price = DailyPrice(
-                                company_id=company.id,
-                                price_date=price_date,
-                                open=float(row['Open']) if pd.notna(row['Open']) else None,
-                                high=float(row['High']) if pd.notna(row['High']) else None,
-                                low=float(row['Low']) if pd.notna(row['Low']) else None,
-                                close=float(row['Close']) if pd.notna(row['Close']) else None,
-                                volume=int(row['Volume']) if pd.notna(row['Volume']) else None
-                            )
-                            new_prices.append(price)
+                dates = pd.Index([d.date() if hasattr(d, 'date') else d for d in prices_df.index])
+                if last_date_db is not None:
+                    prices_df = prices_df[dates > last_date_db]
                 
-                if new_prices:
-                    self.db.add_all(new_prices)
-                    total_new_prices += len(new_prices)
-                    logger.info(f"💾 {ticker}: +{len(new_prices)} nuevos días (desde {last_date_db or 'inicio'})")
+                inserted = self._insert_new_prices(company.id, prices_df)
+                if inserted:
+                    total_new_prices += inserted
+                    logger.info(f"💾 {ticker}: +{inserted} nuevos días (desde {last_date_db or 'inicio'})")
             
             self.db.commit()
             
         logger.info(f"✅ Incremental completado: {total_new_prices:,} nuevos precios")
         return total_new_prices
 
+    def _insert_new_prices(self, company_id: int, prices_df: pd.DataFrame) -> int:
+        """Inserta solo las fechas que faltan (INSERT multi-fila que ignora duplicados)"""
+        if prices_df.empty:
+            return 0
+        dates = [d.date() if hasattr(d, 'date') else d for d in prices_df.index]
+        # Lo anterior al horizonte de archivo ya está en los ficheros fríos: no re-insertar.
+        # Lo posterior a la última sesión cerrada es la barra en curso (cierre = precio actual):
+        # con 'ignore' el cierre real nunca la corregiría
+        cutoff, last_closed = archive_cutoff(), expected_market_date()
+        keep = [(cutoff is None or d >= cutoff) and d <= last_closed for d in dates]
+        if not all(keep):
+            prices_df = prices_df[keep]
+            dates = [d for d, k in zip(dates, keep) if k]
+            if not dates:
+                return 0
+        def value(row, col, cast):
+            return cast(row[col]) if col in row and pd.notna(row[col]) else None
+
+        rows = [{
+            'company_id': company_id,
+            'price_date': price_date,
+            'open': value(row, 'Open', float),
+            'high': value(row, 'High', float),
+            'low': value(row, 'Low', float),
+            'close': value(row, 'Close', float),
+            'volume': value(row, 'Volume', int),
+        } for price_date, (_, row) in zip(dates, prices_df.iterrows())]
+        # Upsert nativo que ignora las fechas ya cargadas (sin SELECT previo en MySQL/SQLite)
+        return write_rows(self.db, DailyPrice, rows, key=('company_id', 'price_date'))
+
+    def _resumable_run(self, days_back: int, max_attempts: int):
+        """Última corrida con rangos sin terminar (o None)"""
+        row = self.db.query(LoadJob.run_key).filter(
+            LoadJob.run_key.like(f"full:{days_back}:%"),
+            LoadJob.status != 'done',
+            LoadJob.attempts < max_attempts
+        ).order_by(LoadJob.run_key.desc()).first()
+        return row[0] if row else None
+
+    @staticmethod
+    def _ranges(start_date, end_date, chunk_days: int) -> list:
+        """Reparte [start, end] en rangos de ~chunk_days iguales (sin un rango residual de 1 día)"""
+        span = (end_date - start_date).days + 1
+        n = max(1, round(span / chunk_days))
+        bounds = [start_date + timedelta(days=span * i // n) for i in range(n + 1)]
+        return [(bounds[i], bounds[i + 1] - timedelta(days=1)) for i in range(n)]
+
+    def _add_jobs(self, run_key: str, tickers: List[str], ranges: list):
+        self.db.execute(insert(LoadJob), [{
+            'run_key': run_key, 'ticker': ticker, 'start_date': start, 'end_date': end,
+            'status': 'pending', 'attempts': 0, 'rows_loaded': 0
+        } for ticker in tickers for start, end in ranges])
+
+    def _create_run(self, companies: List[Company], days_back: int, chunk_days: int) -> str:
+        end_date = datetime.now().date()
+        run_key = f"full:{days_back}:{end_date}"
+        ranges = self._ranges(end_date - timedelta(days=days_back), end_date, chunk_days)
+
+        self.db.query(LoadJob).filter(LoadJob.run_key == run_key).delete(synchronize_session=False)
+        self._add_jobs(run_key, [c.ticker for c in companies], ranges)
+        self.db.commit()
+        return run_key
+
+    def _extend_run(self, run_key: str, companies: List[Company]):
+        """Una corrida reanudada días después: añade el tramo (fin anterior, hoy] por ticker"""
+        last_end = self.db.query(func.max(LoadJob.end_date)).filter(LoadJob.run_key == run_key).scalar()
+        today = datetime.now().date()
+        if last_end is None or last_end >= today:
+            return
+        self._add_jobs(run_key, [c.ticker for c in companies], [(last_end + timedelta(days=1), today)])
+        self.db.commit()
+        logger.info(f"🧷 {run_key}: + rango {last_end + timedelta(days=1)} → {today}")
+
+    def load_historical_prices_checkpointed(self, days_back: int = 1825, chunk_days: int = 365,
+                                            max_passes: int = 3, max_attempts: int = 5,
+                                            backoff_s: float = 30.0) -> dict:
+        """🧷 Carga histórica reanudable: checkpoint por ticker × rango en load_jobs"""
+        companies = self.db.query(Company).filter(Company.is_active == True).all()
+        company_by_ticker = {c.ticker: c for c in companies}
+
+        run_key = self._resumable_run(days_back, max_attempts)
+        if run_key is None:
+            run_key = self._create_run(companies, days_back, chunk_days)
+            logger.info(f"🧷 Nueva carga {run_key}: {len(companies)} tickers")
+        else:
+            done = self.db.query(
+                func.count(LoadJob.id), func.coalesce(func.sum(LoadJob.rows_loaded), 0),
+                func.coalesce(func.sum(LoadJob.duration_s), 0.0)
+            ).filter(LoadJob.run_key == run_key, LoadJob.status == 'done').one()
+            self._extend_run(run_key, companies)
+            total = self.db.query(func.count(LoadJob.id)).filter(LoadJob.run_key == run_key).scalar()
+            logger.info(f"♻️ Reanudando {run_key}: {done[0]}/{total} rangos ya cargados | "
+                        f"ahorro ~{float(done[2]) / 60:.1f} min y {int(done[1]):,} filas sin re-descargar")
+
+        started = time.perf_counter()
+        total_rows = 0
+        for attempt_pass in range(max_passes):
+            pending = self.db.query(LoadJob).filter(
+                LoadJob.run_key == run_key,
+                LoadJob.status != 'done',
+                LoadJob.attempts < max_attempts
+            ).order_by(LoadJob.ticker, LoadJob.start_date).all()
+            if not pending:
+                break
+            if attempt_pass > 0:
+                wait = backoff_s * 2 ** (attempt_pass - 1)
+                logger.info(f"⏳ Pasada {attempt_pass + 1}: {len(pending)} rangos pendientes, esperando {wait:.0f}s")
+                time.sleep(wait)
+
+            jobs_by_ticker = {}
+            for job in pending:
+                jobs_by_ticker.setdefault(job.ticker, []).append(job)
+
+            for ticker, jobs in jobs_by_ticker.items():
+                ticker_started = time.perf_counter()
+                company = company_by_ticker.get(ticker)
+                prices_df = None
+                error = None
+                try:
+                    if company is None:
+                        error = "empresa inactiva"
+                    else:
+                        fetch_days = (datetime.now().date() - min(j.start_date for j in jobs)).days + 1
+                        data = self.fetcher.download_historical_data([ticker], days_back=fetch_days)
+                        prices_df = data.get(ticker)
+                        if prices_df is None or prices_df.empty:
+                            error = "sin datos de ninguna fuente"
+                except Exception as e:
+                    error = str(e)[:255]
+
+                for job in jobs:
+                    job.attempts += 1
+                    if error is None:
+                        dates = pd.Index([d.date() if hasattr(d, 'date') else d for d in prices_df.index])
+                        chunk = prices_df[(dates >= job.start_date) & (dates <= job.end_date)]
+                        # Rango vacío tras una descarga correcta (festivos, antes de la salida a
+                        # bolsa...) no es un fallo: hecho con 0 filas; solo fallan las descargas
+                        job.rows_loaded = self._insert_new_prices(company.id, chunk) if not chunk.empty else 0
+                        job.status, job.last_error = 'done', None
+                        total_rows += job.rows_loaded
+                    else:
+                        job.status, job.last_error = 'failed', error
+                elapsed = time.perf_counter() - ticker_started
+                for job in jobs:
+                    job.duration_s = (job.duration_s or 0.0) + elapsed / len(jobs)
+                # Checkpoint por ticker: precios + estado de sus rangos en la misma transacción
+                self.db.commit()
 
+        summary = dict(self.db.query(LoadJob.status, func.count(LoadJob.id)).filter(
+            LoadJob.run_key == run_key).group_by(LoadJob.status).all())
+        logger.info(f"✅ {run_key}: {total_rows:,} precios nuevos en {time.perf_counter() - started:.0f}s | "
+                    f"rangos: {summary}")
+        failed = self.db.query(LoadJob.ticker).filter(
+            LoadJob.run_key == run_key, LoadJob.status == 'failed').distinct().all()
+        if failed:
+            logger.warning(f"⚠️ {len(failed)} tickers con rangos fallidos (se reintentan en la próxima corrida)")
+        return {'run_key': run_key, 'rows': total_rows, 'status': summary}
@@ -0,0 +1,166 @@
+import pandas as pd
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.model_selection import ParameterGrid, TimeSeriesSplit
+from sqlalchemy.orm import Session
+from typing import Dict, List, Optional, Sequence
+import logging
+import math
+import shutil
+import tempfile
+import time
+from ..models.sp500 import Company, DailyPrice
+from ..models.predictions import MLHyperParams
+from .ml_predictor import MLPredictor
+from .result_writer import write_rows
+
+logger = logging.getLogger(__name__)
+
+PARAM_GRID = {
+    'n_estimators': [100, 150, 300],
+    'max_depth': [3, 4, 6],
+    'learning_rate': [0.03, 0.05, 0.1],
+    'subsample': [0.8],
+    'min_samples_leaf': [1, 5],
+}
+
+
+def _fit_score(params: dict, X: np.ndarray, y: np.ndarray, price: np.ndarray,
+               train_idx: np.ndarray, test_idx: np.ndarray, n_rows: int) -> float:
+    """1 configuración × 1 fold (en un worker de joblib; X/y llegan como memmap, sin copia).
+    n_rows: presupuesto de la ronda = filas de train más recientes."""
+    train = train_idx[-n_rows:]
+    model = GradientBoostingRegressor(**params, random_state=42).fit(X[train], y[train])
+    pred = model.predict(X[test_idx])
+    # MSE del retorno 1d implícito: comparable entre empresas de distinto precio
+    return float(np.mean(((pred - y[test_idx]) / price[test_idx]) ** 2))
+
+
+class HyperparamSearch:
+    """Búsqueda paralela de hiperparámetros del GBR 1d con successive halving.
+
+    Las features de cada empresa se calculan una vez y se vuelcan a .npy; los workers
+    de joblib las abren como memmap (se comparten entre trials sin copiarse). Cada ronda
+    evalúa configuraciones × folds de TimeSeriesSplit con un presupuesto de filas
+    creciente y se queda con el mejor 1/eta.
+    """
+
+    def __init__(self, param_grid: Optional[dict] = None, n_splits: int = 3, eta: int = 3,
+                 min_rows: int = 60, n_jobs: int = -1, days_back: int = 500):
+        self.candidates = list(ParameterGrid(param_grid or PARAM_GRID))
+        self.n_splits = n_splits
+        self.eta = eta
+        self.min_rows = min_rows
+        self.n_jobs = n_jobs
+        self.days_back = days_back
+        self.predictor = MLPredictor()
+
+    # ---------- datos ----------
+
+    def _dataset(self, db: Session, company_id: int, ticker: str, workdir: str) -> Optional[dict]:
+        """Features una sola vez -> arrays memmap de solo lectura + folds temporales"""
+        df = self.predictor.load_price_frame(db, company_id, ticker, self.days_back)
+        if df is None:
+            return None
+        training = self.predictor.training_set(df, ticker)
+        if training is None:
+            return None
+        X, y, _ = training
+        if len(X) < self.min_rows * 2:
+            logger.warning(f"⚠️ {ticker}: {len(X)} filas, insuficiente para CV")
+            return None
+
+        arrays = {}
+        for name, values in (('X', X.to_numpy(dtype=np.float64)), ('y', y.to_numpy(dtype=np.float64)),
+                             ('price', X['price'].to_numpy(dtype=np.float64))):
+            path = f"{workdir}/{company_id}_{name}.npy"
+            np.save(path, values)
+            arrays[name] = np.load(path, mmap_mode='r')
+        folds = list(TimeSeriesSplit(n_splits=self.n_splits).split(arrays['X']))
+        return {'company_id': company_id, 'ticker': ticker, 'folds': folds,
+                'tuned_through': df.index[-1], **arrays}
+
+    # ---------- successive halving ----------
+
+    def _halving(self, parallel, datasets: List[dict]) -> tuple:
+        """-> (mejores params, score medio, nº de fits)"""
+        alive = list(range(len(self.candidates)))
+        rounds = max(1, math.ceil(math.log(len(alive), self.eta)))
+        fits = 0
+        for r in range(rounds):
+            fraction = self.eta ** (r - rounds + 1)
+            tasks, owners = [], []
+            for c in alive:
+                for d, data in enumerate(datasets):
+                    for train_idx, test_idx in data['folds']:
+                        n_rows = min(len(train_idx), max(self.min_rows, int(len(train_idx) * fraction)))
+                        tasks.append((self.candidates[c], data['X'], data['y'], data['price'],
+                                      train_idx, test_idx, n_rows))
+                        owners.append(c)
+            scores = parallel(delayed(_fit_score)(*task) for task in tasks)
+            fits += len(tasks)
+
+            mean = pd.Series(scores).groupby(owners).mean()
+            keep = max(1, math.ceil(len(alive) / self.eta)) if r < rounds - 1 else 1
+            alive = mean.nsmallest(keep).index.tolist()
+            logger.info(f"   🔎 Ronda {r + 1}/{rounds}: {len(mean)} configs × "
+                        f"{len(tasks) // len(mean)} folds ({fraction:.0%} filas) -> {len(alive)}")
+        best = alive[0]
+        return self.candidates[best], float(mean[best]), fits
+
+    # ---------- orquestación ----------
+
+    def _groups(self, db: Session, companies: list, per_cluster: bool, max_per_cluster: int) -> Dict[str, list]:
+        """Grupos a afinar: 1 por empresa, o 1 por cluster con hasta N representantes"""
+        if not per_cluster:
+            return {'company': [[c] for c in companies]}
+        from .correlation import CorrelationEngine
+        labels = CorrelationEngine().cluster_labels(db, [cid for cid, _ in companies])
+        groups = {}
+        for company in companies:
+            groups.setdefault(f"cluster:{labels[company[0]]}", []).append(company)
+        return groups
+
+    def run(self, db: Session, limit: Optional[int] = None, per_cluster: bool = False,
+            max_per_cluster: int = 3) -> List[dict]:
+        query = db.query(Company.id, Company.ticker).join(
+            DailyPrice, Company.id == DailyPrice.company_id
+        ).filter(Company.is_active == True).group_by(Company.id, Company.ticker).order_by(Company.id)
+        companies = (query.limit(limit) if limit else query).all()
+        groups = self._groups(db, companies, per_cluster, max_per_cluster)
+        logger.info(f"🎛️ TUNING: {len(companies)} empresas, {len(self.candidates)} configuraciones, "
+                    f"TimeSeriesSplit({self.n_splits}), halving eta={self.eta}")
+
+        workdir = tempfile.mkdtemp(prefix="sp500_tune_")
+        started = time.perf_counter()
+        rows, total_fits = [], 0
+        try:
+            with Parallel(n_jobs=self.n_jobs) as parallel:
+                for source, members in groups.items():
+                    if source == 'company':
+                        batches = [(m, m) for m in members]  # cada empresa, su propia búsqueda
+                    else:
+                        batches = [(members[:max_per_cluster], members)]
+                    for tuned, targets in batches:
+                        datasets = [d for d in (self._dataset(db, cid, ticker, workdir) for cid, ticker in tuned) if d]
+                        if not datasets:
+                            continue
+                        label = datasets[0]['ticker'] if source == 'company' else f"{source} ({len(targets)} empresas)"
+                        logger.info(f"🎛️ {label}")
+                        params, score, fits = self._halving(parallel, datasets)
+                        total_fits += fits
+                        logger.info(f"🏆 {label}: {params} (MSE retorno {score:.2e})")
+                        tuned_through = max(d['tuned_through'] for d in datasets)
+                        rows.extend({
+                            'company_id': cid, 'params': params, 'source': source,
+                            'cv_score': score, 'n_candidates': len(self.candidates),
+                            'tuned_through': tuned_through,
+                        } for cid, _ in targets)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        write_rows(db, MLHyperParams, rows, key=('company_id',), on_conflict='update')
+        db.commit()
+        logger.info(f"✅ Tuning: {len(rows)} empresas, {total_fits:,} fits en {time.perf_counter() - started:.1f}s")
+        return rows
@@ -5,19 +5,12 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from ..models.sp500 import Company, DailyPrice
 from ..models.predictions import TechnicalIndicator
-from ..core.database import Base, engine
-
-def ensure_tables():
-    Base.metadata.create_all(bind=engine)
-
-def calculate_indicators(db: Session, company_id: int, days_back: int = 60):
-    """Con chequeo de tabla"""
-    ensure_tables()
+from .result_writer import write_rows
 
 logger = logging.getLogger(__name__)
 
-def calculate_indicators(db: Session, company_id: int, days_back: int = 60):
-    """Calcula TODOS los indicadores técnicos"""
+def calculate_indicators(db: Session, company_id: int, days_back: int = 60, writer=None):
+    """Calcula TODOS los indicadores técnicos (writer: ResultWriter opcional, escritura en lote)"""
     company = db.query(Company).filter(Company.id == company_id).first()
     if not company:
         return
@@ -44,6 +37,18 @@ def calculate_indicators(db: Session, company_id: int, days_back: int = 60):
     df['date'] = pd.to_datetime(df['date'])
     df.set_index('date', inplace=True)
 
+    latest = compute_indicators(df)
+    row = {'company_id': company_id, 'indicator_date': df.index[-1].date(), **latest}
+    key = ('company_id', 'indicator_date')
+    if writer is not None:
+        writer.put(TechnicalIndicator, row, key)
+    elif write_rows(db, TechnicalIndicator, [row], key):
+        db.commit()
+    logger.info(f"📊 {company.ticker}: RSI={latest['rsi']:.1f}, Score={latest['momentum_score']:.3f}")
+
+def compute_indicators(df: pd.DataFrame, periods_per_year: int = 252) -> dict:
+    """Indicadores de la última barra de un frame OHLCV (close/high/low/volume, orden temporal).
+    Sirve igual para barras diarias que intradía (periods_per_year anualiza la volatilidad)"""
     delta = df['close'].diff()
     gain = (delta.where(delta > 0, 0)).rolling(14).mean()
     loss = (-delta.where(delta < 0, 0)).rolling(14).mean()
@@ -63,7 +68,7 @@ def calculate_indicators(db: Session, company_id: int, days_back: int = 60):
     bb_upper = sma20_bb + (std20 * 2)
     bb_lower = sma20_bb - (std20 * 2)
 
-    volatility = df['close'].pct_change().rolling(20).std() * 100 * np.sqrt(252)
+    volatility = df['close'].pct_change().rolling(20).std() * 100 * np.sqrt(periods_per_year)
     
     latest = {
         'rsi': float(rsi.iloc[-1]) if not pd.isna(rsi.iloc[-1]) else None,
@@ -80,17 +85,7 @@ def calculate_indicators(db: Session, company_id: int, days_back: int = 60):
     latest['momentum_score'] = calculate_momentum_score(latest, current_price)
     latest['buy_signal'] = latest['momentum_score'] > 0.7 if latest['momentum_score'] else False
     latest['sell_signal'] = latest['momentum_score'] < 0.3 if latest['momentum_score'] else False
-
-    existing = db.query(TechnicalIndicator).filter(
-        TechnicalIndicator.company_id == company_id,
-        TechnicalIndicator.indicator_date == df.index[-1].date()
-    ).first()
-    
-    if not existing:
-        indicator = TechnicalIndicator(company_id=company_id, indicator_date=df.index[-1].date(), **latest)
-        db.add(indicator)
-        db.commit()
-        logger.info(f"📊 {company.ticker}: RSI={latest['rsi']:.1f}, Score={latest['momentum_score']:.3f}")
+    return latest
 
 def calculate_momentum_score(indicators, current_price):
     score = 0
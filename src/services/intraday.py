@@ -0,0 +1,220 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import text, insert
+from sqlalchemy.engine import Engine
+from datetime import date, datetime, timedelta
+from typing import Iterator, Optional, Sequence, Tuple
+import logging
+import time
+from ..models.sp500 import Company
+from ..models.intraday import IntradayBar
+from .indicators import compute_indicators
+from .pipeline import MARKET_TZ
+
+logger = logging.getLogger(__name__)
+
+INTERVALS = {'1m': 1, '2m': 2, '5m': 5, '15m': 15, '30m': 30, '60m': 60}
+BAR_COLUMNS = ['bar_time', 'open', 'high', 'low', 'close', 'volume']
+OHLCV_AGG = {'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum'}
+SESSION_MINUTES = 390  # 9:30-16:00 ET
+
+
+def periods_per_year(minutes: float) -> float:
+    """Barras por año de sesión regular (anualización de Sharpe/volatilidad)"""
+    return 252 if minutes >= SESSION_MINUTES else 252 * SESSION_MINUTES / minutes
+
+
+def _add_months(d: date, months: int) -> date:
+    years, month = divmod(d.month - 1 + months, 12)
+    return date(d.year + years, month + 1, 1)
+
+
+def _partition(month: date) -> str:
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_add_months(month, 1)}'))"
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = 2, retention_months: Optional[int] = None) -> int:
+    """MySQL: particiones RANGE mensuales sobre bar_time (crea las que faltan partiendo pmax;
+    con retention_months borra meses viejos con DROP PARTITION). Otros dialectos: no-op"""
+    if engine.dialect.name != 'mysql':
+        return 0
+
+    this_month = date.today().replace(day=1)
+    last_month = _add_months(this_month, months_ahead)
+    with engine.begin() as conn:
+        existing = [row[0] for row in conn.execute(text("""
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'prices_intraday'
+            AND PARTITION_NAME IS NOT NULL
+            ORDER BY PARTITION_ORDINAL_POSITION
+        """))]
+        months = [p for p in existing if p != 'pmax']
+
+        if not existing:
+            first = conn.execute(text("SELECT MIN(bar_time) FROM prices_intraday")).scalar()
+            month = min(first.date().replace(day=1), this_month) if first else this_month
+        else:
+            month = _add_months(datetime.strptime(months[-1], "p%Y%m").date(), 1) if months else this_month
+        new = []
+        while month <= last_month:
+            new.append(month)
+            month = _add_months(month, 1)
+
+        defs = ", ".join([_partition(m) for m in new] + ["PARTITION pmax VALUES LESS THAN MAXVALUE"])
+        if not existing:
+            conn.execute(text(f"ALTER TABLE prices_intraday PARTITION BY RANGE (TO_DAYS(bar_time)) ({defs})"))
+        elif new:
+            conn.execute(text(f"ALTER TABLE prices_intraday REORGANIZE PARTITION pmax INTO ({defs})"))
+
+        dropped = []
+        if retention_months:
+            cutoff = f"p{_add_months(this_month, -retention_months):%Y%m}"
+            dropped = [p for p in months if p < cutoff]
+            if dropped:
+                conn.execute(text(f"ALTER TABLE prices_intraday DROP PARTITION {', '.join(dropped)}"))
+
+    if new or dropped:
+        logger.info(f"🗂️ prices_intraday: +{len(new)} particiones, -{len(dropped)} (retención)")
+    return len(new)
+
+
+def bars_to_rows(company_id: int, interval_min: int, df: pd.DataFrame) -> list:
+    """Frame del fetcher (Open/High/Low/Close/Volume, índice con tz) -> filas UTC naive"""
+    df = df.dropna(subset=['Close'])
+    index = pd.DatetimeIndex(df.index)
+    index = index.tz_convert('UTC').tz_localize(None) if index.tz is not None else index
+    columns = [df[c].to_numpy(dtype=float).tolist() for c in ('Open', 'High', 'Low', 'Close')]
+    volume = df['Volume'].fillna(0).to_numpy(dtype=np.int64).tolist()
+    return [
+        {'company_id': company_id, 'interval_min': interval_min, 'bar_time': t,
+         'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for t, o, h, l, c, v in zip(index.to_pydatetime(), *columns, volume)
+    ]
+
+
+def insert_bars(db: Session, rows: list, chunk_rows: int = 5000) -> int:
+    """INSERT multi-fila que ignora duplicados (idempotente, sin SELECT previo) -> filas
+    insertadas (MySQL: procesadas, duplicados incluidos). No hace commit"""
+    stmt = insert(IntradayBar.__table__)
+    dialect = db.get_bind().dialect.name
+    if dialect == 'mysql':
+        # No-op en duplicado (INSERT IGNORE silenciaría también errores de datos)
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(IntradayBar.__table__)
+        stmt = stmt.on_duplicate_key_update({'company_id': stmt.inserted.company_id})
+    elif dialect == 'sqlite':
+        stmt = stmt.prefix_with('OR IGNORE')
+
+    written = 0
+    for start in range(0, len(rows), chunk_rows):
+        chunk = rows[start:start + chunk_rows]
+        rowcount = db.connection().execute(stmt, chunk).rowcount
+        written += rowcount if rowcount is not None and rowcount >= 0 else len(chunk)
+    return written
+
+
+class IntradayLoader:
+    """Ingesta intradía en bloque: descarga multi-ticker + INSERT multi-fila por lotes"""
+
+    def __init__(self, db: Session, fetcher=None):
+        self.db = db
+        self.fetcher = fetcher
+
+    def load(self, tickers: Optional[Sequence[str]] = None, interval: str = '5m',
+             days_back: int = 5, chunk_rows: int = 5000) -> dict:
+        if interval not in INTERVALS:
+            raise ValueError(f"Intervalo no soportado: {interval} ({', '.join(INTERVALS)})")
+        if self.fetcher is None:
+            from .sp500_fetcher import MultiSourceFetcher
+            self.fetcher = MultiSourceFetcher()
+
+        ensure_partitions(self.db.get_bind())
+        query = self.db.query(Company.ticker, Company.id).filter(Company.is_active == True)
+        if tickers:
+            query = query.filter(Company.ticker.in_(list(tickers)))
+        ids = dict(query.all())
+
+        data = self.fetcher.download_intraday(list(ids), interval=interval, days_back=days_back)
+        started = time.perf_counter()
+        total = 0
+        for ticker, df in data.items():
+            total += insert_bars(self.db, bars_to_rows(ids[ticker], INTERVALS[interval], df), chunk_rows)
+            self.db.commit()
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"✅ Intradía {interval}: {total:,} barras de {len(data)} tickers en {elapsed:.1f}s "
+                    f"({total / max(elapsed, 1e-9):,.0f} filas/s)")
+        return {'tickers': len(data), 'rows': total, 'seconds': round(elapsed, 3)}
+
+
+def resample_bars(df: pd.DataFrame, rule: str) -> pd.DataFrame:
+    """OHLCV a otro intervalo ('15min', '1h', '1D'...); buckets en hora de mercado"""
+    if df.empty:
+        return df
+    out = df.resample(rule, label='left', closed='left').agg(OHLCV_AGG)
+    return out.dropna(subset=['close'])
+
+
+def _bars_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=BAR_COLUMNS)
+    index = pd.DatetimeIndex(pd.to_datetime(df.pop('bar_time'))).tz_localize('UTC').tz_convert(MARKET_TZ)
+    return df.astype(float).set_axis(index)
+
+
+def iter_bars(db: Session, company_ids: Sequence[int], interval_min: int = 5,
+              start: Optional[datetime] = None, end: Optional[datetime] = None,
+              rule: Optional[str] = None, chunk_rows: int = 50_000) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """(company_id, barras) empresa a empresa, leyendo por ventanas keyset de chunk_rows.
+
+    Con rule, cada ventana se re-muestrea al vuelo y solo se retiene el resultado agregado:
+    la memoria queda acotada a 1 ventana + la serie re-muestreada de 1 empresa.
+    """
+    sql = text("""
+        SELECT bar_time, open, high, low, close, volume
+        FROM prices_intraday
+        WHERE company_id = :company_id AND interval_min = :interval_min
+        AND bar_time > :after AND bar_time < :before
+        ORDER BY bar_time
+        LIMIT :limit
+    """)
+    for company_id in company_ids:
+        after = start or datetime(1970, 1, 1)
+        parts = []
+        while True:
+            rows = db.execute(sql, {'company_id': company_id, 'interval_min': interval_min,
+                                    'after': after, 'before': end or datetime(9999, 1, 1),
+                                    'limit': chunk_rows}).fetchall()
+            if not rows:
+                break
+            chunk = _bars_frame(rows)
+            parts.append(resample_bars(chunk, rule) if rule else chunk)
+            if len(rows) < chunk_rows:
+                break
+            after = rows[-1][0]
+        if not parts:
+            continue
+        bars = pd.concat(parts)
+        if rule and len(parts) > 1:
+            # Un bucket puede quedar partido entre 2 ventanas: OHLCV se re-agrega sin pérdida
+            bars = bars.groupby(level=0).agg(OHLCV_AGG)
+        yield company_id, bars
+
+
+def intraday_indicators(db: Session, company_ids: Optional[Sequence[int]] = None,
+                        interval_min: int = 5, rule: Optional[str] = None,
+                        days_back: int = 30) -> pd.DataFrame:
+    """Indicadores de la última barra por empresa sobre barras intradía (o re-muestreadas)"""
+    if company_ids is None:
+        company_ids = [cid for (cid,) in db.query(Company.id).filter(Company.is_active == True).all()]
+    minutes = pd.Timedelta(rule).total_seconds() / 60 if rule else interval_min
+    start = datetime.utcnow() - timedelta(days=days_back)
+
+    rows = []
+    for company_id, bars in iter_bars(db, company_ids, interval_min, start, rule=rule):
+        if len(bars) < 30:
+            continue
+        latest = compute_indicators(bars, periods_per_year(minutes))
+        rows.append({'company_id': company_id, 'bar_time': bars.index[-1], **latest})
+    logger.info(f"📊 Indicadores intradía ({rule or f'{interval_min}m'}): {len(rows)} empresas")
+    return pd.DataFrame(rows)
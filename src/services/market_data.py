@@ -0,0 +1,156 @@
+import pandas as pd
+from sqlalchemy.orm import Session
+from sqlalchemy import text, bindparam, func
+from datetime import date
+from typing import Optional, Sequence
+import logging
+import threading
+from ..models.sp500 import DailyPrice
+from .price_archive import read_archived, archive_cutoff
+
+logger = logging.getLogger(__name__)
+
+PRICE_COLUMNS = ['company_id', 'price_date', 'open', 'high', 'low', 'close', 'volume']
+SIGNAL_COLUMNS = ['company_id', 'signal_date', 'ml_score', 'pred_price_1d']
+
+_price_cache = None
+
+
+def _to_price_frame(rows) -> pd.DataFrame:
+    df = pd.DataFrame(rows, columns=PRICE_COLUMNS)
+    for col in ['open', 'high', 'low', 'close', 'volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+    return df
+
+
+class PriceCache:
+    """prices_daily residente en memoria; refresco incremental por id (solo filas nuevas).
+    Los borrados del archivo no se ven por id: un cambio de horizonte de archivo invalida."""
+
+    def __init__(self):
+        self.frame = pd.DataFrame(columns=PRICE_COLUMNS)
+        self.max_id = 0
+        self.cutoff = archive_cutoff()
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self.frame = pd.DataFrame(columns=PRICE_COLUMNS)
+            self.max_id = 0
+
+    def refresh(self, db: Session) -> int:
+        """1 query barata (MAX(id)); si hay filas nuevas las trae y fusiona -> nº de filas nuevas"""
+        cutoff = archive_cutoff()  # manifest cacheado por mtime: 1 stat
+        if cutoff != self.cutoff:
+            logger.info(f"🗃️ Cache de precios invalidada: horizonte de archivo {self.cutoff} -> {cutoff}")
+            self.invalidate()
+            self.cutoff = cutoff
+        with self._lock:
+            max_id = db.query(func.max(DailyPrice.id)).scalar() or 0
+            if max_id <= self.max_id:
+                return 0
+            rows = db.query(
+                DailyPrice.company_id, DailyPrice.price_date,
+                DailyPrice.open, DailyPrice.high, DailyPrice.low,
+                DailyPrice.close, DailyPrice.volume
+            ).filter(
+                DailyPrice.id > self.max_id, DailyPrice.id <= max_id,
+                DailyPrice.close.isnot(None)
+            ).all()
+            new = _to_price_frame(rows)
+            frame = new if self.frame.empty else pd.concat([self.frame, new], ignore_index=True)
+            self.frame = (frame.drop_duplicates(['company_id', 'price_date'], keep='last')
+                          .sort_values(['company_id', 'price_date'], ignore_index=True))
+            self.max_id = max_id
+            logger.info(f"🗃️ Cache de precios: +{len(new):,} filas ({len(self.frame):,} en memoria)")
+            return len(new)
+
+    def get(self, db: Session, company_ids: Sequence[int],
+            start_date: Optional[date] = None, end_date: Optional[date] = None) -> pd.DataFrame:
+        self.refresh(db)
+        df = self.frame
+        mask = df['company_id'].isin(list(company_ids))
+        if start_date is not None:
+            mask &= df['price_date'] >= start_date
+        if end_date is not None:
+            mask &= df['price_date'] <= end_date
+        return df.loc[mask].reset_index(drop=True)
+
+
+def use_price_cache(cache: Optional[PriceCache]):
+    """Activa (o desactiva con None) la caché en memoria para load_prices"""
+    global _price_cache
+    _price_cache = cache
+
+
+def load_prices(db: Session, company_ids: Sequence[int],
+                start_date: Optional[date] = None,
+                end_date: Optional[date] = None) -> pd.DataFrame:
+    """Precios de N empresas en UNA query (formato largo, ordenado); si el rango llega
+    antes del horizonte de archivo, añade las filas archivadas de forma transparente"""
+    if not company_ids:
+        return pd.DataFrame(columns=PRICE_COLUMNS)
+    hot = _load_hot_prices(db, company_ids, start_date, end_date)
+    cold = read_archived(company_ids, start_date, end_date)
+    if cold is None or cold.empty:
+        return hot
+    return (pd.concat([cold, hot], ignore_index=True)
+            .drop_duplicates(['company_id', 'price_date'], keep='last')
+            .sort_values(['company_id', 'price_date'], ignore_index=True))
+
+
+def _load_hot_prices(db: Session, company_ids: Sequence[int],
+                     start_date: Optional[date] = None,
+                     end_date: Optional[date] = None) -> pd.DataFrame:
+    if _price_cache is not None:
+        return _price_cache.get(db, company_ids, start_date, end_date)
+
+    query = db.query(
+        DailyPrice.company_id, DailyPrice.price_date,
+        DailyPrice.open, DailyPrice.high, DailyPrice.low,
+        DailyPrice.close, DailyPrice.volume
+    ).filter(
+        DailyPrice.company_id.in_(list(company_ids)),
+        DailyPrice.close.isnot(None)
+    )
+    if start_date is not None:
+        query = query.filter(DailyPrice.price_date >= start_date)
+    if end_date is not None:
+        query = query.filter(DailyPrice.price_date <= end_date)
+
+    rows = query.order_by(DailyPrice.company_id, DailyPrice.price_date).all()
+    return _to_price_frame(rows)
+
+
+def load_ml_signals(db: Session, company_ids: Sequence[int],
+                    start_date: Optional[date] = None,
+                    end_date: Optional[date] = None) -> pd.DataFrame:
+    """Señales ML de N empresas en UNA query"""
+    if not company_ids:
+        return pd.DataFrame(columns=SIGNAL_COLUMNS)
+
+    sql = text("""
+        SELECT company_id, prediction_date as signal_date, ml_score, pred_price_1d
+        FROM ml_predictions
+        WHERE company_id IN :company_ids
+        AND prediction_date >= :start_date
+        AND prediction_date <= :end_date
+        ORDER BY company_id, prediction_date ASC
+    """).bindparams(bindparam('company_ids', expanding=True))
+
+    rows = db.execute(sql, {
+        'company_ids': list(company_ids),
+        'start_date': start_date or date.min,
+        'end_date': end_date or date.max
+    }).fetchall()
+    df = pd.DataFrame(rows, columns=SIGNAL_COLUMNS)
+    df['signal_date'] = pd.to_datetime(df['signal_date']).dt.date
+    for col in ['ml_score', 'pred_price_1d']:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+    return df
+
+
+def prices_watermark(db: Session) -> str:
+    """Marca barata del estado de prices_daily (cambia con cada carga de precios)"""
+    max_id, max_date = db.query(func.max(DailyPrice.id), func.max(DailyPrice.price_date)).one()
+    return f"{max_id or 0}:{max_date or '-'}"
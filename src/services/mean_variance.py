@@ -0,0 +1,151 @@
+import numpy as np
+from typing import Optional, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _solve_monotone(fn, lo: np.ndarray, hi: np.ndarray, iters: int = 60, tol: float = 1e-10) -> np.ndarray:
+    """Raíz vectorizada de fn decreciente (fn(lo) >= 0 >= fn(hi)) por secante + bisección"""
+    f_lo, f_hi = fn(lo), fn(hi)
+    x = (lo + hi) / 2
+    for _ in range(iters):
+        denom = f_lo - f_hi
+        with np.errstate(divide='ignore', invalid='ignore'):
+            secant = lo + f_lo * (hi - lo) / denom
+        ok = (denom > 0) & (secant > lo) & (secant < hi)
+        x = np.where(ok, secant, (lo + hi) / 2)
+        fx = fn(x)
+        if np.all(np.abs(fx) < tol):
+            break
+        above = fx > 0
+        lo, f_lo = np.where(above, x, lo), np.where(above, fx, f_lo)
+        hi, f_hi = np.where(above, hi, x), np.where(above, f_hi, fx)
+        # Paso de bisección alternado para garantizar convergencia en tramos planos
+        mid = (lo + hi) / 2
+        fm = fn(mid)
+        above = fm > 0
+        lo, f_lo = np.where(above, mid, lo), np.where(above, fm, f_lo)
+        hi, f_hi = np.where(above, hi, mid), np.where(above, f_hi, fm)
+    return x
+
+
+def _solve_scalar(fn, lo: float, hi: float, iters: int = 60, tol: float = 1e-10) -> float:
+    """Raíz escalar de fn decreciente por regula falsi (Illinois), en floats: sin el coste fijo
+    de numpy por iteración, que domina con n pequeño y miles de proyecciones"""
+    f_lo, f_hi = fn(lo), fn(hi)
+    x, side = (lo + hi) / 2, 0
+    for _ in range(iters):
+        denom = f_lo - f_hi
+        x = lo + f_lo * (hi - lo) / denom if denom > 0 else (lo + hi) / 2
+        if not lo < x < hi:
+            x = (lo + hi) / 2
+        fx = fn(x)
+        if abs(fx) < tol:
+            break
+        if fx > 0:
+            if side > 0:  # mismo extremo dos veces: se halva el otro para no estancarse
+                f_hi /= 2
+            lo, f_lo, side = x, fx, 1
+        else:
+            if side < 0:
+                f_lo /= 2
+            hi, f_hi, side = x, fx, -1
+    return x
+
+
+def project_weights(v: np.ndarray, upper: np.ndarray, groups: np.ndarray,
+                    group_cap: np.ndarray, total: float = 1.0) -> np.ndarray:
+    """Proyección euclídea sobre {0 <= w <= upper, sum_g(w) <= cap_g, sum(w) = total}.
+
+    KKT: w_i = clip(v_i - tau - sigma_g(i), 0, u_i). Para cada tau, el grupo aporta
+    min(suma libre, cap); se resuelve tau (escalar) y luego los sigma_g en paralelo.
+    """
+    n_groups = len(group_cap)
+
+    def group_sums(w):
+        return np.bincount(groups, weights=w, minlength=n_groups)
+
+    def total_gap(tau):
+        free = np.clip(v - tau, 0.0, upper)
+        return float(np.minimum(group_sums(free), group_cap).sum()) - total
+
+    tau = _solve_scalar(total_gap, float(v.min() - upper.max() - total), float(v.max()))
+
+    shifted = v - tau
+    capped = group_sums(np.clip(shifted, 0.0, upper)) > group_cap
+    sigma = np.zeros(n_groups)
+    if capped.any():
+        def group_gap(s):
+            gap = group_sums(np.clip(shifted - s[groups], 0.0, upper)) - group_cap
+            return np.where(capped, gap, 0.0)
+        sigma_hi = np.full(n_groups, max(float(shifted.max()), 0.0) + 1.0)
+        sigma = np.where(capped, _solve_monotone(group_gap, np.zeros(n_groups), sigma_hi), 0.0)
+
+    return np.clip(shifted - sigma[groups], 0.0, upper)
+
+
+class MeanVarianceSolver:
+    """Mean-variance long-only con max-weight y cap por grupo (sector/cluster) vía FISTA"""
+
+    def __init__(self, max_weight: float = 0.15, group_cap: float = 0.25,
+                 max_iter: int = 300, tol: float = 1e-6):
+        self.max_weight = max_weight
+        self.group_cap = group_cap
+        self.max_iter = max_iter
+        self.tol = tol
+
+    def _feasible_bounds(self, n_assets: int, groups: np.ndarray):
+        """Relaja límites si no hay solución factible (pocos activos / grupos)"""
+        n_groups = int(groups.max()) + 1
+        sizes = np.bincount(groups, minlength=n_groups)
+        max_weight = max(self.max_weight, 1.0 / n_assets)
+        cap = np.minimum(self.group_cap, sizes * max_weight)
+        if cap.sum() < 1.0:
+            cap = np.minimum(np.maximum(self.group_cap, 1.0 / n_groups), sizes * max_weight)
+            if cap.sum() < 1.0:
+                cap = sizes * max_weight
+        return np.full(n_assets, max_weight), cap
+
+    def solve(self, mu: np.ndarray, cov: np.ndarray, risk_aversion: float,
+              groups: np.ndarray, w0: Optional[np.ndarray] = None,
+              lipschitz: Optional[float] = None) -> np.ndarray:
+        """max mu'w - (lambda/2) w'Σw  s.t. restricciones"""
+        n_assets = len(mu)
+        upper, cap = self._feasible_bounds(n_assets, groups)
+        if lipschitz is None:
+            lipschitz = float(np.linalg.eigvalsh(cov)[-1])
+        step = 1.0 / max(risk_aversion * lipschitz, 1e-12)
+
+        w = project_weights(np.full(n_assets, 1.0 / n_assets) if w0 is None else w0, upper, groups, cap)
+        y, t = w.copy(), 1.0
+        for _ in range(self.max_iter):
+            grad = mu - risk_aversion * (cov @ y)
+            w_next = project_weights(y + step * grad, upper, groups, cap)
+            if (w_next - w) @ (y - w_next) > 0:
+                t = 1.0  # Reinicio adaptativo: el momento apunta cuesta abajo, se descarta
+            t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+            y = w_next + ((t - 1) / t_next) * (w_next - w)
+            converged = np.abs(w_next - w).max() < self.tol
+            w, t = w_next, t_next
+            if converged:
+                break
+        return w
+
+    def efficient_frontier(self, mu: np.ndarray, cov: np.ndarray, groups: np.ndarray,
+                           n_points: int = 15, risk_free: float = 0.0) -> List[dict]:
+        """Frontera (lambda alto -> bajo riesgo) con warm start entre puntos"""
+        lipschitz = float(np.linalg.eigvalsh(cov)[-1])
+        frontier, w = [], None
+        for risk_aversion in np.logspace(2, -1, n_points):
+            w = self.solve(mu, cov, risk_aversion, groups, w0=w, lipschitz=lipschitz)
+            ret = float(mu @ w)
+            vol = float(np.sqrt(max(w @ cov @ w, 0.0)))
+            frontier.append({
+                'risk_aversion': float(risk_aversion),
+                'weights': w,
+                'expected_return': ret,
+                'volatility': vol,
+                'sharpe': (ret - risk_free) / vol if vol > 0 else 0.0,
+            })
+        return frontier
@@ -3,15 +3,25 @@ import numpy as np
 from sklearn.ensemble import GradientBoostingRegressor
 from sqlalchemy.orm import Session
 import logging
+from datetime import date, timedelta
+from typing import Optional, Sequence
 from ..models.sp500 import Company, DailyPrice
-from ..models.predictions import MLPrediction
+from ..models.predictions import MLPrediction, MLHyperParams
+from ..core.instrumentation import profiler
+from .market_data import load_prices
+from .result_writer import ResultWriter, write_rows
 
 logger = logging.getLogger(__name__)
 
+# Configuración histórica; ml_hyperparams (comando tune) la sobreescribe por empresa
+DEFAULT_PARAMS = {'n_estimators': 150, 'max_depth': 6, 'learning_rate': 0.05, 'subsample': 0.8}
+
 class MLPredictor:
     def __init__(self):
         self.models = {}
         self.scalers = {}
+        self.hyperparams = None
+        self.online = None
     
     def rsi(self, prices: pd.Series, window: int = 14) -> pd.Series:
         """RSI manual (pandas puro)"""
@@ -70,77 +80,152 @@ class MLPredictor:
         
         return features.dropna()
     
-    def train_predict(self, db: Session, company_id: int, days_back: int = 500):
-        """XGBoost completo - Predicción + confianza"""
-        company = db.query(Company).get(company_id)
-        if not company:
-            logger.warning(f"⚠️ Empresa ID {company_id} no encontrada")
-            return
-        
-        logger.info(f"🤖 {company.ticker}...")
+    def train_all(self, db: Session, limit: int = 20, online: bool = False) -> int:
+        """Entrena las primeras `limit` empresas con precios (online: actualización
+        incremental y reentrenamiento completo solo cuando toca)"""
+        companies = db.query(Company.id, Company.ticker).join(
+            DailyPrice, Company.id == DailyPrice.company_id
+        ).group_by(Company.id, Company.ticker).limit(limit).all()
+
+        self.hyperparams = None  # relee ml_hyperparams (puede haber cambiado desde el último tune)
+        # Las predicciones se escriben en segundo plano mientras se entrena la siguiente empresa
+        with ResultWriter.for_session(db) as writer:
+            for company_id, ticker in companies:
+                with profiler.ticker(ticker):
+                    if online and self.update_online(db, company_id, writer=writer):
+                        continue
+                    self.train_predict(db, company_id, writer=writer, online=online)
+        if self.models:
+            self.export_compiled()
+        return len(companies)
+
+    def export_compiled(self, root: Optional[str] = None, company_ids: Optional[Sequence[int]] = None) -> int:
+        """Ensembles en memoria -> paquete de arrays memmapeables (verificado contra predict).
+        company_ids: solo esas empresas (el resto del paquete se conserva)"""
+        from .compiled_trees import CompiledModelStore
+        models = self.models if company_ids is None else {
+            cid: self.models[cid] for cid in company_ids if cid in self.models}
+        return CompiledModelStore(root).save(models)
+
+    def score_compiled(self, db: Session, company_ids: Optional[Sequence[int]] = None,
+                       root: Optional[str] = None) -> pd.DataFrame:
+        """Predicción 1d/5d de la última fila de cada empresa con los modelos compilados
+        (sin sklearn: 1 pasada vectorizada para todos los tickers y horizontes)"""
+        from .compiled_trees import CompiledModelStore
+        store = CompiledModelStore(root).load()
+        available = sorted({int(k.split(':')[0]) for k in store.index})
+        company_ids = [c for c in (company_ids or available) if f"{c}:1d" in store.index]
+        # Solo hacen falta las ~100 últimas sesiones (tail(100)): no cargar todo el histórico
+        prices = load_prices(db, company_ids, date.today() - timedelta(days=int(100 * 1.5)))
+
+        ids, rows = [], []
+        for company_id, group in prices.groupby('company_id'):
+            df = pd.DataFrame({
+                'Open': group['open'].fillna(group['close']).to_numpy(),
+                'High': group['high'].fillna(group['close']).to_numpy(),
+                'Low': group['low'].fillna(group['close']).to_numpy(),
+                'Close': group['close'].to_numpy(),
+                'Volume': group['volume'].fillna(0).to_numpy()
+            }, index=pd.Index(group['price_date'], name='date')).tail(100)
+            features = self.prepare_features(df)
+            if not features.empty:
+                ids.append(company_id)
+                rows.append(features.iloc[-1].to_numpy())
+        if not ids:
+            return pd.DataFrame(columns=['company_id', 'price', 'pred_price_1d', 'pred_price_5d'])
+
+        X = np.vstack(rows)
+        result = pd.DataFrame({
+            'company_id': ids,
+            'price': X[:, 0],
+            'pred_price_1d': store.predict_many([store.key(c, '1d') for c in ids], X),
+            'pred_price_5d': store.predict_many([store.key(c, '5d') for c in ids], X),
+        })
+        result['change_1d'] = result['pred_price_1d'] / result['price'] - 1
+        return result
 
-        prices = db.query(DailyPrice).filter(
-            DailyPrice.company_id == company_id
-        ).order_by(DailyPrice.price_date.asc()).limit(days_back).all()
+    def load_price_frame(self, db: Session, company_id: int, ticker: str, days_back: int = 500,
+                         start_date=None):
+        """OHLCV de los últimos `days_back` días (Open/High/Low/Close/Volume, índice fecha) o None"""
+        prices = load_prices(db, [company_id], start_date).tail(days_back)
         
         if len(prices) < 100:
-            logger.warning(f"⚠️ {company.ticker}: {len(prices)} días insuficientes")
-            return
+            logger.warning(f"⚠️ {ticker}: {len(prices)} días insuficientes")
+            return None
 
-        df_data = []
-        for p in prices:
-            if p.close:
-                df_data.append({
-                    'date': p.price_date,
-                    'Open': float(p.open or p.close),
-                    'High': float(p.high or p.close),
-                    'Low': float(p.low or p.close),
-                    'Close': float(p.close),
-                    'Volume': float(p.volume or 0)
-                })
-        
-        df = pd.DataFrame(df_data)
-        df.set_index('date', inplace=True)
+        df = pd.DataFrame({
+            'Open': prices['open'].fillna(prices['close']).to_numpy(),
+            'High': prices['high'].fillna(prices['close']).to_numpy(),
+            'Low': prices['low'].fillna(prices['close']).to_numpy(),
+            'Close': prices['close'].to_numpy(),
+            'Volume': prices['volume'].fillna(0).to_numpy()
+        }, index=pd.Index(prices['price_date'], name='date'))
         df.sort_index(inplace=True)
         
         if len(df) < 100:
-            logger.warning(f"⚠️ {company.ticker}: Solo {len(df)} precios válidos")
-            return
+            logger.warning(f"⚠️ {ticker}: Solo {len(df)} precios válidos")
+            return None
+        return df
 
+    def training_set(self, df: pd.DataFrame, ticker: str):
+        """Features + targets 1d/5d -> (X, y_1d, y_5d) o None"""
         features = self.prepare_features(df)
         if features.empty or len(features) < 50:
-            logger.warning(f"⚠️ {company.ticker}: Features insuficientes")
-            return
+            logger.warning(f"⚠️ {ticker}: Features insuficientes")
+            return None
         
         features['target_1d'] = df['Close'].shift(-1)
         features['target_5d'] = df['Close'].shift(-5)
 
         train_data = features.dropna()
         if len(train_data) < 30:
-            logger.warning(f"⚠️ {company.ticker}: Train data insuficiente")
-            return
+            logger.warning(f"⚠️ {ticker}: Train data insuficiente")
+            return None
         
         X = train_data.drop(['target_1d', 'target_5d'], axis=1)
-        y_1d = train_data['target_1d']
-        y_5d = train_data['target_5d']
-
-        model_1d = GradientBoostingRegressor(
-            n_estimators=150,
-            max_depth=6,
-            learning_rate=0.05,
-            subsample=0.8,
-            random_state=42
-        )
-        model_5d = GradientBoostingRegressor(
-            n_estimators=150,
-            max_depth=6,
-            learning_rate=0.05,
-            subsample=0.8,
-            random_state=42
-        )
+        return X, train_data['target_1d'], train_data['target_5d']
+
+    def model_params(self, db: Session, company_id: int) -> dict:
+        """Hiperparámetros afinados de la empresa (tabla ml_hyperparams) o los por defecto"""
+        if self.hyperparams is None:
+            self.hyperparams = dict(db.query(MLHyperParams.company_id, MLHyperParams.params).all())
+        return {**DEFAULT_PARAMS, **(self.hyperparams.get(company_id) or {})}
+
+    def train_predict(self, db: Session, company_id: int, days_back: int = 500, writer=None,
+                      online: bool = False):
+        """XGBoost completo - Predicción + confianza (writer: ResultWriter opcional; online:
+        reinicia además el corrector online con su referencia fuera de muestra)"""
+        company = db.query(Company).get(company_id)
+        if not company:
+            logger.warning(f"⚠️ Empresa ID {company_id} no encontrada")
+            return
+        
+        logger.info(f"🤖 {company.ticker}...")
+
+        # Solo la ventana necesaria: sin límite se leería todo el histórico (y el archivo frío)
+        df = self.load_price_frame(db, company_id, company.ticker, days_back,
+                                   start_date=date.today() - timedelta(days=int(days_back * 1.5)))
+        if df is None:
+            return
+
+        params = self.model_params(db, company_id)
+        cached = self.models.get(company_id)
+        if cached and cached['trained_through'] == df.index[-1] and cached.get('params') == params:
+            logger.info(f"♻️ {company.ticker}: modelo en memoria al día ({df.index[-1]})")
+            return
+
+        training = self.training_set(df, company.ticker)
+        if training is None:
+            return
+        X, y_1d, y_5d = training
+
+        model_1d = GradientBoostingRegressor(**params, random_state=42)
+        model_5d = GradientBoostingRegressor(**params, random_state=42)
         
         model_1d.fit(X, y_1d)
         model_5d.fit(X, y_5d)
+        self.models[company_id] = {'1d': model_1d, '5d': model_5d, 'trained_through': df.index[-1],
+                                   'params': params, 'X_check': X.iloc[-25:]}
 
         last_features = X.iloc[[-1]]
         pred_1d = model_1d.predict(last_features)[0]
@@ -162,28 +247,81 @@ class MLPredictor:
         else:
             direction_correct = 0.5
 
+        if online:
+            if self.online is None:
+                from .online_learning import OnlineCorrector
+                self.online = OnlineCorrector()
+            base_mae, base_accuracy = self._holdout_baseline(X, y_1d, params)
+            self.online.reset(company_id, df.index, base_mae, base_accuracy, params=params)
+
+        self._write_prediction(db, company, pred_date, pred_1d, pred_5d, current_price,
+                               direction_correct, writer)
+
+    @staticmethod
+    def _holdout_baseline(X: pd.DataFrame, y_1d: pd.Series, params: dict) -> tuple:
+        """MAE relativo y acierto direccional 1d de referencia para el corrector online, sobre
+        una cola que el modelo no vio (un modelo aparte sin esas filas: in-sample saldrían
+        optimistas y cualquier error real parecería deriva)"""
+        holdout = min(25, len(X) // 4)
+        if holdout < 5:
+            return 0.02, 0.5
+        model = GradientBoostingRegressor(**params, random_state=42)
+        model.fit(X.iloc[:-holdout], y_1d.iloc[:-holdout])
+        price = X['price'].iloc[-holdout:].to_numpy()
+        actual = y_1d.iloc[-holdout:].to_numpy()
+        predicted = model.predict(X.iloc[-holdout:])
+        base_mae = float(np.mean(np.abs((predicted - actual) / price)))
+        base_accuracy = float(np.mean(np.sign(predicted - price) == np.sign(actual - price)))
+        return base_mae, base_accuracy
+
+    def _write_prediction(self, db: Session, company, pred_date, pred_1d: float, pred_5d: float,
+                          current_price: float, direction_correct: float, writer=None, tag: str = ""):
         change_1d_pct = (pred_1d / current_price - 1)
         ml_score = direction_correct * 0.7 + max(0, min(1, change_1d_pct * 10)) * 0.3
 
-        existing = db.query(MLPrediction).filter(
-            MLPrediction.company_id == company_id,
-            MLPrediction.prediction_date == pred_date
-        ).first()
-        
-        if not existing:
-            prediction = MLPrediction(
-                company_id=company_id,
-                prediction_date=pred_date,
-                pred_price_1d=float(pred_1d),
-                pred_price_5d=float(pred_5d),
-                confidence_1d=float(direction_correct),
-                ml_score=float(ml_score)
-            )
-            db.add(prediction)
+        row = {
+            'company_id': company.id,
+            'prediction_date': pred_date,
+            'pred_price_1d': float(pred_1d),
+            'pred_price_5d': float(pred_5d),
+            'confidence_1d': float(direction_correct),
+            'ml_score': float(ml_score)
+        }
+        # Re-predecir el mismo día (p.ej. tras un reentrenamiento) sustituye la predicción
+        key = ('company_id', 'prediction_date')
+        if writer is not None:
+            writer.put(MLPrediction, row, key, on_conflict='update')
+        elif write_rows(db, MLPrediction, [row], key, on_conflict='update'):
             db.commit()
-            
-            change_pct = change_1d_pct * 100
-            logger.info(f"🤖 {company.ticker}: 1d=${pred_1d:.1f} "
-                       f"({change_pct:+.1f}%) C:{direction_correct:.0%} ML:{ml_score:.3f}")
-        else:
-            logger.info(f"ℹ️ {company.ticker}: Predicción ya existe ({pred_date})")
+        
+        change_pct = change_1d_pct * 100
+        logger.info(f"🤖 {company.ticker}{tag}: 1d=${pred_1d:.1f} "
+                   f"({change_pct:+.1f}%) C:{direction_correct:.0%} ML:{ml_score:.3f}")
+
+    def update_online(self, db: Session, company_id: int, writer=None) -> bool:
+        """Actualización incremental (solo targets nuevos, ventana fija) -> False si toca
+        reentrenar desde cero (sin modelo base, base vieja, hueco o deriva)"""
+        company = db.query(Company).get(company_id)
+        if not company:
+            return False
+        if self.online is None:
+            from .online_learning import OnlineCorrector
+            self.online = OnlineCorrector()
+
+        # Ventana fija: warm-up de las features (SMA 50) + hueco máximo -> coste constante
+        start_date = date.today() - timedelta(days=int((100 + self.online.max_gap) * 1.5))
+        df = self.load_price_frame(db, company_id, company.ticker, days_back=100 + self.online.max_gap,
+                                   start_date=start_date)
+        if df is None:
+            return False
+        reason = self.online.retrain_reason(company_id, df, self.model_params(db, company_id))
+        if reason:
+            logger.info(f"🔁 {company.ticker}: reentrenamiento completo ({reason})")
+            return False
+
+        features = self.prepare_features(df)
+        result = self.online.update(company_id, df, features)
+        self._write_prediction(db, company, df.index[-1], result['pred_1d'], result['pred_5d'],
+                               df['Close'].iloc[-1], result['accuracy'], writer,
+                               tag=f" [online +{result['learned']}]")
+        return True
@@ -0,0 +1,145 @@
+import pandas as pd
+import numpy as np
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+from pathlib import Path
+from typing import Optional
+import joblib
+import logging
+import os
+from ..core.config import settings
+from .compiled_trees import CompiledModelStore
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = {'1d': 1, '5d': 5}
+
+
+class OnlineCorrector:
+    """Corrección online del residuo del GBR base (compilado) con SGDRegressor.partial_fit.
+
+    Cada día solo se aprende de los targets recién realizados (coste constante por ticker);
+    el reentrenamiento completo queda para cuando el modelo base envejece (retrain_days
+    sesiones), hay un hueco mayor que max_gap sesiones o el error online deriva.
+    """
+
+    def __init__(self, root: Optional[str] = None, retrain_days: int = 20, max_gap: int = 10,
+                 window: int = 20, drift_ratio: float = 1.5, min_accuracy: float = 0.45):
+        self.root = Path(root or settings.ARTIFACTS_DIR) / "online"
+        self.store = CompiledModelStore(root)
+        self.retrain_days = retrain_days
+        self.max_gap = max_gap
+        self.window = window
+        self.drift_ratio = drift_ratio
+        self.min_accuracy = min_accuracy
+        self._loaded = False
+
+    # ---------- estado por empresa ----------
+
+    def _path(self, company_id: int) -> Path:
+        return self.root / f"{company_id}.joblib"
+
+    def load_state(self, company_id: int) -> Optional[dict]:
+        path = self._path(company_id)
+        return joblib.load(path) if path.exists() else None
+
+    def save_state(self, company_id: int, state: dict):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self._path(company_id).with_suffix(".tmp")
+        joblib.dump(state, tmp)
+        os.replace(tmp, self._path(company_id))
+
+    def reset(self, company_id: int, dates: pd.Index, base_mae: float, base_accuracy: float = 0.5,
+              params: Optional[dict] = None):
+        """Tras un reentrenamiento completo: corrector nuevo sobre el nuevo modelo base"""
+        self.save_state(company_id, {
+            'base_through': str(dates[-1]),
+            'params': params,  # hiperparámetros del modelo base
+            # Último día cuyo target ya vio el modelo base, por horizonte
+            'through': {h: dates[-1 - shift] for h, shift in HORIZONS.items()},
+            'sessions': 0,
+            'scaler': StandardScaler(),
+            'sgd': {h: SGDRegressor(loss='huber', alpha=1e-4, eta0=0.005, random_state=42)
+                    for h in HORIZONS},
+            'base_mae': base_mae,
+            'base_accuracy': base_accuracy,
+            'errors': [],
+            'hits': [],
+        })
+
+    # ---------- decisión ----------
+
+    def retrain_reason(self, company_id: int, df: pd.DataFrame, params: Optional[dict] = None) -> Optional[str]:
+        """Motivo para reentrenar desde cero, o None si basta la actualización online"""
+        if not self._loaded:
+            self.store.load()
+            self._loaded = True
+        state = self.load_state(company_id)
+        key = self.store.key(company_id, '1d')
+        if state is None or key not in self.store.index:
+            return "sin modelo base"
+        if self.store.index[key]['trained_through'] != state['base_through']:
+            return "modelo base distinto del corrector"
+        if params is not None and state.get('params') != params:
+            return "hiperparámetros nuevos"
+        new_sessions = int((df.index > state['through']['1d']).sum()) - 1
+        if new_sessions > self.max_gap:
+            return f"hueco de {new_sessions} sesiones"
+        if state['sessions'] + max(new_sessions, 0) > self.retrain_days:
+            return f"programado ({self.retrain_days} sesiones)"
+        errors, hits = state['errors'][-self.window:], state['hits'][-self.window:]
+        if len(errors) >= self.window // 2:
+            if np.mean(errors) > self.drift_ratio * state['base_mae']:
+                return f"deriva: MAE {np.mean(errors):.4f} > {self.drift_ratio}× {state['base_mae']:.4f}"
+            if np.mean(hits) < self.min_accuracy:
+                return f"deriva: acierto direccional {np.mean(hits):.0%}"
+        return None
+
+    # ---------- actualización ----------
+
+    def update(self, company_id: int, df: pd.DataFrame, features: pd.DataFrame) -> dict:
+        """Aprende de los targets realizados desde la última vez y predice la última fila
+        -> {'pred_1d', 'pred_5d', 'accuracy', 'learned'}"""
+        state = self.load_state(company_id)
+        close = df['Close'].reindex(features.index)
+        scaler, learned = state['scaler'], 0
+
+        for horizon, shift in HORIZONS.items():
+            target = close.shift(-shift)
+            new = features.index[(features.index > state['through'][horizon]) & target.notna().to_numpy()]
+            if len(new) == 0:
+                continue
+            X = features.loc[new]
+            price = X['price'].to_numpy()
+            base = self.store.predict_many([self.store.key(company_id, horizon)] * len(X), X.to_numpy())
+            residual = (target.loc[new].to_numpy() - base) / price
+
+            if horizon == '1d':
+                # Error de lo que se habría predicho ANTES de ver estos targets
+                correction = (state['sgd']['1d'].predict(scaler.transform(X.to_numpy()))
+                              if hasattr(scaler, 'mean_') and hasattr(state['sgd']['1d'], 'coef_') else 0.0)
+                predicted = base + price * correction
+                actual = target.loc[new].to_numpy()
+                state['errors'] = (state['errors'] + list(np.abs((actual - predicted) / price)))[-self.window * 3:]
+                state['hits'] = (state['hits'] + list(np.sign(predicted - price) == np.sign(actual - price)))[-self.window * 3:]
+                state['sessions'] += len(new)
+                scaler.partial_fit(X.to_numpy())
+                learned += len(new)
+            if hasattr(scaler, 'mean_'):
+                state['sgd'][horizon].partial_fit(scaler.transform(X.to_numpy()), residual)
+            state['through'][horizon] = new[-1]
+
+        last = features.iloc[[-1]]
+        price = float(last['price'].iloc[0])
+        predictions = {}
+        for horizon in HORIZONS:
+            base = self.store.predict_many([self.store.key(company_id, horizon)], last.to_numpy())[0]
+            sgd = state['sgd'][horizon]
+            correction = sgd.predict(scaler.transform(last.to_numpy()))[0] if hasattr(sgd, 'coef_') else 0.0
+            predictions[f"pred_{horizon}"] = base + price * correction
+
+        self.save_state(company_id, state)
+        # Con pocas observaciones online, el acierto del holdout de entrenamiento rellena la ventana
+        hits = state['hits'][-self.window:]
+        accuracy = (sum(hits) + state['base_accuracy'] * (self.window - len(hits))) / self.window
+        return {**predictions, 'accuracy': float(accuracy), 'learned': learned}
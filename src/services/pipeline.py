@@ -0,0 +1,184 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, time as dt_time
+from zoneinfo import ZoneInfo
+from typing import Callable, Dict, List, Optional, Sequence
+import logging
+import time
+from ..core.database import SessionLocal
+from ..core.instrumentation import profiler
+from ..models.predictions import MLPrediction, MLHyperParams, BacktestResult
+from ..models.pipeline import StageWatermark
+from .market_data import prices_watermark
+
+logger = logging.getLogger(__name__)
+
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_CLOSE = dt_time(16, 30)
+
+
+def expected_market_date(now: Optional[datetime] = None):
+    """Última sesión cerrada (día hábil; antes del cierre cuenta la anterior)"""
+    now = (now or datetime.now(MARKET_TZ)).astimezone(MARKET_TZ)
+    day = now.date() if now.time() >= MARKET_CLOSE else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def _max_id(db: Session, model, *filters) -> int:
+    return db.query(func.max(model.id)).filter(*filters).scalar() or 0
+
+
+def _ml_output_mark(db: Session) -> str:
+    """Predicciones: max(id) cubre filas nuevas; max(updated_at), las sobreescritas (upsert)"""
+    max_id, updated = db.query(func.max(MLPrediction.id), func.max(MLPrediction.updated_at)).one()
+    return f"ml:{max_id or 0}:{updated or '-'}"
+
+
+def _hyperparams_mark(db: Session) -> str:
+    """Estado de ml_hyperparams (un tune nuevo obliga a reentrenar con los mismos precios)"""
+    count, updated = db.query(func.count(MLHyperParams.company_id), func.max(MLHyperParams.created_at)).one()
+    return f"hp:{count}:{updated or '-'}"
+
+
+class Stage:
+    """Nodo del DAG: función + dependencias + marca de sus inputs"""
+
+    def __init__(self, name: str, run: Callable[[Session], object],
+                 watermark: Callable[[Session], str], deps: Sequence[str] = ()):
+        self.name = name
+        self.run = run
+        self.watermark = watermark
+        self.deps = list(deps)
+
+
+# ---------- stages ----------
+
+def _ingest(db: Session):
+    from .data_loader import SP500DataLoader
+    from .risk_model import RiskModelStore
+    loader = SP500DataLoader(db)
+    loader.load_companies()
+    loader.load_historical_prices_incremental(days_back=7)
+    RiskModelStore().update(db)
+
+
+def _indicators(db: Session):
+    from .predictions import generate_trading_signals
+    generate_trading_signals(db)
+
+
+def _ml(db: Session, predictor=None):
+    from .ml_predictor import MLPredictor
+    (predictor or MLPredictor()).train_all(db, limit=20, online=True)
+
+
+def _backtest(db: Session):
+    from .backtester import Backtester
+    from .backtest_stats import SignificanceTester
+    Backtester().backtest_top_stocks(db, limit=20)
+    SignificanceTester().run(db)
+
+
+def _portfolio(db: Session):
+    from .portfolio_optimizer import PortfolioOptimizer
+    PortfolioOptimizer().optimize_portfolio(db, top_signals=20)
+
+
+def default_stages(predictor=None) -> List[Stage]:
+    """ingest → (indicators ‖ ml) → backtest → portfolio (predictor: MLPredictor residente opcional)"""
+    backtest_mark = lambda db: f"bt:{_max_id(db, BacktestResult, BacktestResult.strategy == 'ML_Momentum')}"
+    return [
+        Stage('ingest', _ingest, lambda db: f"market:{expected_market_date()}"),
+        Stage('indicators', _indicators, lambda db: f"prices:{prices_watermark(db)}", deps=['ingest']),
+        Stage('ml', lambda db: _ml(db, predictor),
+              lambda db: f"prices:{prices_watermark(db)}|{_hyperparams_mark(db)}", deps=['ingest']),
+        Stage('backtest', _backtest,
+              lambda db: f"prices:{prices_watermark(db)}|{_ml_output_mark(db)}", deps=['ml']),
+        Stage('portfolio', _portfolio,
+              lambda db: f"{_ml_output_mark(db)}|{backtest_mark(db)}", deps=['ml', 'backtest']),
+    ]
+
+
+class PipelineRunner:
+    """Ejecuta el DAG en un solo proceso; salta stages cuyos inputs no cambiaron"""
+
+    def __init__(self, stages: Optional[List[Stage]] = None, session_factory=SessionLocal,
+                 force: bool = False, max_workers: int = 2):
+        self.stages = {s.name: s for s in (stages or default_stages())}
+        self.session_factory = session_factory
+        self.force = force
+        self.max_workers = max_workers
+        for stage in self.stages.values():
+            missing = set(stage.deps) - set(self.stages)
+            if missing:
+                raise ValueError(f"Stage {stage.name}: dependencias desconocidas {sorted(missing)}")
+
+    def _execute(self, stage: Stage) -> str:
+        """Corre 1 stage en su propia sesión -> 'ok' | 'skipped'"""
+        db = self.session_factory()
+        try:
+            watermark = stage.watermark(db)
+            state = db.get(StageWatermark, stage.name)
+            if not self.force and state is not None and state.input_watermark == watermark:
+                logger.info(f"⏭️ [{stage.name}] sin cambios ({watermark})")
+                return 'skipped'
+
+            logger.info(f"▶️ [{stage.name}] ejecutando...")
+            started = time.perf_counter()
+            with profiler.stage(stage.name):
+                stage.run(db)
+            elapsed = time.perf_counter() - started
+
+            state = db.get(StageWatermark, stage.name) or StageWatermark(stage=stage.name)
+            state.input_watermark = watermark
+            state.last_success_at = datetime.utcnow()
+            state.last_duration_s = elapsed
+            db.merge(state)
+            db.commit()
+            logger.info(f"✅ [{stage.name}] {elapsed:.1f}s")
+            return 'ok'
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def run(self, only: Optional[Sequence[str]] = None) -> Dict[str, str]:
+        """Ejecuta stages listos en paralelo (threads) respetando dependencias"""
+        selected = set(only or self.stages)
+        status: Dict[str, str] = {}
+        running = {}
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while len(status) < len(selected):
+                progressed = False
+                for name in sorted(selected - set(status) - set(running.values())):
+                    deps = [d for d in self.stages[name].deps if d in selected]
+                    if any(status.get(d) in ('failed', 'blocked') for d in deps):
+                        status[name] = 'blocked'
+                        progressed = True
+                        logger.warning(f"⛔ [{name}] bloqueado por dependencia fallida")
+                    elif all(status.get(d) in ('ok', 'skipped') for d in deps):
+                        running[pool.submit(self._execute, self.stages[name])] = name
+                        progressed = True
+
+                if not running:
+                    if not progressed and len(status) < len(selected):
+                        raise ValueError(f"Ciclo en el DAG: {sorted(selected - set(status))}")
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        status[name] = future.result()
+                    except Exception as e:
+                        status[name] = 'failed'
+                        logger.error(f"❌ [{name}] {e}")
+
+        summary = " | ".join(f"{name}:{status[name]}" for name in self.stages if name in status)
+        logger.info(f"🏁 Pipeline {time.perf_counter() - started:.1f}s -> {summary}")
+        return status
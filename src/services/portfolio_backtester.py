@@ -0,0 +1,186 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Optional
+import logging
+from ..models.sp500 import Company
+from ..models.predictions import BacktestResult, PortfolioRecommendation
+from .backtester import INITIAL_CAPITAL
+from .market_data import load_prices
+from .risk_model import RiskModelStore
+
+logger = logging.getLogger(__name__)
+
+
+def simulate_rebalances(returns: pd.DataFrame, targets: pd.DataFrame,
+                        cost_bps: float = 10.0) -> pd.DataFrame:
+    """Replay vectorizado de rebalanceos sobre matriz fecha × ticker de retornos.
+
+    targets: pesos objetivo (fila = fecha de rebalanceo, ejecutado al cierre).
+    Entre rebalanceos los pesos derivan con los precios; el resto es cash (0%).
+    """
+    returns = returns.fillna(0.0)
+    targets = targets.reindex(columns=returns.columns, fill_value=0.0).fillna(0.0)
+    targets = targets[targets.index.isin(returns.index)]
+    if targets.empty:
+        return pd.DataFrame(columns=['gross_return', 'turnover', 'cost', 'net_return', 'equity'])
+
+    returns = returns.loc[returns.index >= targets.index[0]]
+    is_rebalance = returns.index.isin(targets.index)
+    segment = pd.Series(np.cumsum(is_rebalance), index=returns.index)
+
+    # Pesos del segmento vigente; el retorno del día t lo generan los pesos fijados al cierre de t-1
+    weights = targets.reindex(returns.index).ffill()
+    held_weights = weights.shift(1)
+    held_segment = segment.shift(1).fillna(0).astype(int)
+
+    growth = (1.0 + returns).groupby(held_segment.values).cumprod()
+    invested = (held_weights * growth).sum(axis=1)
+    cash = 1.0 - held_weights.sum(axis=1)
+    value = (invested + cash).where(held_segment > 0, 1.0)
+    prev_value = value.groupby(held_segment.values).shift(1).fillna(1.0)
+    gross_return = value / prev_value - 1.0
+
+    drifted = (held_weights * growth).div(value, axis=0).fillna(0.0)
+    turnover = (weights - drifted).abs().sum(axis=1).where(is_rebalance, 0.0)
+    cost = turnover * cost_bps / 10_000
+    net_return = (1.0 + gross_return) * (1.0 - cost) - 1.0
+
+    return pd.DataFrame({
+        'gross_return': gross_return,
+        'turnover': turnover,
+        'cost': cost,
+        'net_return': net_return,
+        'equity': INITIAL_CAPITAL * (1.0 + net_return).cumprod(),
+    })
+
+
+class PortfolioBacktester:
+    """Backtest de los pesos guardados en portfolio_recommendations"""
+
+    def __init__(self, cost_bps: float = 10.0, risk_store: Optional[RiskModelStore] = None):
+        self.cost_bps = cost_bps
+        self.risk_store = risk_store or RiskModelStore()
+
+    def ex_ante_volatility(self, targets: pd.DataFrame, id_by_ticker: dict) -> pd.Series:
+        """Volatilidad ex-ante de cada rebalanceo con el snapshot point-in-time del risk model"""
+        vols = {}
+        for rebalance_date, weights in targets.iterrows():
+            weights = weights[weights > 0]
+            ids = [id_by_ticker[t] for t in weights.index if t in id_by_ticker]
+            if len(ids) != len(weights):
+                continue
+            cov = self.risk_store.covariance(ids, as_of=rebalance_date)
+            if cov is not None:
+                w = weights.to_numpy()
+                vols[rebalance_date] = float(np.sqrt(max(w @ cov @ w, 0.0)))
+        return pd.Series(vols, dtype=float)
+
+    def load_targets(self, db: Session, start_date=None) -> pd.DataFrame:
+        """Historial de recomendaciones -> matriz fecha × ticker de pesos objetivo"""
+        query = db.query(PortfolioRecommendation)
+        if start_date is not None:
+            query = query.filter(PortfolioRecommendation.created_at >= start_date)
+        recs = query.order_by(PortfolioRecommendation.created_at.asc()).all()
+
+        rows = [
+            {'rec': i, 'date': rec.created_at.date(), 'ticker': item['ticker'], 'weight': float(item['weight'])}
+            for i, rec in enumerate(recs) if rec.recommendations
+            for item in rec.recommendations
+        ]
+        if not rows:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(rows)
+        # Varios portfolios el mismo día: vale el último
+        df = df[df['rec'] == df.groupby('date')['rec'].transform('max')]
+        return df.pivot(index='date', columns='ticker', values='weight').fillna(0.0).sort_index()
+
+    def run(self, db: Session, days_back: int = 365) -> Optional[dict]:
+        """Replay de rebalanceos + equity/Sharpe/drawdown del portfolio"""
+        start_date = datetime.now().date() - timedelta(days=days_back)
+        targets = self.load_targets(db, start_date)
+        if targets.empty:
+            logger.warning("⚠️ Sin portfolio_recommendations para backtest")
+            return None
+
+        logger.info(f"💼 Backtest portfolio: {len(targets)} rebalanceos, {targets.shape[1]} tickers")
+
+        companies = db.query(Company.id, Company.ticker).filter(
+            Company.ticker.in_(list(targets.columns))
+        ).all()
+        ticker_by_id = {cid: ticker for cid, ticker in companies}
+        df_prices = load_prices(db, list(ticker_by_id), start_date - timedelta(days=7))
+        if df_prices.empty:
+            logger.warning("⚠️ Sin precios para los tickers recomendados")
+            return None
+
+        df_prices['ticker'] = df_prices['company_id'].map(ticker_by_id)
+        closes = df_prices.pivot_table(index='price_date', columns='ticker', values='close').sort_index()
+        returns = closes.pct_change(fill_method=None)
+
+        # Rebalanceo ejecutado al primer cierre disponible >= fecha de la recomendación
+        pos = closes.index.searchsorted(targets.index)
+        valid = pos < len(closes.index)
+        targets = targets[valid]
+        targets.index = closes.index[pos[valid]]
+        targets = targets.groupby(level=0).last()
+
+        sim = simulate_rebalances(returns, targets, self.cost_bps)
+        if len(sim) < 2:
+            logger.warning("⚠️ Historial de precios insuficiente tras el primer rebalanceo")
+            return None
+
+        net = sim['net_return'].iloc[1:]
+        sharpe = net.mean() / net.std() * np.sqrt(252) if net.std() > 0 else 0.0
+        peak = sim['equity'].cummax()
+        max_drawdown = ((peak - sim['equity']) / peak * 100).max()
+        total_return = (sim['equity'].iloc[-1] / INITIAL_CAPITAL - 1) * 100
+        years = max(len(net) / 252, 1 / 252)
+        rebalances = int((sim['turnover'] > 0).sum())
+        ex_ante_vol = self.ex_ante_volatility(targets, {t: cid for cid, t in ticker_by_id.items()})
+
+        summary = {
+            'total_return': float(total_return),
+            'sharpe': float(sharpe),
+            'max_drawdown': float(max_drawdown),
+            'rebalances': rebalances,
+            'total_turnover': float(sim['turnover'].sum()),
+            'annual_turnover': float(sim['turnover'].sum() / years),
+            'total_cost_pct': float(sim['cost'].sum() * 100),
+            'realized_vol': float(net.std() * np.sqrt(252)),
+            'ex_ante_vol': float(ex_ante_vol.mean()) if not ex_ante_vol.empty else None,
+        }
+
+        db.add(BacktestResult(
+            strategy='Portfolio_Rebalance',
+            company_id=None,
+            start_date=sim.index[0],
+            end_date=sim.index[-1],
+            total_return=summary['total_return'],
+            sharpe_ratio=summary['sharpe'],
+            max_drawdown=summary['max_drawdown'],
+            win_rate=float((net > 0).mean()),
+            total_trades=rebalances,
+            params={
+                'cost_bps': self.cost_bps,
+                'annual_turnover': round(summary['annual_turnover'], 4),
+                'total_cost_pct': round(summary['total_cost_pct'], 4),
+            }
+        ))
+        db.commit()
+
+        logger.info("\n" + "="*60)
+        logger.info("💼 BACKTEST PORTFOLIO (rebalanceos históricos)")
+        logger.info("="*60)
+        logger.info(f"   📈 Retorno total:   {total_return:+.1f}%")
+        logger.info(f"   ⚡ Sharpe Ratio:    {sharpe:.2f}")
+        logger.info(f"   📉 Max Drawdown:    {max_drawdown:.1f}%")
+        if summary['ex_ante_vol'] is not None:
+            logger.info(f"   🧮 Vol ex-ante:     {summary['ex_ante_vol']:.1%} | Realizada: {summary['realized_vol']:.1%}")
+        logger.info(f"   🔄 Rebalanceos:     {rebalances} | Turnover anual: {summary['annual_turnover']:.1f}x")
+        logger.info(f"   💸 Costes:          {summary['total_cost_pct']:.2f}% ({self.cost_bps:.0f} bps)")
+        logger.info("="*60)
+
+        return {**summary, 'equity': sim['equity']}
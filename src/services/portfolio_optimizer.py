@@ -3,102 +3,185 @@ import numpy as np
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 import logging
-from datetime import datetime
+from typing import Optional
+from datetime import datetime, timedelta
 from ..models.sp500 import Company
 from ..models.predictions import MLPrediction, BacktestResult, PortfolioRecommendation
+from .market_data import load_prices
+from .mean_variance import MeanVarianceSolver
+from .risk_model import RiskModelStore
 
 logger = logging.getLogger(__name__)
 
 class PortfolioOptimizer:
-    def optimize_portfolio(self, db: Session, top_signals: int = 20):
-        """Kelly Criterion + Sharpe + Diversificación"""
-        
-        logger.info(f"💼 Optimizando portfolio TOP {top_signals} señales...")
-
-        top_stocks = db.execute(text("""
-            SELECT 
-                c.ticker, 
-                c.sector, 
+    def __init__(self, max_weight: float = 0.15, sector_cap: float = 0.25,
+                 lookback_days: int = 365, shrinkage: float = 0.2,
+                 risk_free: float = 0.0, min_history: int = 60,
+                 risk_store: Optional[RiskModelStore] = None,
+                 diversify_by: str = 'sector', prior_return: float = 0.06, max_ic: float = 0.1):
+        if diversify_by not in ('sector', 'cluster'):
+            raise ValueError(f"diversify_by inválido: {diversify_by}")
+        self.solver = MeanVarianceSolver(max_weight=max_weight, group_cap=sector_cap)
+        self.diversify_by = diversify_by
+        self.risk_store = risk_store or RiskModelStore(shrinkage=shrinkage)
+        self.lookback_days = lookback_days
+        self.shrinkage = shrinkage
+        self.risk_free = risk_free
+        self.min_history = min_history
+        self.prior_return = prior_return
+        self.max_ic = max_ic
+
+    def _load_universe(self, db: Session) -> pd.DataFrame:
+        """Última predicción ML de TODAS las empresas activas (+ último backtest)"""
+        rows = db.execute(text("""
+            SELECT
+                c.id as company_id,
+                c.ticker,
+                c.sector,
                 c.name,
-                p.ml_score, 
-                p.pred_price_1d, 
+                p.ml_score,
+                p.pred_price_1d,
+                p.pred_price_5d,
                 p.confidence_1d,
                 b.total_return as backtest_roi
             FROM ml_predictions p
             JOIN companies c ON p.company_id = c.id
-            LEFT JOIN backtest_results b ON (p.company_id = b.company_id AND b.strategy = 'ML_Momentum')
-            WHERE p.ml_score > 0.65  -- Solo señales fuertes
+            LEFT JOIN backtest_results b ON b.id = (
+                SELECT MAX(b2.id) FROM backtest_results b2
+                WHERE b2.company_id = p.company_id AND b2.strategy = 'ML_Momentum'
+            )
+            WHERE c.is_active = 1
+            AND p.ml_score IS NOT NULL
             AND p.prediction_date = (SELECT MAX(prediction_date) FROM ml_predictions WHERE company_id = p.company_id)
-            ORDER BY p.ml_score DESC
-            LIMIT :limit
-        """), {'limit': top_signals}).fetchall()
-        
-        if len(top_stocks) < 5:
-            logger.warning(f"⚠️ Solo {len(top_stocks)} señales válidas")
+        """)).fetchall()
+
+        columns = ['company_id', 'ticker', 'sector', 'name', 'ml_score', 'pred_price', 'pred_price_5d',
+                   'confidence', 'backtest_roi']
+        df = pd.DataFrame(rows, columns=columns).drop_duplicates('company_id', keep='last')
+        for col in ['ml_score', 'pred_price', 'pred_price_5d', 'confidence', 'backtest_roi']:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        df['confidence'] = df['confidence'].fillna(0.5)
+        df['backtest_roi'] = df['backtest_roi'].fillna(0.0)
+        df['sector'] = df['sector'].fillna('N/A')
+        return df.set_index('company_id')
+
+    def _close_matrix(self, db: Session, company_ids) -> pd.DataFrame:
+        """Matriz fecha × empresa de cierres diarios (ventana lookback_days)"""
+        start_date = datetime.now().date() - timedelta(days=self.lookback_days)
+        df_prices = load_prices(db, list(company_ids), start_date)
+        closes = df_prices.pivot_table(index='price_date', columns='company_id', values='close').sort_index()
+        return closes
+
+    def _covariance(self, returns: pd.DataFrame) -> np.ndarray:
+        """Covarianza anualizada: risk model EWMA (mmap) o muestral con shrinkage"""
+        cov = self.risk_store.covariance(returns.columns.tolist())
+        if cov is not None:
+            logger.info("🧮 Covarianza desde risk model EWMA")
+            return cov
+        sample = np.cov(returns.fillna(0.0).to_numpy(), rowvar=False) * 252
+        target = np.diag(np.diag(sample))
+        return (1 - self.shrinkage) * sample + self.shrinkage * target
+
+    def expected_returns(self, universe: pd.DataFrame, last_close: pd.Series,
+                         volatility: pd.Series) -> pd.Series:
+        """Retorno anual esperado calibrado (Grinold: alpha = IC × σ × z) sobre un prior común.
+        z: z-score transversal del cambio predicho (5d si existe, si no 1d), acotado a ±3.
+        IC: habilidad direccional (2·confianza - 1) limitada a max_ic. Anualizar el cambio
+        de 1 día (×252) convertía el error del modelo en retornos que solo frenaba el clip."""
+        close = last_close.reindex(universe.index)
+        change = (universe['pred_price_5d'] / close - 1).fillna(universe['pred_price'] / close - 1)
+        spread = change.std()
+        z = ((change - change.mean()) / spread if spread > 0 else change * 0.0).clip(-3, 3)
+        ic = (2 * universe['confidence'] - 1).clip(0.0, self.max_ic)
+        mu = self.prior_return + ic * volatility.reindex(universe.index) * z
+        return mu.clip(-0.5, 1.0).fillna(self.prior_return)
+
+    def _groups(self, db: Session, universe: pd.DataFrame) -> np.ndarray:
+        """Buckets de diversificación: sector GICS o cluster de correlación"""
+        if self.diversify_by == 'cluster':
+            from .correlation import CorrelationEngine
+            labels = CorrelationEngine().cluster_labels(db, universe.index.tolist())
+            return pd.factorize(labels.reindex(universe.index))[0]
+        return pd.factorize(universe['sector'])[0]
+
+    def _solve(self, mu: np.ndarray, cov: np.ndarray, groups: np.ndarray) -> dict:
+        """Punto de máximo Sharpe ex-ante de la frontera eficiente"""
+        frontier = self.solver.efficient_frontier(mu, cov, groups, risk_free=self.risk_free)
+        return max(frontier, key=lambda p: p['sharpe'])
+
+    def optimize_portfolio(self, db: Session, top_signals: int = 20):
+        """Mean-variance (frontera eficiente) long-only + caps por sector y posición"""
+
+        logger.info(f"💼 Optimizando portfolio (máx {top_signals} posiciones)...")
+
+        universe = self._load_universe(db)
+        if len(universe) < 5:
+            logger.warning(f"⚠️ Solo {len(universe)} señales válidas")
             return None
 
-        columns = ['ticker', 'sector', 'name', 'ml_score', 'pred_price', 'confidence', 'backtest_roi']
-        df_portfolio = pd.DataFrame(top_stocks, columns=columns)
+        closes = self._close_matrix(db, universe.index)
+        returns = closes.pct_change(fill_method=None).iloc[1:]
+        history = returns.notna().sum()
+        valid = history[history >= self.min_history].index
+        universe = universe.loc[universe.index.isin(valid) & universe['pred_price'].notna()]
+        if len(universe) < 5:
+            logger.warning(f"⚠️ Solo {len(universe)} empresas con historial suficiente")
+            return None
 
-        numeric_cols = ['ml_score', 'pred_price', 'confidence', 'backtest_roi']
-        for col in numeric_cols:
-            df_portfolio[col] = pd.to_numeric(df_portfolio[col], errors='coerce').fillna(0.5)
+        returns = returns[universe.index]
+        cov = self._covariance(returns)
+        universe['expected_return'] = self.expected_returns(
+            universe, closes.ffill().iloc[-1], pd.Series(np.sqrt(np.diag(cov)), index=universe.index))
+        groups = self._groups(db, universe)
+        mu = universe['expected_return'].to_numpy()
 
-        df_portfolio['backtest_roi'] = df_portfolio['backtest_roi'].fillna(0.12)
-        df_portfolio['combined_score'] = (
-            df_portfolio['ml_score'] * 0.5 +
-            df_portfolio['confidence'] * 0.3 +
-            (df_portfolio['backtest_roi'] / 100) * 0.2
-        )
+        logger.info(f"🧮 Universo: {len(universe)} empresas | {groups.max() + 1} grupos ({self.diversify_by})")
+        best = self._solve(mu, cov, groups)
+
+        held = np.flatnonzero(best['weights'] > 1e-4)
+        if len(held) > top_signals:
+            # Demasiadas posiciones: re-optimiza sobre las mayores
+            keep = held[np.argsort(best['weights'][held])[::-1][:top_signals]]
+            keep.sort()
+            sub_groups = pd.factorize(groups[keep])[0]
+            sub_best = self._solve(mu[keep], cov[np.ix_(keep, keep)], sub_groups)
+            weights = np.zeros(len(mu))
+            weights[keep] = sub_best['weights']
+            best = {**sub_best, 'weights': weights}
+
+        weights = np.where(best['weights'] > 1e-4, best['weights'], 0.0)
+        weights = weights / weights.sum()
+        port_return = float(mu @ weights)
+        port_var = float(weights @ cov @ weights)
+        port_vol = np.sqrt(max(port_var, 0.0))
+        portfolio_sharpe = (port_return - self.risk_free) / port_vol if port_vol > 0 else 0.0
+        # Kelly continuo del portfolio óptimo (apalancamiento = mu / sigma²)
+        kelly = min(max(port_return / port_var, 0.0), 99.0) if port_var > 0 else 0.0
+        asset_vol = np.sqrt(np.diag(cov))
 
-        sector_weights = df_portfolio.groupby('sector')['combined_score'].sum()
-        total_sector_weight = sector_weights.sum()
-        sector_allocation = {}
-        for sector, weight in sector_weights.items():
-            sector_allocation[sector] = min(0.25, weight / total_sector_weight)
-        
-        recommendations = []
-        for _, stock in df_portfolio.head(12).iterrows(): 
-            expected_return = max(0.05, stock['backtest_roi'] / 100)
-            
-            p_win = stock['ml_score']
-            
-            if expected_return == 0:
-                kelly_fraction = 0.02
-            else:
-                b = (1 + expected_return) / expected_return 
-                kelly_fraction = (p_win * b - (1 - p_win)) / b
-                kelly_fraction = max(0.02, min(0.18, kelly_fraction)) 
-            
-            sector_alloc = sector_allocation.get(stock['sector'], 0.08)
-            final_weight = kelly_fraction * sector_alloc
-            
-            recommendations.append({
+        universe['weight'] = weights
+        universe['volatility'] = asset_vol
+        selected = universe[universe['weight'] > 0].sort_values('weight', ascending=False)
+
+        final_recommendations = []
+        for _, stock in selected.iterrows():
+            final_recommendations.append({
                 'ticker': stock['ticker'],
                 'name': stock['name'][:25] + '...' if len(stock['name']) > 25 else stock['name'],
                 'sector': stock['sector'],
                 'ml_score': float(stock['ml_score']),
                 'confidence': float(stock['confidence']),
                 'backtest_roi': float(stock['backtest_roi']),
-                'weight': float(final_weight),
-                'position_size': f"{final_weight*100:.1f}%",
-                'kelly_fraction': float(kelly_fraction),
-                'expected_return_pct': expected_return * 100
+                'weight': float(stock['weight']),
+                'position_size': f"{stock['weight']*100:.1f}%",
+                'expected_return_pct': float(stock['expected_return'] * 100),
+                'volatility_pct': float(stock['volatility'] * 100)
             })
 
-        total_weight = sum(rec['weight'] for rec in recommendations)
-        final_recommendations = [
-            {**rec, 'weight': rec['weight'] / total_weight}
-            for rec in recommendations[:10]
-        ]
-        
-        portfolio_sharpe = 1.75  
-        avg_kelly = np.mean([r['kelly_fraction'] for r in final_recommendations])
-        
         portfolio_rec = PortfolioRecommendation(
             total_recommended_positions=len(final_recommendations),
-            expected_sharpe=float(portfolio_sharpe),
-            kelly_fraction=float(avg_kelly),
+            expected_sharpe=float(np.clip(portfolio_sharpe, -99, 99)),
+            kelly_fraction=float(kelly),
             recommendations=[{
                 'ticker': r['ticker'],
                 'weight': float(r['weight']),
@@ -107,21 +190,22 @@ class PortfolioOptimizer:
         )
         db.add(portfolio_rec)
         db.commit()
-        
+
         logger.info("\n" + "="*70)
-        logger.info("💼 PORTFOLIO OPTIMIZADO (Kelly + Sharpe)")
+        logger.info("💼 PORTFOLIO OPTIMIZADO (Mean-Variance, máximo Sharpe)")
         logger.info("="*70)
         logger.info(f"   📊 Posiciones: {len(final_recommendations)}")
-        logger.info(f"   ⚡ Sharpe estimado: {portfolio_sharpe:.2f}")
-        logger.info(f"   🎯 Kelly promedio: {avg_kelly:.1%}")
+        logger.info(f"   📈 Retorno esperado: {port_return:.1%} | Volatilidad: {port_vol:.1%}")
+        logger.info(f"   ⚡ Sharpe ex-ante: {portfolio_sharpe:.2f}")
+        logger.info(f"   🎯 Kelly (apalancamiento óptimo): {kelly:.2f}x")
         logger.info(f"   🎲 Diversificación: {len(set(r['sector'] for r in final_recommendations))} sectores")
         logger.info("="*70)
-        
+
         for i, rec in enumerate(final_recommendations, 1):
             logger.info(f"{i:2d}. 🟢 {rec['ticker']:6} {rec['position_size']:>7} "
                        f"ML:{rec['ml_score']:.3f} {rec['sector']:12} "
-                       f"K:{rec['kelly_fraction']:.0%}")
-        
+                       f"E[r]:{rec['expected_return_pct']:+.0f}% σ:{rec['volatility_pct']:.0f}%")
+
         logger.info("="*70)
-        
+
         return final_recommendations
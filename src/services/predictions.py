@@ -3,27 +3,29 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func, desc, and_
 from ..models.sp500 import Company
 from ..models.predictions import TradingSignal, TechnicalIndicator
-from ..core.database import Base, engine
-from .indicators import calculate_indicators
+from ..core.instrumentation import profiler
 
 logger = logging.getLogger(__name__)
 
-def ensure_tables_exist():
-    """✅ Garantiza que tablas existan"""
-    Base.metadata.create_all(bind=engine)
-
 def generate_trading_signals(db: Session, top_n: int = 10):
-    """Genera señales con chequeo de tablas"""
-    ensure_tables_exist()
+    """Genera señales (el esquema lo garantiza ensure_schema al arrancar)"""
+    from .indicators import calculate_indicators
+    from .result_writer import ResultWriter, write_rows
     
     companies = db.query(Company).filter(Company.is_active == True).limit(50).all()
     
-    for company in companies:
-        try:
-            calculate_indicators(db, company.id)
-        except Exception as e:
-            logger.warning(f"⚠️ Skip {company.ticker}: {str(e)[:40]}")
-            continue
+    # Los indicadores se escriben en segundo plano; close() vacía la cola antes de leerlos
+    with ResultWriter.for_session(db) as writer:
+        for company in companies:
+            try:
+                with profiler.ticker(company.ticker):
+                    calculate_indicators(db, company.id, writer=writer)
+            except Exception as e:
+                logger.warning(f"⚠️ Skip {company.ticker}: {str(e)[:40]}")
+                continue
+    # El writer confirma desde otra sesión: cerrar la transacción de `db` para que su
+    # snapshot (REPEATABLE READ en MySQL, abierto en la query de Company) vea los indicadores
+    db.commit()
     signals = []
     recent_indicators = db.query(
         TechnicalIndicator.company_id,
@@ -43,16 +45,15 @@ def generate_trading_signals(db: Session, top_n: int = 10):
     for ind in indicators:
         action = "BUY" if ind.momentum_score > 0.7 else "SELL" if ind.momentum_score < 0.3 else "HOLD"
         
-        signal = TradingSignal(
-            company_id=ind.company_id,
-            signal_date=ind.indicator_date,
-            action=action,
-            score=float(ind.momentum_score),
-            confidence=0.75
-        )
-        db.add(signal)
-        signals.append(signal)
+        signals.append({
+            'company_id': ind.company_id,
+            'signal_date': ind.indicator_date,
+            'action': action,
+            'score': float(ind.momentum_score),
+            'confidence': 0.75
+        })
     
+    write_rows(db, TradingSignal, signals)
     db.commit()
     logger.info(f"🎯 {len(signals)} señales generadas")
     return signals
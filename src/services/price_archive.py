@@ -0,0 +1,204 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+import json
+import logging
+import os
+import threading
+import time
+from ..core.config import settings
+from .table_stats import record_delete
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['company_id', 'price_date', 'open', 'high', 'low', 'close', 'volume']
+
+_lock = threading.Lock()
+_manifests: Dict[str, tuple] = {}   # root -> (mtime, manifest)
+_years: Dict[str, tuple] = {}       # ruta -> (mtime, frame)
+
+
+def _root(root: Optional[str] = None) -> Path:
+    return Path(root or settings.PRICE_ARCHIVE_DIR)
+
+
+def _manifest(root: Path) -> Optional[dict]:
+    """manifest.json cacheado por mtime (1 stat por llamada)"""
+    path = root / "manifest.json"
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    with _lock:
+        cached = _manifests.get(str(root))
+        if cached is None or cached[0] != mtime:
+            manifest = json.loads(path.read_text())
+            manifest['cutoff'] = date.fromisoformat(manifest['cutoff'])
+            cached = _manifests[str(root)] = (mtime, manifest)
+    return cached[1]
+
+
+def archive_cutoff(root: Optional[str] = None) -> Optional[date]:
+    """Fecha a partir de la cual los precios viven en prices_daily (antes: archivo)"""
+    manifest = _manifest(_root(root))
+    return manifest['cutoff'] if manifest else None
+
+
+def _read_year(path: Path) -> pd.DataFrame:
+    mtime = path.stat().st_mtime
+    with _lock:
+        cached = _years.get(str(path))
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with np.load(path) as data:
+        frame = pd.DataFrame({
+            'company_id': data['company_id'].astype(np.int64),
+            'price_date': pd.to_datetime(data['price_date']).date,
+            'open': data['open'], 'high': data['high'], 'low': data['low'], 'close': data['close'],
+            'volume': data['volume'].astype(float),
+        })
+    with _lock:
+        _years[str(path)] = (mtime, frame)
+    return frame
+
+
+def read_archived(company_ids: Sequence[int], start_date: Optional[date] = None,
+                  end_date: Optional[date] = None, root: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Precios archivados del rango (mismo formato que load_prices); None si el rango es todo 'caliente'"""
+    base = _root(root)
+    manifest = _manifest(base)
+    if manifest is None or (start_date is not None and start_date >= manifest['cutoff']):
+        return None
+
+    first = start_date.year if start_date is not None else min(map(int, manifest['years']), default=0)
+    last = min(end_date or manifest['cutoff'], manifest['cutoff']).year
+    ids = list(company_ids)
+    parts = []
+    for year in sorted(map(int, manifest['years'])):
+        if not first <= year <= last:
+            continue
+        df = _read_year(base / f"prices_{year}.npz")
+        # Mismo criterio que la tabla caliente en load_prices: sin close no es un precio usable
+        mask = df['company_id'].isin(ids) & df['close'].notna()
+        if start_date is not None:
+            mask &= df['price_date'] >= start_date
+        if end_date is not None:
+            mask &= df['price_date'] <= end_date
+        parts.append(df.loc[mask])
+    if not parts:
+        return None
+    return pd.concat(parts, ignore_index=True)
+
+
+class PriceArchive:
+    """Archiva prices_daily anterior a un horizonte en ficheros columnares por año (.npz
+    comprimido) y los borra de la tabla caliente. load_prices los sigue leyendo."""
+
+    def __init__(self, root: Optional[str] = None, horizon_days: Optional[int] = None):
+        self.root = _root(root)
+        self.horizon_days = horizon_days or settings.PRICE_ARCHIVE_DAYS
+
+    def _write_year(self, year: int, new: pd.DataFrame) -> int:
+        """Fusiona con el fichero existente del año (re-ejecutable) y escribe de forma atómica"""
+        path = self.root / f"prices_{year}.npz"
+        if path.exists():
+            new = pd.concat([_read_year(path), new], ignore_index=True)
+        frame = (new.drop_duplicates(['company_id', 'price_date'], keep='last')
+                 .sort_values(['company_id', 'price_date'], ignore_index=True))
+        tmp = path.with_name(path.stem + ".tmp.npz")
+        np.savez_compressed(
+            tmp,
+            company_id=frame['company_id'].to_numpy(dtype=np.int32),
+            price_date=np.asarray(pd.to_datetime(frame['price_date']).values, dtype='datetime64[D]'),
+            open=frame['open'].to_numpy(dtype=np.float64),
+            high=frame['high'].to_numpy(dtype=np.float64),
+            low=frame['low'].to_numpy(dtype=np.float64),
+            close=frame['close'].to_numpy(dtype=np.float64),
+            volume=frame['volume'].to_numpy(dtype=np.float64),  # float: conserva NULL como NaN
+        )
+        os.replace(tmp, path)
+        return len(frame)
+
+    def _write_manifest(self, cutoff: date, years: Dict[str, int]):
+        path = self.root / "manifest.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({'cutoff': cutoff.isoformat(), 'years': years}, indent=2))
+        os.replace(tmp, path)
+
+    def run(self, db: Session, compact: bool = False) -> dict:
+        """Mueve al archivo los precios < hoy - horizonte, año a año (fichero primero, DELETE
+        después: si se corta a mitad, re-ejecutar no pierde ni duplica filas)"""
+        cutoff = date.today() - timedelta(days=self.horizon_days)
+        previous = archive_cutoff(str(self.root))
+        if previous is not None and previous > cutoff:
+            cutoff = previous  # el horizonte nunca retrocede: lo archivado no vuelve a la tabla
+
+        oldest = db.execute(text("SELECT MIN(price_date) FROM prices_daily")).scalar()
+        manifest = _manifest(self.root)
+        years = dict(manifest['years']) if manifest else {}
+        if oldest is None or pd.Timestamp(oldest).date() >= cutoff:
+            logger.info(f"🧊 Archivo: nada anterior a {cutoff}")
+            if manifest is None:
+                self.root.mkdir(parents=True, exist_ok=True)
+                self._write_manifest(cutoff, years)
+            return {'archived': 0, 'deleted': 0, 'cutoff': cutoff}
+
+        self.root.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        archived = deleted = 0
+        for year in range(pd.Timestamp(oldest).year, cutoff.year + 1):
+            start, end = date(year, 1, 1), min(date(year + 1, 1, 1), cutoff)
+            rows = db.execute(text("""
+                SELECT company_id, price_date, open, high, low, close, volume
+                FROM prices_daily
+                WHERE price_date >= :start AND price_date < :end
+            """), {'start': start, 'end': end}).fetchall()
+            if not rows:
+                continue
+            # Todas las filas (también close NULL): el DELETE mensual borra el rango entero
+            frame = pd.DataFrame(rows, columns=COLUMNS)
+            for col in ['open', 'high', 'low', 'close', 'volume']:
+                frame[col] = pd.to_numeric(frame[col], errors='coerce').astype(float)
+            frame['price_date'] = pd.to_datetime(frame['price_date']).dt.date
+
+            years[str(year)] = self._write_year(year, frame)
+            # El manifest se publica antes del DELETE: los lectores ya ven el año en el archivo
+            self._write_manifest(cutoff, years)
+            archived += len(frame)
+
+            # DELETE por meses: transacciones acotadas en la tabla caliente
+            month = start
+            while month < end:
+                following = (pd.Timestamp(month) + pd.offsets.MonthBegin(1)).date()
+                removed = db.execute(text("""
+                    DELETE FROM prices_daily WHERE price_date >= :start AND price_date < :end
+                """), {'start': month, 'end': min(following, end)}).rowcount
+                record_delete(db, 'prices_daily', removed, before=min(following, end))
+                db.commit()
+                deleted += removed
+                month = following
+            logger.info(f"🧊 {year}: {len(frame):,} filas archivadas ({years[str(year)]:,} en fichero)")
+
+        self._write_manifest(cutoff, years)
+        if compact:
+            self.compact(db)
+        elapsed = time.perf_counter() - started
+        logger.info(f"✅ Archivo < {cutoff}: {archived:,} filas -> {self.root} | "
+                    f"{deleted:,} borradas de prices_daily en {elapsed:.1f}s")
+        return {'archived': archived, 'deleted': deleted, 'cutoff': cutoff}
+
+    def compact(self, db: Session):
+        """Recupera espacio y reconstruye índices tras el borrado masivo"""
+        dialect = db.get_bind().dialect.name
+        if dialect == 'mysql':
+            db.execute(text("OPTIMIZE TABLE prices_daily"))
+            db.commit()
+        elif dialect == 'sqlite':
+            db.commit()
+            with db.get_bind().connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+        logger.info("🗜️ prices_daily compactada")
@@ -0,0 +1,221 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime, timedelta
+from typing import Optional
+from urllib.parse import urlsplit, unquote
+import hashlib
+import json
+import logging
+import threading
+from ..core.database import SessionLocal
+from ..models.sp500 import Company
+from ..models.predictions import PortfolioRecommendation
+from .predictions import get_top_signals
+from .table_stats import read_stats
+
+logger = logging.getLogger(__name__)
+
+
+def _num(value):
+    return None if value is None else float(value)
+
+
+def _encode(payload) -> tuple:
+    """JSON compacto + ETag fuerte (hash del cuerpo)"""
+    body = json.dumps(payload, separators=(',', ':'), default=str).encode()
+    return body, '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+
+
+class ReadSnapshot:
+    """Respuestas pre-serializadas (path -> (body, etag)); inmutable una vez construida"""
+
+    def __init__(self, responses: dict, watermark: str):
+        self.responses = responses
+        self.watermark = watermark
+        self.built_at = datetime.utcnow()
+
+
+class ReadAPI:
+    """API HTTP/JSON de solo lectura servida desde un snapshot en memoria (sin MySQL por request)"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8050, top_signals: int = 50,
+                 history_days: int = 365, session_factory=SessionLocal):
+        self.host = host
+        self.port = port
+        self.top_signals = top_signals
+        self.history_days = history_days
+        self.session_factory = session_factory
+        self.snapshot: Optional[ReadSnapshot] = None
+        self._server = None
+        self._lock = threading.Lock()
+
+    # ---------- snapshot ----------
+
+    @staticmethod
+    def watermark(db: Session) -> str:
+        """Cambia cuando el pipeline escribe señales, predicciones, portfolios o precios"""
+        row = db.execute(text("""
+            SELECT
+                (SELECT MAX(id) FROM trading_signals),
+                (SELECT MAX(id) FROM ml_predictions),
+                (SELECT MAX(id) FROM portfolio_recommendations),
+                (SELECT MAX(id) FROM prices_daily)
+        """)).fetchone()
+        return ":".join(str(v or 0) for v in row)
+
+    def _build(self, db: Session) -> ReadSnapshot:
+        from .market_data import load_prices, load_ml_signals
+
+        responses = {}
+        signals = [{
+            'ticker': company.ticker,
+            'name': company.name,
+            'sector': company.sector,
+            'signal_date': signal.signal_date,
+            'action': signal.action,
+            'score': _num(signal.score),
+            'confidence': _num(signal.confidence),
+        } for signal, company in get_top_signals(db, limit=self.top_signals)]
+        responses['/signals'] = _encode(signals)
+
+        rows = db.execute(text("""
+            SELECT c.ticker, c.name, c.sector, p.prediction_date,
+                   p.pred_price_1d, p.pred_price_5d, p.confidence_1d, p.ml_score
+            FROM ml_predictions p
+            JOIN companies c ON c.id = p.company_id
+            WHERE p.id = (SELECT MAX(p2.id) FROM ml_predictions p2
+                          WHERE p2.company_id = p.company_id
+                          AND p2.prediction_date = (SELECT MAX(prediction_date) FROM ml_predictions
+                                                    WHERE company_id = p.company_id))
+            ORDER BY p.ml_score DESC
+        """)).fetchall()
+        predictions = [{
+            'ticker': r[0], 'name': r[1], 'sector': r[2], 'prediction_date': r[3],
+            'pred_price_1d': _num(r[4]), 'pred_price_5d': _num(r[5]),
+            'confidence_1d': _num(r[6]), 'ml_score': _num(r[7]),
+        } for r in rows]
+        responses['/predictions'] = _encode(predictions)
+        for p in predictions:
+            responses[f"/predictions/{p['ticker']}"] = _encode(p)
+
+        portfolio = db.query(PortfolioRecommendation).order_by(PortfolioRecommendation.id.desc()).first()
+        responses['/portfolio'] = _encode(None if portfolio is None else {
+            'id': portfolio.id,
+            'created_at': portfolio.created_at,
+            'positions': portfolio.total_recommended_positions,
+            'expected_sharpe': _num(portfolio.expected_sharpe),
+            'kelly_fraction': _num(portfolio.kelly_fraction),
+            'recommendations': portfolio.recommendations,
+        })
+
+        # Historial por ticker: 2 queries set-based, particionadas en memoria
+        companies = dict(db.query(Company.id, Company.ticker).filter(Company.is_active == True).all())
+        start_date = datetime.now().date() - timedelta(days=self.history_days)
+        df_prices = load_prices(db, list(companies), start_date)
+        df_signals = load_ml_signals(db, list(companies), start_date)
+        signals_by_company = dict(tuple(df_signals.groupby('company_id')))
+        for company_id, prices in df_prices.groupby('company_id'):
+            preds = signals_by_company.get(company_id)
+            responses[f"/history/{companies[company_id]}"] = _encode({
+                'ticker': companies[company_id],
+                'dates': [str(d) for d in prices['price_date']],
+                'close': prices['close'].round(4).tolist(),
+                'predictions': [] if preds is None else [{
+                    'date': str(d), 'pred_price_1d': _num(pp), 'ml_score': _num(s)
+                } for d, s, pp in zip(preds['signal_date'], preds['ml_score'], preds['pred_price_1d'])],
+            })
+
+        watermark = self.watermark(db)
+        responses['/health'] = _encode({
+            'watermark': watermark,
+            'built_at': datetime.utcnow(),
+            'tickers': len(companies),
+            'tables': {table: {'rows': entry['rows'], 'reconciled_at': entry['reconciled_at']}
+                       for table, entry in read_stats(db).items()},
+            'endpoints': ['/signals', '/predictions', '/predictions/<ticker>',
+                          '/portfolio', '/history/<ticker>', '/health'],
+        })
+        return ReadSnapshot(responses, watermark)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reconstruye el snapshot si cambió la marca de agua -> True si se reemplazó"""
+        with self._lock:
+            db = self.session_factory()
+            try:
+                if not force and self.snapshot is not None and self.watermark(db) == self.snapshot.watermark:
+                    return False
+                snapshot = self._build(db)
+            finally:
+                db.close()
+            self.snapshot = snapshot
+        logger.info(f"📡 Snapshot API: {len(snapshot.responses)} recursos (marca {snapshot.watermark})")
+        return True
+
+    # ---------- HTTP ----------
+
+    def start(self):
+        """Sirve en un thread de fondo (el daemon lo embebe)"""
+        if self.snapshot is None:
+            self.refresh(force=True)
+        self._server = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._server.api = self
+        threading.Thread(target=self._server.serve_forever, name="read-api", daemon=True).start()
+        logger.info(f"📡 API de lectura en http://{self.host}:{self.port}")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def serve_forever(self, refresh_seconds: float = 60.0):
+        """Modo standalone: sondea la marca de agua y refresca tras cada corrida del pipeline"""
+        self.start()
+        stop = threading.Event()
+        try:
+            while not stop.wait(refresh_seconds):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logger.warning(f"⚠️ Refresco del snapshot falló: {e}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "sp500-api/1.0"
+
+    def do_GET(self):
+        snapshot = self.server.api.snapshot
+        path = unquote(urlsplit(self.path).path).rstrip('/') or '/health'
+        parts = path.split('/')
+        if len(parts) == 3:
+            path = f"/{parts[1]}/{parts[2].upper()}"
+        entry = snapshot.responses.get(path) if snapshot else None
+        if entry is None:
+            body, _ = _encode({'error': f"no encontrado: {path}"})
+            self._send(404, body)
+            return
+
+        body, etag = entry
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, b"", headers)
+        else:
+            self._send(200, body, headers)
+
+    def _send(self, status: int, body: bytes, headers: Optional[dict] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
@@ -0,0 +1,269 @@
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import insert, update, tuple_, bindparam, UniqueConstraint
+from collections import OrderedDict
+from typing import Optional, Sequence
+import logging
+import queue
+import threading
+import time
+from ..core.instrumentation import profiler
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+_STOP = object()
+
+
+NATIVE_CHUNK = 1000
+
+
+def _unique_keys(table) -> set:
+    """Conjuntos de columnas con unicidad garantizada (PK, UNIQUE, índices únicos)"""
+    keys = {frozenset(c.name for c in table.primary_key.columns)}
+    keys.update(frozenset(c.name for c in uc.columns)
+                for uc in table.constraints if isinstance(uc, UniqueConstraint))
+    keys.update(frozenset(c.name for c in ix.columns) for ix in table.indexes if ix.unique)
+    return keys
+
+
+def upsert_statement(db: Session, model, key: Sequence[str], columns: Sequence[str],
+                     on_conflict: str = 'ignore'):
+    """INSERT nativo que resuelve el conflicto en el motor (sin SELECT previo), o None si el
+    dialecto no lo soporta o `key` no está respaldada por una restricción única.
+    MySQL: ON DUPLICATE KEY UPDATE (en 'ignore', reasignando la clave: no-op; INSERT IGNORE
+    convertiría también truncados, NULL en NOT NULL o FK rotas en warnings silenciosos).
+    SQLite: ON CONFLICT DO NOTHING / DO UPDATE."""
+    table = model.__table__
+    dialect = db.get_bind().dialect.name
+    if dialect not in ('mysql', 'sqlite') or frozenset(key) not in _unique_keys(table):
+        return None
+
+    # ON CONFLICT/ON DUPLICATE no aplica onupdate de la columna: se toma del valor insertado
+    updates = [c for c in columns if c not in key]
+    updates += [c.name for c in table.columns if c.onupdate is not None and c.name not in columns]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        if on_conflict == 'update' and updates:
+            return stmt.on_duplicate_key_update({c: stmt.inserted[c] for c in updates})
+        return stmt.on_duplicate_key_update({key[0]: stmt.inserted[key[0]]})
+
+    from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+    stmt = sqlite_insert(table)
+    if on_conflict == 'update' and updates:
+        return stmt.on_conflict_do_update(index_elements=list(key),
+                                          set_={c: stmt.excluded[c] for c in updates})
+    return stmt.on_conflict_do_nothing(index_elements=list(key))
+
+
+def _execute_native(db: Session, statements: dict, groups: dict) -> int:
+    affected = 0
+    for columns, group in groups.items():
+        for start in range(0, len(group), NATIVE_CHUNK):
+            chunk = group[start:start + NATIVE_CHUNK]
+            rowcount = db.connection().execute(statements[columns], chunk).rowcount
+            affected += rowcount if rowcount is not None and rowcount >= 0 else len(chunk)
+    return affected
+
+
+def _write_native(db: Session, model, rows: list, key: Sequence[str], on_conflict: str,
+                  count_inserts: bool = False) -> Optional[tuple]:
+    """executemany del upsert nativo por grupos de columnas homogéneas -> (escritas, insertadas)
+    o None si no aplica. SQLite cuenta las insertadas por rowcount (en 'update', solo con
+    count_inserts: pasada DO NOTHING previa). MySQL no puede: con CLIENT_FOUND_ROWS (siempre
+    activo en SQLAlchemy) un duplicado cuenta 1 como una inserción; se restan las claves ya
+    existentes (SELECT previo en la transacción; aproximado si otro escritor inserta las mismas
+    claves a la vez)."""
+    groups: "OrderedDict[tuple, list]" = OrderedDict()
+    for row in rows:
+        groups.setdefault(tuple(row), []).append(row)
+    statements = {}
+    for columns in groups:
+        stmt = upsert_statement(db, model, key, columns, on_conflict)
+        if stmt is None:
+            return None
+        statements[columns] = stmt
+
+    if db.get_bind().dialect.name == 'mysql':
+        inserted = None
+        if on_conflict != 'update' or count_inserts:
+            inserted = len(rows) - len(_existing_keys(db, model, [tuple(r[k] for k in key) for r in rows], key))
+        _execute_native(db, statements, groups)
+        return (inserted, inserted) if on_conflict != 'update' else (len(rows), inserted)
+
+    if on_conflict != 'update':
+        inserted = _execute_native(db, statements, groups)
+        return inserted, inserted
+    inserted = None
+    if count_inserts:
+        ignore = {columns: upsert_statement(db, model, key, columns) for columns in groups}
+        inserted = _execute_native(db, ignore, groups)
+    _execute_native(db, statements, groups)
+    return len(rows), inserted
+
+
+def write_rows(db: Session, model, rows: Sequence[dict], key: Sequence[str] = (),
+               on_conflict: str = 'ignore', stage: Optional[str] = None) -> int:
+    """Escritura multi-fila de una tabla. Con key respaldada por una restricción única en
+    MySQL/SQLite: upsert nativo en executemany. Si no: 1 SELECT de claves existentes +
+    INSERT multi-fila (+ UPDATE executemany si on_conflict='update'); esta ruta NO es
+    atómica (un escritor concurrente puede insertar la misma clave entre el SELECT y el
+    INSERT). Sin key: INSERT directo. Actualiza table_stats si la tabla está seguida.
+    No hace commit."""
+    if not rows:
+        return 0
+    from .table_stats import TRACKED, record_write
+    tracked = model.__tablename__ in TRACKED
+    if not key:
+        db.execute(insert(model), list(rows))
+        written = inserted = len(rows)
+    else:
+        written, inserted = _write_keyed(db, model, rows, key, on_conflict, tracked)
+    if tracked:
+        record_write(db, model.__tablename__, rows, inserted, stage)
+    return written
+
+
+def _existing_keys(db: Session, model, keys: Sequence[tuple], key: Sequence[str]) -> set:
+    """Claves del lote que ya están en la tabla (SELECT por bloques de 500)"""
+    columns = [getattr(model, k) for k in key]
+    existing = set()
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        condition = tuple_(*columns).in_(chunk) if len(key) > 1 else columns[0].in_([k[0] for k in chunk])
+        existing.update(tuple(row) for row in db.query(*columns).filter(condition).all())
+    return existing
+
+
+def _write_keyed(db: Session, model, rows: Sequence[dict], key: Sequence[str],
+                 on_conflict: str, count_inserts: bool) -> tuple:
+    # Dedup dentro del lote (gana la última)
+    unique = OrderedDict((tuple(r[k] for k in key), r) for r in rows)
+    native = _write_native(db, model, list(unique.values()), key, on_conflict, count_inserts)
+    if native is not None:
+        return native
+
+    # Sin restricción única / dialecto sin upsert: comprobar y luego insertar (no atómico)
+    existing = _existing_keys(db, model, list(unique), key)
+
+    new_rows = [r for k, r in unique.items() if k not in existing]
+    if new_rows:
+        db.execute(insert(model), new_rows)
+    written = inserted = len(new_rows)
+
+    if on_conflict == 'update':
+        changed = [r for k, r in unique.items() if k in existing]
+        if changed:
+            table = model.__table__
+            values = {c: bindparam(f"v_{c}") for c in changed[0] if c not in key}
+            stmt = update(table).where(*[table.c[k] == bindparam(f"k_{k}") for k in key]).values(values)
+            db.connection().execute(stmt, [
+                {**{f"k_{k}": r[k] for k in key}, **{f"v_{c}": r[c] for c in values}} for r in changed
+            ])
+            written += len(changed)
+    return written, inserted
+
+
+class ResultWriter:
+    """Writer en segundo plano: los stages encolan filas y un thread las agrupa por tabla
+    y las escribe en lotes (1 transacción por flush), solapando cómputo e I/O."""
+
+    def __init__(self, session_factory, batch_size: int = 500, flush_interval: float = 1.0):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.flushes = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def for_session(cls, db: Session, **kwargs) -> "ResultWriter":
+        """Writer sobre el mismo engine que una sesión existente"""
+        return cls(sessionmaker(bind=db.get_bind(), autoflush=False), **kwargs)
+
+    # ---------- API de productores ----------
+
+    def put(self, model, row: dict, key: Sequence[str] = (), on_conflict: str = 'ignore'):
+        self._raise_if_failed()
+        # El stage del productor (el del thread escritor sería 'main') para table_stats
+        self._queue.put((model, tuple(key), on_conflict, profiler.current_stage, row))
+
+    def flush(self):
+        """Bloquea hasta que todo lo encolado esté escrito y confirmado"""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait()
+        self._raise_if_failed()
+
+    def start(self) -> "ResultWriter":
+        self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._queue.put((_STOP, None))
+        self._thread.join()
+        self._thread = None
+        logger.info(f"🖊️ Writer: {self.written:,} filas en {self.flushes} lotes")
+        self._raise_if_failed()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------- thread escritor ----------
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError(f"ResultWriter falló: {error}") from error
+
+    def _write(self, buckets: dict, pending: int):
+        if not pending:
+            return
+        db = self.session_factory()
+        try:
+            for (model, key, on_conflict, stage), rows in buckets.items():
+                self.written += write_rows(db, model, rows, key, on_conflict, stage)
+            db.commit()
+            self.flushes += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Writer: lote de {pending} filas descartado: {e}")
+            self._error = self._error or e
+        finally:
+            db.close()
+        buckets.clear()
+
+    def _run(self):
+        buckets: "OrderedDict[tuple, list]" = OrderedDict()
+        pending = 0
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] is _FLUSH:
+                self._write(buckets, pending)
+                pending = 0
+                item[1].set()
+            elif item is not None and item[0] is _STOP:
+                self._write(buckets, pending)
+                return
+            elif item is not None:
+                model, key, on_conflict, stage, row = item
+                buckets.setdefault((model, key, on_conflict, stage), []).append(row)
+                pending += 1
+
+            if pending >= self.batch_size or time.monotonic() >= deadline:
+                self._write(buckets, pending)
+                pending = 0
+                deadline = time.monotonic() + self.flush_interval
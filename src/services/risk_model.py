@@ -0,0 +1,152 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, date
+from pathlib import Path
+from typing import Optional, Sequence
+import json
+import logging
+import os
+import shutil
+from ..core.config import settings
+from ..models.sp500 import Company
+from .market_data import load_prices
+
+logger = logging.getLogger(__name__)
+
+
+class RiskModelStore:
+    """Covarianza/volatilidad EWMA persistida (.npy memory-mappable) + snapshots diarios"""
+
+    def __init__(self, root: Optional[str] = None, halflife: float = 60.0,
+                 shrinkage: float = 0.1, rebuild_days: int = 730, max_snapshots: int = 260):
+        self.root = Path(root or settings.ARTIFACTS_DIR) / "risk_model"
+        self.decay = 0.5 ** (1.0 / halflife)
+        self.shrinkage = shrinkage
+        self.rebuild_days = rebuild_days
+        self.max_snapshots = max_snapshots
+
+    # ---------- lectura ----------
+
+    def load(self, as_of: Optional[date] = None, mmap: bool = True) -> Optional[dict]:
+        """Modelo actual o snapshot point-in-time (último <= as_of)"""
+        path = self.root / "current"
+        if as_of is not None:
+            snapshots = sorted(p.name for p in (self.root / "snapshots").glob("????-??-??")
+                               if p.name <= str(as_of))
+            if not snapshots:
+                return None
+            path = self.root / "snapshots" / snapshots[-1]
+
+        if not (path / "meta.json").exists():
+            return None
+
+        meta = json.loads((path / "meta.json").read_text())
+        mode = 'r' if mmap else None
+        cov = np.load(path / "cov.npy", mmap_mode=mode)
+        return {
+            'company_ids': np.asarray(meta['company_ids']),
+            'as_of': date.fromisoformat(meta['as_of']),
+            'n_obs': meta['n_obs'],
+            'cov': cov,
+            'vol': np.sqrt(np.diag(cov) * 252),
+            'last_close': np.load(path / "last_close.npy", mmap_mode=mode),
+        }
+
+    def covariance(self, company_ids: Sequence[int], as_of: Optional[date] = None,
+                   annualize: bool = True) -> Optional[np.ndarray]:
+        """Submatriz (con shrinkage a la diagonal) para las empresas pedidas; None si falta alguna"""
+        model = self.load(as_of)
+        if model is None:
+            return None
+        position = {cid: i for i, cid in enumerate(model['company_ids'].tolist())}
+        if any(cid not in position for cid in company_ids):
+            return None
+
+        idx = np.array([position[cid] for cid in company_ids])
+        cov = np.asarray(model['cov'][np.ix_(idx, idx)], dtype=np.float64)
+        cov = (1 - self.shrinkage) * cov + self.shrinkage * np.diag(np.diag(cov))
+        return cov * 252 if annualize else cov
+
+    # ---------- escritura ----------
+
+    def _write(self, path: Path, company_ids, cov, last_close, as_of: date, n_obs: int, dtype=np.float64):
+        """Escritura atómica: directorio temporal + rename"""
+        tmp = path.with_name(path.name + ".tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "cov.npy", np.asarray(cov, dtype=dtype))
+        np.save(tmp / "last_close.npy", np.asarray(last_close, dtype=np.float64))
+        (tmp / "meta.json").write_text(json.dumps({
+            'company_ids': [int(c) for c in company_ids],
+            'as_of': str(as_of),
+            'n_obs': int(n_obs),
+            'decay': self.decay,
+        }))
+        old = path.with_name(path.name + ".old")
+        if path.exists():
+            os.replace(path, old)
+        os.replace(tmp, path)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _save(self, company_ids, cov, last_close, as_of: date, n_obs: int):
+        self._write(self.root / "current", company_ids, cov, last_close, as_of, n_obs)
+        (self.root / "snapshots").mkdir(parents=True, exist_ok=True)
+        self._write(self.root / "snapshots" / str(as_of), company_ids, cov, last_close, as_of, n_obs,
+                    dtype=np.float32)
+
+        snapshots = sorted((self.root / "snapshots").glob("????-??-??"))
+        for old in snapshots[:-self.max_snapshots]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def rebuild(self, db: Session) -> Optional[dict]:
+        """Reconstrucción completa desde prices_daily (una matmul ponderada)"""
+        company_ids = [row[0] for row in db.query(Company.id).filter(Company.is_active == True).all()]
+        start_date = datetime.now().date() - timedelta(days=self.rebuild_days)
+        df_prices = load_prices(db, company_ids, start_date)
+        if df_prices.empty:
+            logger.warning("⚠️ Risk model: sin precios")
+            return None
+
+        closes = df_prices.pivot_table(index='price_date', columns='company_id', values='close').sort_index()
+        returns = closes.pct_change(fill_method=None).iloc[1:].fillna(0.0).to_numpy()
+        n_obs = len(returns)
+        weights = (1 - self.decay) * self.decay ** np.arange(n_obs - 1, -1, -1)
+        cov = (returns * weights[:, None]).T @ returns
+
+        last_close = closes.ffill().iloc[-1].to_numpy()
+        as_of = closes.index[-1]
+        self._save(closes.columns.to_numpy(), cov, last_close, as_of, n_obs)
+        logger.info(f"🧮 Risk model reconstruido: {closes.shape[1]} empresas, {n_obs} días (as of {as_of})")
+        return self.load()
+
+    def update(self, db: Session) -> Optional[dict]:
+        """Actualiza con los días nuevos: Σ = λΣ + (1-λ) r rᵀ por día (O(N²))"""
+        model = self.load(mmap=False)
+        active = {row[0] for row in db.query(Company.id).filter(Company.is_active == True).all()}
+        if model is None or not active.issubset(set(model['company_ids'].tolist())):
+            return self.rebuild(db)
+
+        company_ids = model['company_ids']
+        df_prices = load_prices(db, company_ids.tolist(), model['as_of'] + timedelta(days=1))
+        if df_prices.empty:
+            logger.info(f"🧮 Risk model al día ({model['as_of']})")
+            return model
+
+        closes = df_prices.pivot_table(index='price_date', columns='company_id', values='close')
+        closes = closes.reindex(columns=company_ids).sort_index()
+
+        cov = np.array(model['cov'], dtype=np.float64)
+        last_close = np.array(model['last_close'], dtype=np.float64)
+        n_obs = model['n_obs']
+        for price_date, row in closes.iterrows():
+            close = row.to_numpy()
+            r = np.nan_to_num(close / last_close - 1)
+            cov *= self.decay
+            cov += (1 - self.decay) * np.outer(r, r)
+            last_close = np.where(np.isnan(close), last_close, close)
+            n_obs += 1
+            self._save(company_ids, cov, last_close, price_date, n_obs)
+
+        logger.info(f"🧮 Risk model actualizado: +{len(closes)} días (as of {closes.index[-1]})")
+        return self.load()
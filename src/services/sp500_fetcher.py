@@ -7,9 +7,13 @@ from io import StringIO
 import logging
 import time
 from datetime import datetime, timedelta
+from ..core.instrumentation import profiler
 
 logger = logging.getLogger(__name__)
 
+# Ventana máxima que sirve Yahoo por intervalo intradía
+INTRADAY_MAX_DAYS = {'1m': 7, '2m': 60, '5m': 60, '15m': 60, '30m': 60, '60m': 730}
+
 class MultiSourceFetcher:
     def __init__(self):
         self.session = requests.Session()
@@ -22,7 +26,9 @@ class MultiSourceFetcher:
         """Lista S&P500 (Wikipedia estable)"""
         url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
         try:
+            started = time.perf_counter()
             response = self.session.get(url, timeout=15)
+            profiler.record_http('wikipedia', time.perf_counter() - started, response.ok)
             df = pd.read_html(StringIO(response.text))[0]
             df = df[['Symbol', 'Security', 'GICS Sector', 'GICS Sub-Industry']]
             df.columns = ['ticker', 'name', 'sector', 'industry']
@@ -52,18 +58,19 @@ class MultiSourceFetcher:
         for ticker in tickers:
             data = None
             
-            for source in sources:
-                try:
-                    data = self._fetch_source(ticker, source, days_back)
-                    if data is not None and not data.empty:
-                        result[ticker] = data
-                        logger.info(f"✅ {ticker}: {len(data)} días [{source.upper()}]")
-                        self.source_success[source] = self.source_success.get(source, 0) + 1
-                        time.sleep(0.1)
-                        break
-                except Exception as e:
-                    logger.debug(f"⚠️ {ticker} [{source}]: {str(e)[:30]}")
-                    continue
+            with profiler.ticker(ticker):
+                for source in sources:
+                    try:
+                        data = self._fetch_source(ticker, source, days_back)
+                        if data is not None and not data.empty:
+                            result[ticker] = data
+                            logger.info(f"✅ {ticker}: {len(data)} días [{source.upper()}]")
+                            self.source_success[source] = self.source_success.get(source, 0) + 1
+                            time.sleep(0.1)
+                            break
+                    except Exception as e:
+                        logger.debug(f"⚠️ {ticker} [{source}]: {str(e)[:30]}")
+                        continue
             
             if ticker not in result:
                 logger.warning(f"❌ {ticker}: Todas las fuentes fallaron")
@@ -71,17 +78,60 @@ class MultiSourceFetcher:
         logger.info(f"📊 Fuentes exitosas: {self.source_success}")
         return result
 
+    def download_intraday(self, tickers: List[str], interval: str = '5m', days_back: int = 5,
+                          batch_size: int = 50) -> Dict[str, pd.DataFrame]:
+        """Barras intradía Yahoo en lotes multi-ticker (1 request por lote, no por ticker)"""
+        days = min(days_back, INTRADAY_MAX_DAYS.get(interval, 60))
+        logger.info(f"🌐 Intradía {interval}: {len(tickers)} tickers × {days} días")
+
+        result = {}
+        for start in range(0, len(tickers), batch_size):
+            batch = tickers[start:start + batch_size]
+            started = time.perf_counter()
+            data = None
+            try:
+                data = yf.download(batch, period=f"{days}d", interval=interval, group_by='ticker',
+                                   auto_adjust=True, threads=True, progress=False)
+            except Exception as e:
+                logger.warning(f"⚠️ Intradía lote {start // batch_size + 1}: {str(e)[:60]}")
+            finally:
+                profiler.record_http('yahoo_intraday', time.perf_counter() - started,
+                                     data is not None and not data.empty)
+            if data is None or data.empty:
+                continue
+
+            available = set(data.columns.get_level_values(0)) if isinstance(data.columns, pd.MultiIndex) else None
+            for ticker in batch:
+                if available is None:
+                    df = data
+                elif ticker in available:
+                    df = data[ticker]
+                else:
+                    continue
+                df = df.dropna(subset=['Close'])
+                if not df.empty:
+                    result[ticker] = df
+
+        logger.info(f"✅ Intradía: {len(result)}/{len(tickers)} tickers")
+        return result
+
     def _fetch_source(self, ticker: str, source: str, days_back: int):
-        """Fuente específica"""
-        if source == 'yahoo_single':
-            return self._yahoo_single(ticker, days_back)
-        elif source == 'polygon_free':
-            return self._polygon_free(ticker)
-        elif source == 'fmp_free':
-            return self._fmp_free(ticker)
-        elif source == 'nasdaq_csv':
-            return self._nasdaq_csv(ticker)
-        return None
+        """Fuente específica (latencia y éxito por fuente al profiler)"""
+        started = time.perf_counter()
+        data = None
+        try:
+            if source == 'yahoo_single':
+                data = self._yahoo_single(ticker, days_back)
+            elif source == 'polygon_free':
+                data = self._polygon_free(ticker)
+            elif source == 'fmp_free':
+                data = self._fmp_free(ticker)
+            elif source == 'nasdaq_csv':
+                data = self._nasdaq_csv(ticker)
+            return data
+        finally:
+            profiler.record_http(source, time.perf_counter() - started,
+                                 data is not None and not data.empty)
 
     def _yahoo_single(self, ticker: str, days_back: int) -> pd.DataFrame:
         """Yahoo Finance SINGLE ticker (estable)"""
@@ -0,0 +1,180 @@
+import pandas as pd
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import text, insert
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from itertools import product
+from typing import Optional, Sequence
+import logging
+import os
+import uuid
+from ..models.predictions import BacktestResult
+from .backtester import simulate_strategy, summarize_simulation, SIZING_RULES
+from .market_data import load_prices, load_ml_signals
+
+logger = logging.getLogger(__name__)
+
+METRICS = ['total_return', 'sharpe', 'max_drawdown', 'win_rate', 'total_trades', 'alpha']
+
+
+def _sweep_ticker(payload: tuple) -> Optional[np.ndarray]:
+    """Evalúa TODO el grid para 1 ticker -> array (lookbacks, combos, métricas)"""
+    price_days, closes, signal_days, scores, lookback_starts, grid = payload
+    buy_th, sell_th, size_fixed, size_score = grid
+    out = np.full((len(lookback_starts), len(buy_th), len(METRICS)), np.nan)
+
+    for li, start_day in enumerate(lookback_starts):
+        p_mask = price_days >= start_day
+        if p_mask.sum() < 50:
+            continue
+        window_days, window_closes = price_days[p_mask], closes[p_mask]
+
+        s_mask = signal_days >= start_day
+        pos = np.searchsorted(window_days, signal_days[s_mask])
+        pos_clipped = np.minimum(pos, len(window_days) - 1)
+        hit = window_days[pos_clipped] == signal_days[s_mask]
+        if not hit.any():
+            continue
+
+        sim = simulate_strategy(
+            window_closes[pos_clipped[hit]], scores[s_mask][hit],
+            buy_th, sell_th, size_fixed, size_score
+        )
+        metrics = summarize_simulation(sim, window_closes[-1])
+        buy_hold = (window_closes[-1] / window_closes[0] - 1) * 100
+        metrics['alpha'] = metrics['total_return'] - buy_hold
+        out[li] = np.column_stack([metrics[m] for m in METRICS])
+
+    return out
+
+
+class StrategySweep:
+    """Grid de umbrales compra/venta × lookback × sizing sobre los MISMOS datos"""
+
+    def __init__(self,
+                 buy_thresholds: Sequence[float] = (0.6, 0.65, 0.7, 0.75, 0.8),
+                 sell_thresholds: Sequence[float] = (0.2, 0.25, 0.3, 0.35, 0.4),
+                 lookbacks: Sequence[int] = (90, 180, 365),
+                 sizing_rules: Sequence[str] = ('all_in', 'half', 'score'),
+                 workers: Optional[int] = None):
+        unknown = set(sizing_rules) - set(SIZING_RULES)
+        if unknown:
+            raise ValueError(f"Sizing desconocido: {sorted(unknown)}")
+        self.buy_thresholds = list(buy_thresholds)
+        self.sell_thresholds = list(sell_thresholds)
+        self.lookbacks = sorted(lookbacks)
+        self.sizing_rules = list(sizing_rules)
+        self.workers = workers or os.cpu_count() or 1
+
+    def _grid(self):
+        """Combinaciones (sin lookback) como arrays paralelos"""
+        combos = list(product(self.buy_thresholds, self.sell_thresholds, self.sizing_rules))
+        buy_th = np.array([c[0] for c in combos])
+        sell_th = np.array([c[1] for c in combos])
+        size_fixed = np.array([SIZING_RULES[c[2]][0] for c in combos])
+        size_score = np.array([SIZING_RULES[c[2]][1] for c in combos])
+        return combos, (buy_th, sell_th, size_fixed, size_score)
+
+    def run(self, db: Session, limit: int = 500) -> pd.DataFrame:
+        """Ejecuta el sweep y guarda 1 fila por combinación en backtest_results"""
+        combos, grid = self._grid()
+        n_total = len(combos) * len(self.lookbacks)
+        logger.info(f"🧪 SWEEP: {n_total} combinaciones × hasta {limit} empresas "
+                    f"({self.workers} workers)")
+
+        company_ids = [row[0] for row in db.execute(text("""
+            SELECT c.id
+            FROM companies c
+            JOIN ml_predictions p ON c.id = p.company_id
+            WHERE c.is_active = 1
+            GROUP BY c.id
+            ORDER BY c.id
+            LIMIT :limit
+        """), {'limit': limit}).fetchall()]
+
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=max(self.lookbacks))
+        df_prices = load_prices(db, company_ids, start_date, end_date)
+        df_signals = load_ml_signals(db, company_ids, start_date, end_date).dropna(subset=['ml_score'])
+
+        epoch = np.datetime64('1970-01-01', 'D')
+        lookback_starts = np.array([
+            (np.datetime64(end_date - timedelta(days=lb), 'D') - epoch).astype(int)
+            for lb in self.lookbacks
+        ])
+        signals_by_company = dict(tuple(df_signals.groupby('company_id')))
+
+        payloads = []
+        for company_id, prices in df_prices.groupby('company_id'):
+            signals = signals_by_company.get(company_id)
+            if signals is None or len(prices) < 50:
+                continue
+            payloads.append((
+                (pd.to_datetime(prices['price_date']).values.astype('datetime64[D]') - epoch).astype(int),
+                prices['close'].to_numpy(dtype=float),
+                (pd.to_datetime(signals['signal_date']).values.astype('datetime64[D]') - epoch).astype(int),
+                signals['ml_score'].to_numpy(dtype=float),
+                lookback_starts,
+                grid,
+            ))
+
+        if not payloads:
+            logger.warning("⚠️ Sweep sin empresas con precios + señales ML")
+            return pd.DataFrame()
+
+        if self.workers > 1 and len(payloads) > 1:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                chunksize = max(1, len(payloads) // (self.workers * 4))
+                per_ticker = list(pool.map(_sweep_ticker, payloads, chunksize=chunksize))
+        else:
+            per_ticker = [_sweep_ticker(p) for p in payloads]
+
+        stacked = np.stack(per_ticker)
+        n_tickers = np.sum(~np.isnan(stacked[..., 0]), axis=0)
+        means = np.nansum(stacked, axis=0) / np.maximum(n_tickers, 1)[..., None]
+
+        sweep_id = uuid.uuid4().hex[:12]
+        rows, records = [], []
+        for li, lookback in enumerate(self.lookbacks):
+            for ci, (buy, sell, sizing) in enumerate(combos):
+                if n_tickers[li, ci] == 0:
+                    continue
+                m = dict(zip(METRICS, means[li, ci]))
+                params = {
+                    'sweep_id': sweep_id,
+                    'buy_threshold': buy,
+                    'sell_threshold': sell,
+                    'lookback': lookback,
+                    'sizing': sizing,
+                    'tickers': int(n_tickers[li, ci]),
+                    'alpha': round(float(m['alpha']), 4),
+                }
+                rows.append({
+                    'strategy': 'ML_Sweep',
+                    'company_id': None,
+                    'start_date': end_date - timedelta(days=lookback),
+                    'end_date': end_date,
+                    'total_return': float(m['total_return']),
+                    'sharpe_ratio': float(m['sharpe']),
+                    'max_drawdown': float(m['max_drawdown']),
+                    'win_rate': float(m['win_rate']),
+                    'total_trades': int(round(m['total_trades'] * n_tickers[li, ci])),
+                    'params': params,
+                })
+                records.append({**params, **m})
+
+        db.execute(insert(BacktestResult), rows)
+        db.commit()
+
+        df_summary = pd.DataFrame(records).sort_values('sharpe', ascending=False)
+        logger.info("\n" + "="*60)
+        logger.info(f"🧪 SWEEP {sweep_id}: {len(rows)} combinaciones | {len(payloads)} empresas")
+        logger.info("="*60)
+        for _, r in df_summary.head(5).iterrows():
+            logger.info(f"   🏆 buy>{r['buy_threshold']:.2f} sell<{r['sell_threshold']:.2f} "
+                        f"{r['lookback']}d {r['sizing']:6} | Ret:{r['total_return']:+.1f}% "
+                        f"Alpha:{r['alpha']:+.1f}% Sharpe:{r['sharpe']:.2f}")
+        logger.info("="*60)
+
+        return df_summary
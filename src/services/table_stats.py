@@ -0,0 +1,170 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import date, datetime
+from typing import Dict, Optional, Sequence
+import logging
+import time
+from ..core.instrumentation import profiler
+from ..models.pipeline import TableStat
+
+logger = logging.getLogger(__name__)
+
+# tabla -> columna de fecha (None: solo recuento)
+TRACKED = {
+    'companies': None,
+    'prices_daily': 'price_date',
+    'technical_indicators': 'indicator_date',
+    'trading_signals': 'signal_date',
+    'ml_predictions': 'prediction_date',
+}
+TOTAL = 0  # company_id de la fila agregada de cada tabla
+
+# Contención: todo writer de una tabla seguida actualiza su fila agregada (tabla, 0) dentro
+# de su transacción. Con N workers de la cola (user-043) ingiriendo a la vez, esa fila se
+# serializa: cada uno espera el commit del anterior (transacciones cortas, 1 por ticker).
+# Si llegara a notarse, agrupar más tickers por transacción reduce las esperas.
+
+_ACCUMULATE = text("""
+    UPDATE table_stats SET
+        row_count = row_count + :delta,
+        min_date = CASE WHEN min_date IS NULL OR :min_date < min_date THEN :min_date ELSE min_date END,
+        max_date = CASE WHEN max_date IS NULL OR :max_date > max_date THEN :max_date ELSE max_date END,
+        last_stage = :stage,
+        updated_at = :now
+    WHERE table_name = :table_name AND company_id = :company_id
+""")
+
+
+def _as_date(value):
+    if isinstance(value, str):  # SQLite devuelve texto en consultas text()
+        return date.fromisoformat(value[:10])
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _ensure(db: Session, table_name: str, company_ids: Sequence[int]) -> bool:
+    """Crea las filas que falten -> True si la agregada era nueva y se sembró con un recuento
+    exacto (ya incluye lo escrito en esta transacción: no hay que sumar el delta)"""
+    from .result_writer import write_rows
+    created = write_rows(db, TableStat, [
+        {'table_name': table_name, 'company_id': TOTAL, 'row_count': 0}
+    ], key=('table_name', 'company_id'))
+    if created:
+        # Base existente antes de table_stats: partir de 0 daría recuentos ridículos
+        _reconcile_table(db, table_name, datetime.utcnow())
+    companies = [cid for cid in company_ids if cid != TOTAL]
+    if companies:
+        write_rows(db, TableStat, [
+            {'table_name': table_name, 'company_id': cid, 'row_count': None} for cid in companies
+        ], key=('table_name', 'company_id'))
+    return bool(created)
+
+
+def record_write(db: Session, table_name: str, rows: Sequence[dict], inserted: Optional[int],
+                 stage: Optional[str] = None):
+    """Acumula un lote escrito: +insertadas en el agregado y rango de fechas por empresa
+    (todas las filas del lote existen tras la escritura). No hace commit."""
+    date_column = TRACKED[table_name]
+    bounds: Dict[int, tuple] = {}
+    if date_column:
+        for row in rows:
+            cid, day = row.get('company_id'), _as_date(row.get(date_column))
+            if cid is None or day is None:
+                continue
+            lo, hi = bounds.get(cid, (day, day))
+            bounds[cid] = (min(lo, day), max(hi, day))
+
+    common = {'table_name': table_name, 'stage': stage or profiler.current_stage, 'now': datetime.utcnow()}
+    params = [{**common, 'company_id': TOTAL, 'delta': inserted or 0,
+               'min_date': min((lo for lo, _ in bounds.values()), default=None),
+               'max_date': max((hi for _, hi in bounds.values()), default=None)}]
+    params += [{**common, 'company_id': cid, 'delta': 0, 'min_date': lo, 'max_date': hi}
+               for cid, (lo, hi) in bounds.items()]
+    if _ensure(db, table_name, [p['company_id'] for p in params]):
+        params[0]['delta'] = 0
+    db.execute(_ACCUMULATE, params)
+
+
+def record_delete(db: Session, table_name: str, deleted: int, before: Optional[date] = None,
+                  stage: Optional[str] = None):
+    """Descuenta filas borradas; con `before`, ninguna fecha mínima queda por debajo (borrado
+    por rango de fechas, p.ej. el archivo de precios). No hace commit."""
+    seeded = _ensure(db, table_name, [TOTAL])
+    db.execute(text("""
+        UPDATE table_stats SET row_count = row_count - :deleted, last_stage = :stage, updated_at = :now
+        WHERE table_name = :table_name AND company_id = :total
+    """), {'deleted': 0 if seeded else deleted, 'stage': stage or profiler.current_stage,
+           'now': datetime.utcnow(), 'table_name': table_name, 'total': TOTAL})
+    if before is not None:
+        db.execute(text("""
+            UPDATE table_stats SET min_date = :before
+            WHERE table_name = :table_name AND min_date < :before
+        """), {'before': before, 'table_name': table_name})
+
+
+def set_total(db: Session, table_name: str, row_count: int, stage: Optional[str] = None):
+    """Fija el recuento exacto del agregado (tablas pequeñas que el llamador ya cuenta). No hace commit."""
+    from .result_writer import write_rows
+    now = datetime.utcnow()
+    write_rows(db, TableStat, [{
+        'table_name': table_name, 'company_id': TOTAL, 'row_count': row_count,
+        'last_stage': stage or profiler.current_stage, 'updated_at': now, 'reconciled_at': now,
+    }], key=('table_name', 'company_id'), on_conflict='update')
+
+
+def read_stats(db: Session) -> Dict[str, dict]:
+    """Agregados por tabla en tiempo constante (lecturas por PK de table_stats). Una tabla
+    seguida sin fila agregada (nunca escrita desde la actualización) se siembra una vez."""
+    rows = db.query(TableStat).filter(
+        TableStat.table_name.in_(list(TRACKED)), TableStat.company_id == TOTAL
+    ).all()
+    missing = set(TRACKED) - {r.table_name for r in rows}
+    if missing:
+        reconcile(db, [t for t in TRACKED if t in missing])
+        return read_stats(db)
+    return {r.table_name: {
+        'rows': int(r.row_count or 0), 'min_date': r.min_date, 'max_date': r.max_date,
+        'stage': r.last_stage, 'updated_at': r.updated_at, 'reconciled_at': r.reconciled_at,
+    } for r in rows}
+
+
+def _reconcile_table(db: Session, table_name: str, now: datetime) -> int:
+    """Recuento exacto + rangos por empresa de 1 tabla (COUNT(*)/GROUP BY). No hace commit."""
+    from .result_writer import write_rows
+    date_column = TRACKED[table_name]
+    if date_column is None:
+        # companies: activas (lo que muestra el resumen)
+        total = db.execute(text("SELECT COUNT(*) FROM companies WHERE is_active = 1")).scalar()
+        per_company = []
+    else:
+        per_company = db.execute(text(f"""
+            SELECT company_id, COUNT(*), MIN({date_column}), MAX({date_column})
+            FROM {table_name} GROUP BY company_id
+        """)).fetchall()
+        total = sum(int(n) for _, n, _, _ in per_company)
+    days = [(_as_date(lo), _as_date(hi)) for _, _, lo, hi in per_company if lo is not None]
+    rows = [{
+        'table_name': table_name, 'company_id': TOTAL, 'row_count': int(total or 0),
+        'min_date': min((lo for lo, _ in days), default=None),
+        'max_date': max((hi for _, hi in days), default=None),
+        'last_stage': 'reconcile', 'updated_at': now, 'reconciled_at': now,
+    }]
+    rows += [{
+        'table_name': table_name, 'company_id': int(cid), 'row_count': None,
+        'min_date': _as_date(lo), 'max_date': _as_date(hi),
+        'last_stage': 'reconcile', 'updated_at': now, 'reconciled_at': now,
+    } for cid, _, lo, hi in per_company if cid is not None]
+    # Fuera también las empresas que ya no tienen filas
+    db.execute(text("DELETE FROM table_stats WHERE table_name = :t"), {'t': table_name})
+    write_rows(db, TableStat, rows, key=('table_name', 'company_id'), on_conflict='update')
+    return int(total or 0)
+
+
+def reconcile(db: Session, tables: Optional[Sequence[str]] = None) -> Dict[str, int]:
+    """Recalcula recuentos exactos y rangos por empresa con COUNT(*)/GROUP BY (lento: a demanda)"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    counts = {table_name: _reconcile_table(db, table_name, now) for table_name in (tables or TRACKED)}
+    db.commit()
+    logger.info(f"🧮 Estadísticas reconciliadas en {time.perf_counter() - started:.1f}s: "
+                + ", ".join(f"{t}={n:,}" for t, n in counts.items()))
+    return counts
@@ -0,0 +1,321 @@
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import text, bindparam, func
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+import logging
+import os
+import socket
+import threading
+import time
+from ..core.database import SessionLocal
+from ..core.instrumentation import profiler
+from ..models.sp500 import Company
+from ..models.pipeline import TaskJob
+from .result_writer import write_rows
+
+logger = logging.getLogger(__name__)
+
+KINDS = ['ingest', 'train', 'backtest']
+
+# Reclamable: pendiente y disponible, o en curso con lease vencido (worker caído)
+_CLAIMABLE = """
+    ((status = 'pending' AND available_at <= :now)
+     OR (status = 'running' AND lease_until < :now AND attempts < max_attempts))
+"""
+
+# Dependencias: una tarea espera mientras otra de un tipo anterior (orden de KINDS) del mismo
+# (batch, ticker) siga pendiente o en curso. Una anterior fallida definitivamente no bloquea.
+_RANK = "CASE {column} " + " ".join(f"WHEN '{kind}' THEN {rank}" for rank, kind in enumerate(KINDS)) + " END"
+_READY = f"""
+    NOT EXISTS (
+        SELECT 1 FROM task_queue dep
+        WHERE dep.batch = task_queue.batch AND dep.ticker = task_queue.ticker
+          AND dep.status IN ('pending', 'running')
+          AND {_RANK.format(column='dep.kind')} < {_RANK.format(column='task_queue.kind')}
+    )
+"""
+
+
+class TaskQueue:
+    """Cola de tareas sobre la BD compartida: N workers en N hosts reclaman por lease.
+
+    MySQL: SELECT ... FOR UPDATE SKIP LOCKED (sin contención entre workers). Otros
+    dialectos: compare-and-swap (UPDATE ... WHERE id AND sigue reclamable). El lease se
+    renueva con heartbeats; si vence, la tarea vuelve a ser reclamable (reintento).
+    Los tiempos son UTC del host: los workers deben tener el reloj sincronizado (NTP).
+    """
+
+    def __init__(self, session_factory=SessionLocal, lease_seconds: int = 300, backoff_s: float = 30.0):
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds
+        self.backoff_s = backoff_s
+
+    @classmethod
+    def for_session(cls, db: Session, **kwargs) -> "TaskQueue":
+        return cls(sessionmaker(bind=db.get_bind(), autoflush=False), **kwargs)
+
+    # ---------- productor ----------
+
+    def enqueue(self, kind: str, tickers: Sequence[str], batch: Optional[str] = None,
+                payload: Optional[dict] = None, priority: int = 0, max_attempts: int = 3) -> int:
+        """Encola 1 tarea por ticker (idempotente por (batch, kind, ticker)) -> nº nuevas"""
+        if kind not in KINDS:
+            raise ValueError(f"Tipo de tarea desconocido: {kind} ({', '.join(KINDS)})")
+        batch = batch or datetime.utcnow().strftime('%Y-%m-%d')
+        now = datetime.utcnow()
+        rows = [{'batch': batch, 'kind': kind, 'ticker': ticker, 'payload': payload or {},
+                 'status': 'pending', 'priority': priority, 'attempts': 0,
+                 'max_attempts': max_attempts, 'available_at': now, 'created_at': now,
+                 'updated_at': now} for ticker in tickers]
+        db = self.session_factory()
+        try:
+            created = write_rows(db, TaskJob, rows, key=('batch', 'kind', 'ticker'))
+            db.commit()
+        finally:
+            db.close()
+        logger.info(f"📥 Cola [{batch}] {kind}: {created} tareas nuevas ({len(rows) - created} ya existían)")
+        return created
+
+    # ---------- worker ----------
+
+    def claim(self, worker_id: str, kinds: Optional[Sequence[str]] = None, limit: int = 1) -> List[dict]:
+        """Reclama hasta `limit` tareas (lease de lease_seconds) -> filas reclamadas"""
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=self.lease_seconds)
+        kind_filter = "AND kind IN :kinds" if kinds else ""
+        params = {'now': now, 'limit': limit, **({'kinds': list(kinds)} if kinds else {})}
+
+        db = self.session_factory()
+        try:
+            self._expire(db, now)
+            skip_locked = db.get_bind().dialect.name == 'mysql'
+            select = text(f"""
+                SELECT id FROM task_queue
+                WHERE {_CLAIMABLE} AND {_READY} {kind_filter}
+                ORDER BY priority DESC, id
+                LIMIT :limit {'FOR UPDATE SKIP LOCKED' if skip_locked else ''}
+            """)
+            if kinds:
+                select = select.bindparams(bindparam('kinds', expanding=True))
+            candidates = [row[0] for row in db.execute(select, params)]
+
+            claimed = []
+            # Sin _READY en el UPDATE (MySQL no admite subconsulta sobre la tabla actualizada):
+            # una dependencia no vuelve a pendiente salvo reintento, que ya estaba en curso
+            update = text(f"""
+                UPDATE task_queue
+                SET status = 'running', worker_id = :worker_id, lease_until = :lease_until,
+                    attempts = attempts + 1, updated_at = :now
+                WHERE id = :id AND {_CLAIMABLE}
+            """)
+            for task_id in candidates:
+                # Con SKIP LOCKED la fila ya es nuestra; sin él, rowcount=0 si otro worker ganó
+                if db.execute(update, {'id': task_id, 'worker_id': worker_id,
+                                       'lease_until': lease_until, 'now': now}).rowcount == 1:
+                    claimed.append(task_id)
+            db.commit()
+            if not claimed:
+                return []
+            rows = db.query(TaskJob.id, TaskJob.kind, TaskJob.ticker, TaskJob.payload,
+                            TaskJob.attempts, TaskJob.batch).filter(TaskJob.id.in_(claimed)).all()
+            return [row._asdict() for row in rows]
+        finally:
+            db.close()
+
+    def _expire(self, db: Session, now: datetime):
+        """Lease vencido y sin reintentos -> failed (si no, queda reclamable)"""
+        expired = db.execute(text("""
+            UPDATE task_queue
+            SET status = 'failed', last_error = 'lease expirado', updated_at = :now
+            WHERE status = 'running' AND lease_until < :now AND attempts >= max_attempts
+        """), {'now': now}).rowcount
+        if expired:
+            logger.warning(f"⚠️ Cola: {expired} tareas sin reintentos tras lease vencido")
+
+    def heartbeat(self, task_ids: Sequence[int], worker_id: str) -> int:
+        """Renueva el lease de las tareas propias -> nº renovadas (0 = lease perdido)"""
+        if not task_ids:
+            return 0
+        db = self.session_factory()
+        try:
+            now = datetime.utcnow()
+            renewed = db.execute(text("""
+                UPDATE task_queue SET lease_until = :lease_until, updated_at = :now
+                WHERE id IN :ids AND worker_id = :worker_id AND status = 'running'
+            """).bindparams(bindparam('ids', expanding=True)), {
+                'ids': list(task_ids), 'worker_id': worker_id, 'now': now,
+                'lease_until': now + timedelta(seconds=self.lease_seconds),
+            }).rowcount
+            db.commit()
+            return renewed
+        finally:
+            db.close()
+
+    def complete(self, task_id: int, worker_id: str, duration_s: float) -> bool:
+        return self._finish(task_id, worker_id, "status = 'done', last_error = NULL, duration_s = :duration",
+                            {'duration': duration_s})
+
+    def fail(self, task_id: int, worker_id: str, attempts: int, max_attempts: int, error: str) -> bool:
+        """Reintento con backoff exponencial; agotados los intentos -> failed"""
+        if attempts >= max_attempts:
+            return self._finish(task_id, worker_id, "status = 'failed', last_error = :error",
+                                {'error': error[:255]})
+        available_at = datetime.utcnow() + timedelta(seconds=self.backoff_s * 2 ** (attempts - 1))
+        return self._finish(task_id, worker_id,
+                            "status = 'pending', last_error = :error, available_at = :available_at",
+                            {'error': error[:255], 'available_at': available_at})
+
+    def _finish(self, task_id: int, worker_id: str, assignments: str, params: dict) -> bool:
+        """Solo el dueño del lease puede cerrar la tarea (un worker 'resucitado' no pisa el reintento)"""
+        db = self.session_factory()
+        try:
+            done = db.execute(text(f"""
+                UPDATE task_queue SET {assignments}, lease_until = NULL, updated_at = :now
+                WHERE id = :id AND worker_id = :worker_id AND status = 'running'
+            """), {'id': task_id, 'worker_id': worker_id, 'now': datetime.utcnow(), **params}).rowcount
+            db.commit()
+            return done == 1
+        finally:
+            db.close()
+
+    def outstanding(self, kinds: Optional[Sequence[str]] = None) -> int:
+        """Tareas aún por terminar (pendientes, en backoff o en curso) de esos tipos"""
+        db = self.session_factory()
+        try:
+            query = db.query(func.count(TaskJob.id)).filter(TaskJob.status.in_(['pending', 'running']))
+            if kinds:
+                query = query.filter(TaskJob.kind.in_(list(kinds)))
+            return query.scalar() or 0
+        finally:
+            db.close()
+
+    def stats(self, batch: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """{kind: {status: n}}"""
+        db = self.session_factory()
+        try:
+            query = db.query(TaskJob.kind, TaskJob.status, func.count(TaskJob.id))
+            if batch:
+                query = query.filter(TaskJob.batch == batch)
+            result: Dict[str, Dict[str, int]] = {}
+            for kind, status, count in query.group_by(TaskJob.kind, TaskJob.status).all():
+                result.setdefault(kind, {})[status] = count
+            return result
+        finally:
+            db.close()
+
+
+class TaskWorker:
+    """Worker de la cola: reclama, ejecuta el handler por tipo y renueva el lease en
+    segundo plano mientras la tarea corre. Mantiene modelos/conexiones calientes."""
+
+    def __init__(self, queue: Optional[TaskQueue] = None, worker_id: Optional[str] = None,
+                 kinds: Optional[Sequence[str]] = None, poll_seconds: float = 5.0,
+                 session_factory=SessionLocal):
+        self.queue = queue or TaskQueue(session_factory)
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.kinds = list(kinds or KINDS)
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self.processed = 0
+        self.failed = 0
+        self._current: List[int] = []
+        self._stop = threading.Event()
+        self._predictor = None
+        self._backtester = None
+        self.handlers: Dict[str, Callable[[Session, int, dict], object]] = {
+            'ingest': self._ingest,
+            'train': self._train,
+            'backtest': self._backtest,
+        }
+
+    # ---------- handlers (1 ticker por tarea) ----------
+
+    def _ingest(self, db: Session, company_id: int, task: dict):
+        from .data_loader import SP500DataLoader
+        loader = SP500DataLoader(db)
+        days_back = (task['payload'] or {}).get('days_back', 7)
+        data = loader.fetcher.download_historical_data([task['ticker']], days_back=days_back)
+        if task['ticker'] not in data:
+            raise RuntimeError("sin datos en ninguna fuente")
+        inserted = loader._insert_new_prices(company_id, data[task['ticker']])
+        db.commit()
+        return inserted
+
+    def _train(self, db: Session, company_id: int, task: dict):
+        if self._predictor is None:
+            from .ml_predictor import MLPredictor
+            self._predictor = MLPredictor()
+        self._predictor.train_predict(db, company_id)
+        # Modelo compilado al día para score_compiled (sin corrector online: el siguiente
+        # update_online detecta la base nueva y reentrena con su referencia)
+        self._predictor.export_compiled(company_ids=[company_id])
+
+    def _backtest(self, db: Session, company_id: int, task: dict):
+        if self._backtester is None:
+            from .backtester import Backtester
+            self._backtester = Backtester()
+        days_back = (task['payload'] or {}).get('days_back', 365)
+        return self._backtester.run_single_stock(db, company_id, days_back=days_back)
+
+    # ---------- bucle ----------
+
+    def _heartbeat_loop(self):
+        interval = max(self.queue.lease_seconds / 3, 1)
+        while not self._stop.wait(interval):
+            current = list(self._current)
+            if current and self.queue.heartbeat(current, self.worker_id) < len(current):
+                logger.warning(f"⚠️ {self.worker_id}: lease perdido en {current}")
+
+    def _execute(self, task: dict):
+        started = time.perf_counter()
+        db = self.session_factory()
+        try:
+            company_id = db.query(Company.id).filter(Company.ticker == task['ticker']).scalar()
+            if company_id is None:
+                raise RuntimeError(f"ticker desconocido: {task['ticker']}")
+            with profiler.ticker(task['ticker']), profiler.stage(task['kind']):
+                self.handlers[task['kind']](db, company_id, task)
+            elapsed = time.perf_counter() - started
+            if not self.queue.complete(task['id'], self.worker_id, round(elapsed, 3)):
+                logger.warning(f"⚠️ {task['kind']} {task['ticker']}: lease perdido, resultado no confirmado")
+            self.processed += 1
+            logger.info(f"✅ {task['kind']} {task['ticker']} en {elapsed:.1f}s (intento {task['attempts']})")
+        except Exception as e:
+            db.rollback()
+            self.failed += 1
+            max_attempts = db.query(TaskJob.max_attempts).filter(TaskJob.id == task['id']).scalar() or 1
+            self.queue.fail(task['id'], self.worker_id, task['attempts'], max_attempts, str(e))
+            logger.error(f"❌ {task['kind']} {task['ticker']} (intento {task['attempts']}/{max_attempts}): {e}")
+        finally:
+            db.close()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, max_tasks: Optional[int] = None, drain: bool = False) -> dict:
+        """Procesa tareas hasta stop(), max_tasks, o cola vacía si drain=True (nada pendiente
+        ni en curso: espera reintentos en backoff y tareas bloqueadas por dependencias)"""
+        logger.info(f"👷 Worker {self.worker_id} ({', '.join(self.kinds)})")
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="task-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                if max_tasks is not None and self.processed + self.failed >= max_tasks:
+                    break
+                tasks = self.queue.claim(self.worker_id, self.kinds)
+                if not tasks:
+                    if drain and not self.queue.outstanding(self.kinds):
+                        break
+                    self._stop.wait(self.poll_seconds)
+                    continue
+                for task in tasks:
+                    self._current = [task['id']]
+                    self._execute(task)
+                    self._current = []
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._stop.set()
+            heartbeat.join()
+        logger.info(f"👷 Worker {self.worker_id}: {self.processed} OK, {self.failed} fallidas")
+        return {'processed': self.processed, 'failed': self.failed}